@@ -0,0 +1,216 @@
+import os
+import math
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Callable
+from contextlib import AbstractAsyncContextManager, asynccontextmanager, nullcontext
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_RUNNING = 16
+DEFAULT_MAX_QUEUE = 32
+DEFAULT_QUEUE_TIMEOUT = 30.0  # seconds
+DEFAULT_MAX_CONVERSATION_QUEUE = 1
+# Retry-After estimate used until a turn has finished.
+DEFAULT_TURN_SECONDS = 10.0
+MAX_RETRY_AFTER = 300
+RECENT_SAMPLES = 1000
+
+
+class Overloaded(Exception):
+    """
+    Raised when a turn is not admitted.
+    `status_code` is 429 when the conversation already has turns queued, and 503 when the server is at capacity.
+    `retry_after` is the suggested wait in seconds.
+    """
+
+    def __init__(self, detail: str, status_code: int, retry_after: int):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class AdmissionController:
+    """
+    Serializes agent runs per conversation and bounds them across conversations.
+    - Turns of one conversation run one at a time, in arrival order, behind the team's `turn_lock`.
+      At most `max_conversation_queue` turns may wait behind the running one; more are rejected with 429.
+    - At most `max_running` turns run at once. Up to `max_queue` more wait for a slot, for at most
+      `queue_timeout` seconds; turns beyond that are rejected with 503.
+    - Rejections are immediate and carry a Retry-After estimated from recent turn durations.
+    - Background model calls (see `background`) take a run slot only if one is free.
+    - The time each turn waited before running is recorded and summarized in `stats`.
+    """
+
+    def __init__(
+        self,
+        max_running: int = DEFAULT_MAX_RUNNING,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        queue_timeout: float = DEFAULT_QUEUE_TIMEOUT,
+        max_conversation_queue: int = DEFAULT_MAX_CONVERSATION_QUEUE,
+    ):
+        self.max_running = max_running
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_conversation_queue = max_conversation_queue
+        self._slots: asyncio.Semaphore | None = None
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_conversation = 0
+        self.rejected_capacity = 0
+        self.timed_out = 0
+        self.background_admitted = 0
+        self.rejected_background = 0
+        self._waits: deque[float] = deque(maxlen=RECENT_SAMPLES)
+        self._durations: deque[float] = deque(maxlen=RECENT_SAMPLES)
+        self.wait_time_total = 0.0
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_running)
+        return self._slots
+
+    def _turn_seconds(self) -> float:
+        return sum(self._durations) / len(self._durations) if self._durations else DEFAULT_TURN_SECONDS
+
+    def _retry_after(self, turns_ahead: int, parallelism: int) -> int:
+        seconds = self._turn_seconds() * math.ceil(max(1, turns_ahead) / max(1, parallelism))
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(seconds)))
+
+    def check(self, teacher=None) -> None:
+        """Raises Overloaded if a turn for `teacher` (or for a new conversation) would be rejected now."""
+        if teacher is not None and teacher.pending_turns > self.max_conversation_queue:
+            self.rejected_conversation += 1
+            logger.info("Rejected a turn for conversation %s: %d turns pending.", teacher.get_team_id(), teacher.pending_turns)
+            raise Overloaded(
+                "This conversation already has a message in progress; wait for its reply.",
+                429,
+                self._retry_after(teacher.pending_turns, 1),
+            )
+        # Waiting turns count as soon as they queue, so that simultaneous arrivals cannot all pass the check.
+        if self.running + self.waiting >= self.max_running + self.max_queue:
+            self.rejected_capacity += 1
+            logger.warning("Rejected a turn: %d turns running and %d queued.", self.running, self.waiting)
+            raise Overloaded(
+                "The server is at capacity; try again shortly.",
+                503,
+                self._retry_after(self.waiting + 1, self.max_running),
+            )
+
+    @asynccontextmanager
+    async def turn(self, teacher, claim: Callable[[], AbstractAsyncContextManager] | None = None):
+        """
+        Holds the team's turn lock and a global run slot for the duration of the `async with` block.
+        `claim` is entered once the turn lock is held and before a slot is taken, e.g. to take the
+        conversation's lease (see `leases.hold_lease`): a turn waiting on it does not hold a slot meanwhile.
+        """
+        self.check(teacher)
+        arrived = time.monotonic()
+        teacher.pending_turns += 1
+        try:
+            async with teacher.turn_lock, claim() if claim is not None else nullcontext():
+                slots = self._get_slots()
+                self.waiting += 1
+                try:
+                    await asyncio.wait_for(slots.acquire(), self.queue_timeout)
+                except asyncio.TimeoutError:
+                    self.timed_out += 1
+                    logger.warning("A turn for conversation %s timed out in the queue.", teacher.get_team_id())
+                    raise Overloaded(
+                        f"No capacity to run the turn within {self.queue_timeout:g} seconds; try again shortly.",
+                        503,
+                        self._retry_after(self.waiting, self.max_running),
+                    )
+                finally:
+                    self.waiting -= 1
+
+                started = time.monotonic()
+                self.running += 1
+                self.admitted += 1
+                self._waits.append(started - arrived)
+                self.wait_time_total += started - arrived
+                try:
+                    yield
+                finally:
+                    self.running -= 1
+                    self._durations.append(time.monotonic() - started)
+                    slots.release()
+        finally:
+            teacher.pending_turns -= 1
+
+    @asynccontextmanager
+    async def background(self):
+        """
+        Holds a global run slot for background model calls that no request waits on, such as speculative quizzes,
+        so that they count against `max_running`. Raises Overloaded at once if no slot is free: background work
+        never queues, so it cannot delay turns, nor hold up a turn that is waiting for its result.
+        """
+        slots = self._get_slots()
+        if slots.locked():
+            self.rejected_background += 1
+            raise Overloaded("No run slot is free for background work.", 503, self._retry_after(1, self.max_running))
+        # A free slot is taken without suspending.
+        await slots.acquire()
+        self.running += 1
+        self.background_admitted += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            slots.release()
+
+    def stats(self) -> dict:
+        waits = list(self._waits)
+        return {
+            "max_running": self.max_running,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected_conversation": self.rejected_conversation,
+            "rejected_capacity": self.rejected_capacity,
+            "timed_out": self.timed_out,
+            "background_admitted": self.background_admitted,
+            "rejected_background": self.rejected_background,
+            "queue_wait_total_s": round(self.wait_time_total, 3),
+            "queue_wait_p50_ms": round(_percentile(waits, 0.5) * 1000, 3),
+            "queue_wait_p95_ms": round(_percentile(waits, 0.95) * 1000, 3),
+            "queue_wait_p99_ms": round(_percentile(waits, 0.99) * 1000, 3),
+            "queue_wait_max_ms": round(max(waits, default=0.0) * 1000, 3),
+            "avg_turn_s": round(self._turn_seconds(), 3) if self._durations else None,
+        }
+
+
+_admission_controller = None
+_admission_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """
+    Returns the process-wide admission controller configured by ADMISSION_MAX_RUNNING, ADMISSION_MAX_QUEUE,
+    ADMISSION_QUEUE_TIMEOUT and ADMISSION_MAX_CONVERSATION_QUEUE.
+    """
+    global _admission_controller
+    with _admission_controller_lock:
+        if _admission_controller is None:
+            _admission_controller = AdmissionController(
+                max_running=int(os.getenv("ADMISSION_MAX_RUNNING") or DEFAULT_MAX_RUNNING),
+                max_queue=int(os.getenv("ADMISSION_MAX_QUEUE") or DEFAULT_MAX_QUEUE),
+                queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT") or DEFAULT_QUEUE_TIMEOUT),
+                max_conversation_queue=int(
+                    os.getenv("ADMISSION_MAX_CONVERSATION_QUEUE") or DEFAULT_MAX_CONVERSATION_QUEUE
+                ),
+            )
+        return _admission_controller
@@ -0,0 +1,193 @@
+from dataclasses import dataclass, field
+from functools import cached_property
+
+from pydantic import PrivateAttr
+from autogen_core.model_context import ChatCompletionContext
+from autogen_core.models import ChatCompletionClient
+from autogen_core.tools import FunctionTool, Tool, ToolSchema
+from autogen_agentchat.agents import AssistantAgent
+from autogen_agentchat.base import Handoff
+
+
+class PrebuiltHandoff(Handoff):
+    """Handoff whose tool is built once and shared by every agent created from the same template."""
+
+    _tool: Tool | None = PrivateAttr(default=None)
+
+    @property
+    def handoff_tool(self) -> Tool:
+        if self._tool is None:
+            self._tool = super().handoff_tool
+        return self._tool
+
+
+class PrebuiltFunctionTool(FunctionTool):
+    """
+    Function tool shared by all teams. Its schema is built once, because AssistantAgent's
+    isinstance checks against the Tool protocol read it on every agent construction.
+    """
+
+    @cached_property
+    def schema(self) -> ToolSchema:
+        return super().schema
+
+
+@dataclass(frozen=True)
+class AgentTemplate:
+    """
+    Configuration of one teaching agent, built once per process.
+    - `build` creates a fresh AssistantAgent (with its own message history) for a team.
+    - The system prompt and the handoff tools are shared by all agents built from the template.
+    """
+    name: str
+    system_message: str
+    handoff_targets: tuple[str, ...]
+    tools: tuple[Tool, ...] = field(default=())
+    reflect_on_tool_use: bool = False
+
+    @cached_property
+    def handoffs(self) -> list[PrebuiltHandoff]:
+        return [PrebuiltHandoff(target=target) for target in self.handoff_targets]
+
+    def build(
+        self,
+        model_client: ChatCompletionClient,
+        tools: list[Tool] | None = None,
+        model_context: ChatCompletionContext | None = None,
+        agent_class: type[AssistantAgent] = AssistantAgent,
+    ) -> AssistantAgent:
+        return agent_class(
+            name=self.name,
+            handoffs=self.handoffs,
+            model_client=model_client,
+            tools=list(self.tools) + (tools or []),
+            model_context=model_context,
+            system_message=self.system_message,
+            reflect_on_tool_use=self.reflect_on_tool_use,
+        )
+
+
+MASTER_AGENT_PROMPT = """
+You are a master teacher agent responsible for initiating the learning session.
+Greet the user warmly and explain that you can help them learn a new skill or topic.
+Ask the user to provide a URL that links to content they wish to learn from, then Handoff to user.
+If the user provides a URL, immediately handoff to 'web_scraping_agent' for further processing.
+If the user asks a question or deviates from the URL input, politely steer them back to providing the URL and handoff to user.
+"""
+
+WEB_SCRAPING_AGENT_PROMPT = """
+You are a web scraping agent.
+Your task is to extract the main textual content from the URL provided by the user.
+Do not provide any analysis or commentary. Simply fetch the raw text as accurately as possible.
+Provide the scraped raw content, then handoff to '{next_agent}'.
+If the URL is invalid or the content cannot be scraped, communicate the error clearly and send TERMINATE to end the session.
+"""
+
+DATA_CLEANING_AGENT_PROMPT = """
+You are a data cleaning agent.
+Your responsibility is to process the raw content received from the web scraping agent.
+Remove unnecessary details including ads, irrelevant links, button texts, and other non-educational content.
+Ensure the remaining text is concise, clear, and focused on providing educational value.
+After cleaning the data, handoff to the 'course_outline_agent'.
+"""
+
+COURSE_OUTLINE_AGENT_PROMPT = """
+You are a Course Outline Agent with extensive experience in instructional design. Your primary task is to develop a comprehensive and logically structured course outline based on the cleaned content provided by the Data Cleaning Agent. Ensure that the outline aligns with the user's learning objectives and incorporates their feedback.
+
+Responsibilities:
+- Create clear chapters and subchapters to guide the learning process.
+- For long documents you receive numbered section summaries instead of the full text. Merge them into one coherent outline rather than one chapter per section.
+- Present the course outline to the user whenever it is created or updated, and request their feedback.
+
+Handoff Protocol:
+- After presenting the created or updated course outline, ask the user if they require any changes, then handoff to user.
+- If the user is satisfied with the course outline, handoff to the 'Topic Explainer' agent.
+
+Always handoff to single agent at a time. Always respond first before handing off to user or any other agent.
+"""
+
+TOPIC_EXPLAINER_AGENT_PROMPT = """
+You are a Topic Explainer Agent with a talent for simplifying complex ideas. Your primary task is to explain each part of the course outline provided by the Course Outline Agent in a clear, structured, and engaging manner.
+
+Responsibilities:
+- Before explaining a chapter, call the 'search_course_material' tool with the chapter title and base your explanation on the passages it returns.
+- Break down each topic into step-by-step explanations.
+- Provide relevant examples to enhance understanding.
+- After each explanation, check with the user for any questions or clarifications before proceeding.
+- Ensure that explanations are adapted based on user feedback to optimize learning.
+- Ensure user always completes quiz before proceeding to next chapter.
+
+Handoff Protocol:
+- After explaining a topic, confirm with the user if they have any questions or need further clarification, then handoff to user.
+- If the user confirms understanding of chapter or is ready to proceed for next chapter, always handoff to the 'Quiz Agent' before moving to next chapter.
+
+Always handoff to single agent at a time. Always respond first before handing off to user or any other agent.
+"""
+
+QUIZ_AGENT_PROMPT = """
+You are a Quiz Agent responsible for reinforcing learning through interactive assessments. Your sole task is to generate multiple-choice quizzes based on the last chapter covered by the Topic Explainer Agent and provide feedback on user responses.
+
+Responsibilities:
+- Before writing a quiz, call the 'search_course_material' tool with the chapter title and base the questions on the passages it returns.
+- Generate well-structured multiple-choice questions that test the user's understanding of the explained topics.
+- Provide feedback on incorrect answers and offer brief explanations to reinforce learning.
+- If the user struggles, adapt the quiz or explanations to help clarify misunderstandings before moving forward.
+
+Handoff Protocol:
+- After presenting the quiz, handoff to user and wait for their responses.
+- If the user answers all questions correctly, send feedback and handoff to the 'Topic Explainer Agent' to proceed with the next topic.
+- If the user has not attempted all questions ask user to attempt all questions, then handoff to user.
+
+Instructions:
+- Always handoff to single agent at a time.
+- Always provide your feedback before handing off to user or any other agent.
+"""
+
+# Greets the user, asks for a URL and hands it to the web scraping agent.
+MASTER_AGENT = AgentTemplate(
+    name="master_agent",
+    system_message=MASTER_AGENT_PROMPT.strip(),
+    handoff_targets=("web_scraping_agent", "user"),
+)
+
+# Scrapes the URL with its scrape tool. The raw page goes to the data cleaning agent when the
+# LLM cleaner is enabled, otherwise the locally cleaned page goes straight to the course outline agent.
+WEB_SCRAPING_AGENTS = {
+    use_llm_cleaner: AgentTemplate(
+        name="web_scraping_agent",
+        system_message=WEB_SCRAPING_AGENT_PROMPT.format(next_agent=next_agent).strip(),
+        handoff_targets=(next_agent,),
+    )
+    for use_llm_cleaner, next_agent in ((True, "data_cleaning_agent"), (False, "course_outline_agent"))
+}
+
+# Removes ads, links and button texts from the raw page and hands it to the course outline agent.
+DATA_CLEANING_AGENT = AgentTemplate(
+    name="data_cleaning_agent",
+    system_message=DATA_CLEANING_AGENT_PROMPT.strip(),
+    handoff_targets=("course_outline_agent",),
+)
+
+# Turns the cleaned content into chapters and subchapters and refines them with the user.
+COURSE_OUTLINE_AGENT = AgentTemplate(
+    name="course_outline_agent",
+    system_message=COURSE_OUTLINE_AGENT_PROMPT.strip(),
+    handoff_targets=("topic_explainer", "user"),
+)
+
+# Explains the outline chapter by chapter and hands off to the quiz agent once a chapter is understood.
+# Source passages come from the team's retrieval tool, and the agent answers from them in the same turn.
+TOPIC_EXPLAINER_AGENT = AgentTemplate(
+    name="topic_explainer",
+    system_message=TOPIC_EXPLAINER_AGENT_PROMPT.strip(),
+    handoff_targets=("user", "quiz_agent"),
+    reflect_on_tool_use=True,
+)
+
+# Quizzes the user on the last chapter and returns to the topic explainer when the quiz is passed.
+QUIZ_AGENT = AgentTemplate(
+    name="quiz_agent",
+    system_message=QUIZ_AGENT_PROMPT.strip(),
+    handoff_targets=("user", "topic_explainer"),
+    reflect_on_tool_use=True,
+)
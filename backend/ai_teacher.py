@@ -1,23 +1,50 @@
 import os
+import re
 import json
 import asyncio
 import logging
+from typing import AsyncGenerator
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from web_scraper import WebScraper
+from executors import run_io
+from admission import get_admission_controller
+from scrape_cache import get_scrape_cache
+from content_extractor import extract_main_content
+from conversation_store import ConversationStore, VersionConflict, get_conversation_store
+from leases import hold_lease
+from state_log import StateWriter
+from metrics import STORAGE_SECONDS, TurnRecorder
+from log_queue import start_queue_logging
+from speculative_quiz import SpeculativeQuizAgent
+
+from model_client import get_model_client
+from outline_map_reduce import condense_document
+from ingestion import IngestedPage, merge_corpus
+from context_compaction import create_model_context
+from retrieval_index import BM25Index, SearchCourseMaterialTool
+from agent_templates import (
+    MASTER_AGENT,
+    WEB_SCRAPING_AGENTS,
+    DATA_CLEANING_AGENT,
+    COURSE_OUTLINE_AGENT,
+    TOPIC_EXPLAINER_AGENT,
+    QUIZ_AGENT,
+    PrebuiltFunctionTool,
+)
 
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient
 from autogen_agentchat.teams import Swarm
-from autogen_agentchat.agents import AssistantAgent
-from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
+from autogen_agentchat.state import ChatAgentContainerState
 from autogen_agentchat.conditions import HandoffTermination, TextMentionTermination
-from autogen_agentchat.messages import HandoffMessage, TextMessage
+from autogen_agentchat.messages import HandoffMessage, TextMessage, ToolCallExecutionEvent, ToolCallRequestEvent
 
 # -----------------------------------------------------------------------------
-# Logging configuration: Write logs to a file instead of terminal.
+# Logging configuration: Write logs to a file instead of terminal, through a background thread.
 # -----------------------------------------------------------------------------
 LOG_FILENAME = "agent_workflow.log"
-logging.basicConfig(
-    filename=LOG_FILENAME,
-    filemode='a',
+start_queue_logging(
+    LOG_FILENAME,
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
 )
@@ -26,6 +53,72 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv(override=True)
 
+# Set USE_LLM_CLEANER=true to clean scraped pages with the data_cleaning_agent LLM
+# instead of the local content extractor.
+USE_LLM_CLEANER = os.getenv("USE_LLM_CLEANER", "false").lower() == "true"
+
+# Set SPECULATIVE_QUIZ=false to generate a chapter's quiz only once the learner asks for it,
+# instead of in the background as soon as the chapter has been explained.
+SPECULATIVE_QUIZ = os.getenv("SPECULATIVE_QUIZ", "true").lower() == "true"
+
+# Set URL_PRE_ROUTING=false to let the master and web scraping agents handle URLs sent to the master agent,
+# instead of scraping them right away and handing the page straight to the next agent.
+URL_PRE_ROUTING = os.getenv("URL_PRE_ROUTING", "true").lower() == "true"
+
+URL_PATTERN = re.compile(r"https?://[^\s<>\"'`]+")
+# Sent by the master agent while a pre-routed URL is being scraped.
+URL_ACKNOWLEDGEMENT = "Great, I'm reading {url} now and will put together a course outline from it."
+
+
+def find_url(message: str) -> str | None:
+    """Returns the first http(s) URL in a message, without trailing punctuation."""
+    match = URL_PATTERN.search(message)
+    return match.group(0).rstrip(".,;:!?)]}") if match else None
+
+
+async def scrape_content_from_url(url: str) -> str:
+    """
+    Scrapes the textual content of the web page at the given URL.
+    Static pages are fetched over plain HTTP; pages that need JavaScript are rendered in a headless browser.
+    Very long pages are returned as section summaries.
+    """
+    entry = await get_scrape_cache().scrape(url)
+    logger.info("Scraped %s (served by %s tier).", url, entry.tier)
+    content = await run_io(extract_main_content, entry.text)
+    logger.info("Extracted %d of %d characters of main content.", len(content), len(entry.text))
+    return await condense_document(content, get_model_client())
+
+
+async def scrape_raw_content_from_url(url: str) -> str:
+    """
+    Scrapes the textual content of the web page at the given URL, without removing boilerplate.
+    Static pages are fetched over plain HTTP; pages that need JavaScript are rendered in a headless browser.
+    """
+    entry = await get_scrape_cache().scrape(url)
+    logger.info("Scraped %s (served by %s tier).", url, entry.tier)
+    return entry.text
+
+
+# Name of the conversation artifact holding the retrieval index of the course material.
+RETRIEVAL_INDEX_ARTIFACT = "retrieval_index"
+
+# Scrape tools are built once and shared by all teams; both are exposed to the model under the same name.
+SCRAPE_TOOLS = {
+    False: PrebuiltFunctionTool(
+        scrape_content_from_url, description=scrape_content_from_url.__doc__, name="scrape_content_from_url"
+    ),
+    True: PrebuiltFunctionTool(
+        scrape_raw_content_from_url, description=scrape_raw_content_from_url.__doc__, name="scrape_content_from_url"
+    ),
+}
+
+
+def last_handoff_source(conversation_state: dict, conversation_id: str) -> str:
+    """Returns the source of the last handoff in a saved team state: the agent the next message goes to."""
+    message_thread = conversation_state.get("agent_states").get(f'group_chat_manager/{conversation_id}').get('message_thread')
+    filtered_messages = list(filter(lambda msg: msg['type'] == 'HandoffMessage', message_thread))
+    return filtered_messages[-1]['source']
+
 
 class AITeacher:
     """
@@ -41,7 +134,8 @@ class AITeacher:
          - Accepts the URL, scrapes the raw content from it (without adding commentary).
          - Hands off the raw scraped content to the Data Cleaning Agent.
 
-      3. **Data Cleaning Agent:**  
+      3. **Data Cleaning Agent:** (only when USE_LLM_CLEANER is enabled)
+         - Otherwise the scraped content is cleaned locally and handed straight to the Course Outline Agent.
          - Receives the raw content.
          - Filters out unnecessary details such as ads, extra links, button texts, etc.
          - Hands off the cleaned content to the Course Outline Agent.
@@ -61,209 +155,57 @@ class AITeacher:
     Termination occurs when a handoff to the user is explicitly signaled or when the text "TERMINATE" is mentioned.
     """
 
-    def __init__(self):
-        # Initialize the Azure OpenAI client
-        self.azure_openai_client = AzureOpenAIChatCompletionClient(
-            azure_deployment=os.getenv("AZURE_DEPLOYMENT"),
-            model=os.getenv("MODEL"),
-            api_version=os.getenv("API_VERSION"),
-            azure_endpoint=os.getenv("AZURE_ENDPOINT"),
-            api_key=os.getenv("API_KEY"),
-        )
+    def __init__(
+        self,
+        store: ConversationStore | None = None,
+        use_llm_cleaner: bool | None = None,
+        model_client: ChatCompletionClient | None = None,
+    ):
+        # Conversation storage backend shared by all teams
+        self.store = store or get_conversation_store()
+        self.use_llm_cleaner = USE_LLM_CLEANER if use_llm_cleaner is None else use_llm_cleaner
+        # Model client (and its connection pool) shared by all teams
+        self.model_client = model_client or get_model_client()
+        # Retrieval index over the scraped course material, loaded from the store on first use
+        self.retrieval_index = None
+        self._retrieval_index_loaded = False
+        self._retrieval_index_dirty = False
         # Set up the agents team
         self.team = self._get_teaching_agents_team()
         self.last_message = None
-
-    def setup_master_agent(self) -> AssistantAgent:
-        """
-        Sets up the master (teacher) agent.
-        - Greets and guides the user.
-        - Requests a URL from the user to fetch learning content.
-        - Handoffs to the 'web_scraping_agent' once a URL is provided.
-        """
-        MASTER_AGENT_PROMPT = """
-You are a master teacher agent responsible for initiating the learning session.
-Greet the user warmly and explain that you can help them learn a new skill or topic.
-Ask the user to provide a URL that links to content they wish to learn from, then Handoff to user.
-If the user provides a URL, immediately handoff to 'web_scraping_agent' for further processing.
-If the user asks a question or deviates from the URL input, politely steer them back to providing the URL and handoff to user.
-        """
-
-        master_agent = AssistantAgent(
-            name="master_agent",
-            handoffs=["web_scraping_agent", "user"],
-            model_client=self.azure_openai_client,
-            system_message=MASTER_AGENT_PROMPT.strip(),
-        )
-        logger.info("Master agent set up successfully.")
-        return master_agent
-    
-    def scrape_content_from_url(self, url: str) -> str:
-        """
-        Placeholder function to scrape content from a given URL.
-        This function can be replaced with a more sophisticated web scraping implementation.
-        """
-        print('URL:', url)
-        scraper = WebScraper()
-        scraped_content = scraper.scrape_text(url)
-        # try:
-        #     scraped_content = scraper.scrape_text(url)
-        # except Exception as e:
-        #     scraped_content = f"Error: {str(e)}"
-        #     logger.error("Error while scraping content from URL: %s", e)
-        return scraped_content
-    
-    def setup_web_scraping_agent(self) -> AssistantAgent:
-        """
-        Sets up the web scraping agent.
-        - Accepts the URL provided by the master agent.
-        - Scrapes the raw textual content from the URL (without adding any commentary).
-        - Handoffs the raw scraped content to the 'data_cleaning_agent'.
-        """
-        WEB_SCRAPING_AGENT_PROMPT = """
-You are a web scraping agent.
-Your task is to extract the main textual content from the URL provided by the user.
-Do not provide any analysis or commentary. Simply fetch the raw text as accurately as possible.
-Provide the scraped raw content, then handoff to 'data_cleaning_agent'.
-If the URL is invalid or the content cannot be scraped, communicate the error clearly and send TERMINATE to end the session.
-        """
-
-        web_scraping_agent = AssistantAgent(
-            name="web_scraping_agent",
-            handoffs=["data_cleaning_agent"],
-            model_client=self.azure_openai_client,
-            tools=[self.scrape_content_from_url],
-            system_message=WEB_SCRAPING_AGENT_PROMPT.strip(),
-        )
-        logger.info("Web scraping agent set up successfully.")
-        return web_scraping_agent
-
-    def setup_data_cleaning_agent(self) -> AssistantAgent:
-        """
-        Sets up the data cleaning agent.
-        - Receives the raw content from the web scraping agent.
-        - Cleans the content by filtering out unnecessary details such as ads, extraneous links, button texts, etc.
-        - Ensures the text is focused on educational content.
-        - Handoffs the cleaned content to the 'course_outline_agent'.
-        """
-        DATA_CLEANING_AGENT_PROMPT = """
-You are a data cleaning agent.
-Your responsibility is to process the raw content received from the web scraping agent.
-Remove unnecessary details including ads, irrelevant links, button texts, and other non-educational content.
-Ensure the remaining text is concise, clear, and focused on providing educational value.
-After cleaning the data, handoff to the 'course_outline_agent'.
-        """
-
-        data_cleaning_agent = AssistantAgent(
-            name="data_cleaning_agent",
-            handoffs=["course_outline_agent"],
-            model_client=self.azure_openai_client,
-            system_message=DATA_CLEANING_AGENT_PROMPT.strip(),
-        )
-        logger.info("Data cleaning agent set up successfully.")
-        return data_cleaning_agent
-
-    def setup_course_outline_agent(self) -> AssistantAgent:
+        # Source of the last handoff when the team was rehydrated from storage
+        self.last_message_source = None
+        self.conversation_title = None
+        # Appends each turn's delta to the stored state, with periodic snapshots
+        self.state_writer = StateWriter()
+        self.is_running = False
+        # Turns of this conversation run one at a time; pending_turns counts the running and waiting ones.
+        self.turn_lock = asyncio.Lock()
+        self.pending_turns = 0
+        # Cancels the model calls of the running turn
+        self._cancellation_token = None
+
+    @classmethod
+    async def restore(cls, conversation_id: str, store: ConversationStore | None = None) -> "AITeacher | None":
         """
-        Sets up the course outline agent.
-        - Receives cleaned content from the data cleaning agent.
-        - Generates a well-organized course outline with chapters and subchapters.
-        - The outline should logically structure the content for a clear learning progression.
-        - Handoffs the outline to the 'topic_explainer' agent.
+        Rehydrates a team from its persisted state via `team.load_state`.
+        Returns None if the conversation does not exist.
         """
-        COURSE_OUTLINE_AGENT_PROMPT = """
-You are a Course Outline Agent with extensive experience in instructional design. Your primary task is to develop a comprehensive and logically structured course outline based on the cleaned content provided by the Data Cleaning Agent. Ensure that the outline aligns with the user's learning objectives and incorporates their feedback.
-
-Responsibilities:
-- Create clear chapters and subchapters to guide the learning process.
-- Present the course outline to the user whenever it is created or updated, and request their feedback.
-
-Handoff Protocol:
-- After presenting the created or updated course outline, ask the user if they require any changes, then handoff to user.
-- If the user is satisfied with the course outline, handoff to the 'Topic Explainer' agent.
-
-Always handoff to single agent at a time. Always respond first before handing off to user or any other agent.
-    """
-
-        course_outline_agent = AssistantAgent(
-            name="course_outline_agent",
-            handoffs=["topic_explainer", "user"],
-            model_client=self.azure_openai_client,
-            system_message=COURSE_OUTLINE_AGENT_PROMPT.strip(),
+        store = store or get_conversation_store()
+        versioned_state = await run_io(
+            STORAGE_SECONDS.wrap(store.get_versioned_state, operation="get_state"), conversation_id
         )
-        logger.info("Course outline agent set up successfully.")
-        return course_outline_agent
-
-    def setup_topic_explainer_agent(self) -> AssistantAgent:
-        """
-        Sets up the topic explainer agent.
-        - Receives the course outline from the course outline agent.
-        - Explains each chapter or subchapter in simple, understandable language.
-        - Invites user questions and ensures the user comprehends the material.
-        - Upon confirmation of understanding or when the user has no further questions, handoff to the 'quiz_agent'.
-        """
-        TOPIC_EXPLAINER_AGENT_PROMPT = """
-You are a Topic Explainer Agent with a talent for simplifying complex ideas. Your primary task is to explain each part of the course outline provided by the Course Outline Agent in a clear, structured, and engaging manner.
-
-Responsibilities:
-- Break down each topic into step-by-step explanations.
-- Provide relevant examples to enhance understanding.
-- After each explanation, check with the user for any questions or clarifications before proceeding.
-- Ensure that explanations are adapted based on user feedback to optimize learning.
-- Ensure user always completes quiz before proceeding to next chapter.
-
-Handoff Protocol:
-- After explaining a topic, confirm with the user if they have any questions or need further clarification, then handoff to user.
-- If the user confirms understanding of chapter or is ready to proceed for next chapter, always handoff to the 'Quiz Agent' before moving to next chapter.
-
-Always handoff to single agent at a time. Always respond first before handing off to user or any other agent.
-"""
-
-        topic_explainer_agent = AssistantAgent(
-            name="topic_explainer",
-            handoffs=["user", "quiz_agent"],
-            model_client=self.azure_openai_client,
-            system_message=TOPIC_EXPLAINER_AGENT_PROMPT.strip(),
-        )
-        logger.info("Topic explainer agent set up successfully.")
-        return topic_explainer_agent
-
-    def setup_quiz_agent(self) -> AssistantAgent:
-        """
-        Sets up the quiz agent.
-        - Generates a quiz with multiple-choice questions based on the explained topics.
-        - Invites the user to answer the quiz.
-        - If the user completes the quiz, handoff back to the 'topic_explainer' agent for further explanations.
-        - If the user requires further attempts, remain in interaction with the user.
-        """
-
-        QUIZ_AGENT_PROMPT = """
-You are a Quiz Agent responsible for reinforcing learning through interactive assessments. Your sole task is to generate multiple-choice quizzes based on the last chapter covered by the Topic Explainer Agent and provide feedback on user responses.
-
-Responsibilities:
-- Generate well-structured multiple-choice questions that test the user's understanding of the explained topics.
-- Provide feedback on incorrect answers and offer brief explanations to reinforce learning.
-- If the user struggles, adapt the quiz or explanations to help clarify misunderstandings before moving forward.
-
-Handoff Protocol:
-- After presenting the quiz, handoff to user and wait for their responses.
-- If the user answers all questions correctly, send feedback and handoff to the 'Topic Explainer Agent' to proceed with the next topic.
-- If the user has not attempted all questions ask user to attempt all questions, then handoff to user.
-
-Instructions:
-- Always handoff to single agent at a time. 
-- Always provide your feedback before handing off to user or any other agent.
-"""
-
-
-        quiz_agent = AssistantAgent(
-            name="quiz_agent",
-            handoffs=["user", "topic_explainer"],
-            model_client=self.azure_openai_client,
-            system_message=QUIZ_AGENT_PROMPT.strip(),
-        )
-        logger.info("Quiz agent set up successfully.")
-        return quiz_agent
+        if versioned_state is None:
+            return None
+
+        conversation_state, version = versioned_state
+        agent_manager = cls(store)
+        agent_manager.last_message_source = last_handoff_source(conversation_state, conversation_id)
+        await agent_manager.team.load_state(conversation_state)
+        agent_manager.state_writer.persisted_state = conversation_state
+        agent_manager.state_writer.version = version
+        logger.info("Rehydrated conversation %s from storage.", conversation_id)
+        return agent_manager
 
     def _get_teaching_agents_team(self) -> Swarm:
         """
@@ -279,12 +221,31 @@ Instructions:
           - Terminate when a handoff to 'user' is received.
           - Also, terminate if the text "TERMINATE" is mentioned.
         """
-        master_agent = self.setup_master_agent()
-        web_scraping_agent = self.setup_web_scraping_agent()
-        data_cleaning_agent = self.setup_data_cleaning_agent()
-        course_outline_agent = self.setup_course_outline_agent()
-        topic_explainer_agent = self.setup_topic_explainer_agent()
-        quiz_agent = self.setup_quiz_agent()
+        # Agents are instantiated from templates that are built once per process.
+        master_agent = MASTER_AGENT.build(self.model_client)
+        web_scraping_agent = WEB_SCRAPING_AGENTS[self.use_llm_cleaner].build(
+            self.model_client, tools=[SCRAPE_TOOLS[self.use_llm_cleaner]]
+        )
+        # The data cleaning agent stays in the team even when it is bypassed, so that
+        # saved states from either configuration can be loaded.
+        data_cleaning_agent = DATA_CLEANING_AGENT.build(self.model_client)
+        # Agents that keep talking after the outline exists get a token-budgeted context. The outline
+        # agent keeps the scraped page, as it may still be asked to revise the outline.
+        course_outline_agent = COURSE_OUTLINE_AGENT.build(
+            self.model_client, model_context=create_model_context("course_outline_agent", drop_scraped_content=False)
+        )
+        # The explainer and quiz agents pull the passages of the current chapter from the retrieval index.
+        search_tool = SearchCourseMaterialTool(self.get_retrieval_index)
+        topic_explainer_agent = TOPIC_EXPLAINER_AGENT.build(
+            self.model_client, tools=[search_tool], model_context=create_model_context("topic_explainer")
+        )
+        # The quiz agent can serve a quiz pre-generated while the learner reads the explanation.
+        quiz_agent = self.quiz_agent = QUIZ_AGENT.build(
+            self.model_client,
+            tools=[search_tool],
+            model_context=create_model_context("quiz_agent"),
+            agent_class=SpeculativeQuizAgent,
+        )
 
         termination = HandoffTermination(target="user") | TextMentionTermination("TERMINATE")
         team = Swarm(
@@ -303,134 +264,357 @@ Instructions:
     
     def get_team_id(self) -> str:
         return self.team._team_id
+
+    def _speculate_quiz(self, team_state: dict) -> None:
+        """
+        Starts generating the quiz of the chapter just explained, in the background.
+        - A copy of the quiz agent is given the messages buffered for the quiz agent, followed by the
+          explainer's handoff, as if the learner had already said they understood the chapter.
+        - The quiz agent serves it if the next turn reaches it through that handoff right after the learner's
+          reply; see `speculative_quiz`.
+        """
+        container_state = ChatAgentContainerState.model_validate(
+            team_state["agent_states"][f"{QUIZ_AGENT.name}/{self.get_team_id()}"]
+        )
+        handoff = next(handoff for handoff in TOPIC_EXPLAINER_AGENT.handoffs if handoff.target == QUIZ_AGENT.name)
+        copy = QUIZ_AGENT.build(
+            self.model_client,
+            tools=[SearchCourseMaterialTool(self.get_retrieval_index)],
+            model_context=create_model_context("quiz_agent"),
+        )
+        expected_messages = [
+            *container_state.message_buffer,
+            HandoffMessage(source=TOPIC_EXPLAINER_AGENT.name, target=QUIZ_AGENT.name, content=handoff.message),
+        ]
+        self.quiz_agent.speculate(copy, expected_messages)
+        logger.info("Started a speculative quiz for conversation %s.", self.get_team_id())
+
+    async def get_retrieval_index(self) -> BM25Index | None:
+        """Returns the retrieval index of this conversation, loading the persisted one on first use."""
+        if not self._retrieval_index_loaded:
+            get_artifact = STORAGE_SECONDS.wrap(self.store.get_artifact, operation="get_artifact")
+            data = await run_io(get_artifact, self.get_team_id(), RETRIEVAL_INDEX_ARTIFACT)
+            if data is not None:
+                self.retrieval_index = BM25Index.from_bytes(data)
+            self._retrieval_index_loaded = True
+        return self.retrieval_index
+
+    async def index_course_material(self, url: str) -> None:
+        """
+        Adds the main content of a scraped page to the retrieval index; it is persisted with the next save.
+        The full page is read from the scrape cache, as the tool may have returned section summaries or the raw page.
+        """
+        entry = await run_io(get_scrape_cache().get, url)
+        if entry is None:
+            return
+        await self.add_course_material(await run_io(extract_main_content, entry.text), url)
+
+    async def add_course_material(self, content: str, source: str) -> None:
+        """Adds the main content of a page to the retrieval index; it is persisted with the next save."""
+        index = await self.get_retrieval_index()
+        if index is None:
+            index = self.retrieval_index = BM25Index()
+        added = await run_io(index.add_document, content, source)
+        if added:
+            self._retrieval_index_dirty = True
+            logger.info("Indexed %d chunks of %s for retrieval.", added, source)
     
     async def start_conversation(self, user_message: str) -> list:
         """
         Starts the conversation by sending an initial user message to the team.
         Returns a list of tuples (source, content) representing the conversation.
         """
-        logger.info("Starting conversation with user message: %s", user_message)
-        messages = self.team.run_stream(task=user_message)
-        conversation = []
+        conversation = [message async for message in self.stream_conversation(user_message)]
+        return [(message.source, message.content) for message in conversation if isinstance(message, TextMessage)]
 
-        try:
-            async for message in messages:
-                if isinstance(message, TextMessage):
-                    logger.info("Received TextMessage from %s", message.source)
-                    conversation.append((message.source, message.content))
-                elif isinstance(message, HandoffMessage):
-                    logger.info("Received HandoffMessage from %s", message.source)
-                    if message.source != "user":
-                        self.last_message = message
-        except Exception as e:
-            logger.exception("Error during start_conversation: %s", e)
-            raise e
-        
-        team_state = await self.team.save_state()
-        # conversation_id = self.get_team_id()
-        # conversation_title = user_message
-
-        # Load existing conversations from the JSON file
-        conversations_file = "conversations.json"
-        if os.path.exists(conversations_file):
-            with open(conversations_file, "r") as file:
-                conversations = json.load(file)
-        else:
-            conversations = []
-
-        # Check if the conversation_id already exists
-        conversation_id = self.get_team_id()
-        conversation_title = user_message
-        existing_conversation = next((conv for conv in conversations if conv["conversation_id"] == conversation_id), None)
-
-        if existing_conversation:
-            # Update the existing conversation
-            existing_conversation["state"] = team_state
-            existing_conversation["conversation_title"] = conversation_title
-        else:
-            # Create a new conversation entry
-            new_conversation = {
-            "conversation_id": conversation_id,
-            "conversation_title": conversation_title,
-            "state": team_state,
-            }
-            conversations.append(new_conversation)
-
-        # Save the updated conversations back to the JSON file
-        with open(conversations_file, "w") as file:
-            json.dump(conversations, file, indent=4)
-
-        return conversation[1:]
-
-    async def send_message(self, user_message: str, last_message_source: str) -> list:
+    async def send_message(self, user_message: str, last_message_source: str | None = None) -> list:
         """
         Continues the conversation by sending a message directed to the last handoff agent.
         Returns the updated conversation as a list of tuples (source, content).
         """
-        # if not self.last_message:
-        #     logger.error("No previous handoff found. Please start a conversation first.")
-        #     raise ValueError("No handoff message available. Start a conversation first.")
+        conversation = [message async for message in self.stream_message(user_message, last_message_source)]
+        return [(message.source, message.content) for message in conversation if isinstance(message, TextMessage)]
+
+    async def stream_conversation(self, user_message: str) -> AsyncGenerator[TextMessage | HandoffMessage, None]:
+        """
+        Starts the conversation and yields each TextMessage/HandoffMessage produced by the agents
+        as soon as it arrives. The user's own message is not yielded.
+        """
+        logger.info("Starting conversation with user message: %s", user_message)
+        async with self._turn():
+            task_message = TextMessage(source="user", content=user_message)
+            async for message in self._run_master_turn(task_message, user_message, "start_conversation"):
+                yield message
+
+    async def stream_message(
+        self, user_message: str, last_message_source: str | None = None
+    ) -> AsyncGenerator[TextMessage | HandoffMessage, None]:
+        """
+        Continues the conversation with a message directed to the last handoff agent and yields
+        each TextMessage/HandoffMessage produced by the agents as soon as it arrives.
+        The turn waits for earlier turns of this conversation; it raises Overloaded if it is not admitted.
+        """
+        # The target is resolved once earlier turns of this conversation have finished.
+        async with self._turn():
+            if not last_message_source:
+                last_message_source = self.last_message.source if self.last_message else self.last_message_source
+            try:
+                task_message = HandoffMessage(
+                    source="user",
+                    target=last_message_source,
+                    content=user_message,
+                )
+            except Exception as e:
+                logger.exception("Error during send_message: %s", e)
+                raise e
+
+            logger.info("Sending message to %s: %s", last_message_source, user_message)
+            if last_message_source == MASTER_AGENT.name:
+                turn = self._run_master_turn(task_message, user_message, "send_message")
+            else:
+                turn = self._run_turn(task_message, user_message, "send_message")
+            async for message in turn:
+                yield message
+
+    async def start_course(self, pages: list[IngestedPage], conversation_title: str) -> list:
+        """
+        Starts the conversation from a batch of ingested pages instead of a user message.
+        Returns a list of tuples (source, content) representing the conversation.
+        """
+        conversation = [message async for message in self.stream_course(pages, conversation_title)]
+        return [(message.source, message.content) for message in conversation if isinstance(message, TextMessage)]
 
-        if not last_message_source:
-            last_message_source = self.last_message.source
+    async def stream_course(
+        self, pages: list[IngestedPage], conversation_title: str
+    ) -> AsyncGenerator[TextMessage | HandoffMessage, None]:
+        """
+        Starts the conversation from a batch of ingested pages, skipping the master and web scraping agents.
+        - Every page is added to the retrieval index on its own.
+        - The pages are merged into one corpus, condensed into section summaries when long, and handed
+          to the course outline agent as if the web scraping agent had scraped it.
+        """
+        async with self._turn():
+            for page in pages:
+                await self.add_course_material(page.content, page.url)
+            corpus = await condense_document(merge_corpus(pages), self.model_client)
+            task_message = HandoffMessage(source="web_scraping_agent", target="course_outline_agent", content=corpus)
+            logger.info("Starting course from %d ingested pages (%d characters).", len(pages), len(corpus))
+            async for message in self._run_turn(task_message, conversation_title, "start_course"):
+                yield message
+
+    async def _run_master_turn(
+        self, task_message: TextMessage | HandoffMessage, conversation_title: str, operation: str
+    ) -> AsyncGenerator[TextMessage | HandoffMessage, None]:
+        """
+        Runs a turn whose user message goes to the master agent.
+        A message with a URL is routed without asking the model (unless URL_PRE_ROUTING is disabled):
+        - The page is scraped right away, while the master agent's acknowledgement is sent to the user.
+        - The page is handed to the next agent as if the web scraping agent had scraped it, which skips the
+          model calls of the master agent (deciding to hand off) and the web scraping agent (calling the tool).
+        - If the scrape fails, the master and web scraping agents handle the URL as usual.
+        """
+        url = find_url(task_message.content) if URL_PRE_ROUTING else None
+        if url is None:
+            async for message in self._run_turn(task_message, conversation_title, operation):
+                yield message
+            return
+
+        acknowledgement = TextMessage(source=MASTER_AGENT.name, content=URL_ACKNOWLEDGEMENT.format(url=url))
+        scrape = asyncio.ensure_future(self._scrape_course_material(url))
         try:
-            task_message = HandoffMessage(
-                source="user",
-                target=last_message_source,
-                content=user_message,
-            )
-        except Exception as e:
-            logger.exception("Error during send_message: %s", e)
-            raise e
-        
-        logger.info("Sending message to %s: %s", last_message_source, user_message)
-        messages = self.team.run_stream(task=task_message)
-        conversation = []
+            yield acknowledgement
+            try:
+                content = await scrape
+            except Exception as e:
+                # The master agent gets the message alone, so that the model reads it as usual.
+                logger.warning("Pre-routed scrape of %s failed, handing it to the master agent: %s", url, e)
+                task = task_message
+            else:
+                next_agent = WEB_SCRAPING_AGENTS[self.use_llm_cleaner].handoff_targets[0]
+                handoff = HandoffMessage(source="web_scraping_agent", target=next_agent, content=content)
+                task = [task_message, acknowledgement, handoff]
+                logger.info("Pre-routed %s to %s (%d characters).", url, next_agent, len(content))
+        finally:
+            scrape.cancel()
+        async for message in self._run_turn(task, conversation_title, operation):
+            yield message
+
+    async def _scrape_course_material(self, url: str) -> str:
+        """Scrapes a page like the web scraping agent's tool would, and adds it to the retrieval index."""
+        scrape = scrape_raw_content_from_url if self.use_llm_cleaner else scrape_content_from_url
+        content = await scrape(url)
+        await self.index_course_material(url)
+        return content
+
+    async def _run_turn(
+        self, task: str | HandoffMessage | list[TextMessage | HandoffMessage], conversation_title: str, operation: str
+    ) -> AsyncGenerator[TextMessage | HandoffMessage, None]:
+        """
+        Runs the team on a task, yielding agent messages as they are produced,
+        and persists the team state once the run has finished.
+        Callers hold a turn of the conversation (see `_turn`).
+        """
+        self.is_running = True
+        self._cancellation_token = CancellationToken()
+        messages = self.team.run_stream(task=task, cancellation_token=self._cancellation_token)
+        task_messages = task if isinstance(task, list) else [task]
+        # URLs of the scrape tool calls in flight, by call id
+        scrape_calls = {}
+        recorder = TurnRecorder(operation, self.get_team_id())
+        status = "error"
+        last_handoff = None
 
         try:
             async for message in messages:
-                if isinstance(message, TextMessage):
+                if any(message is task_message for task_message in task_messages):
+                    # The task is echoed back first; only agent output is yielded.
+                    continue
+                recorder.record(message)
+                if isinstance(message, ToolCallRequestEvent) and message.source == "web_scraping_agent":
+                    for call in message.content:
+                        if call.name == "scrape_content_from_url":
+                            try:
+                                scrape_calls[call.id] = json.loads(call.arguments)["url"]
+                            except (ValueError, KeyError, TypeError):
+                                pass
+                elif isinstance(message, ToolCallExecutionEvent) and message.source == "web_scraping_agent":
+                    for result in message.content:
+                        if result.call_id in scrape_calls and not result.content.startswith("Error: "):
+                            await self.index_course_material(scrape_calls.pop(result.call_id))
+                elif isinstance(message, TextMessage):
                     logger.info("Received TextMessage from %s", message.source)
-                    conversation.append((message.source, message.content))
+                    if message.source != "user":
+                        yield message
                 elif isinstance(message, HandoffMessage):
                     logger.info("Received HandoffMessage from %s", message.source)
                     if message.source != "user":
-                        self.last_message = message
+                        self.last_message = last_handoff = message
+                        yield message
+            # A quiz pre-generated in an earlier turn that did not reach the quiz agent is stale now.
+            self.quiz_agent.discard_speculation()
+            team_state = await self.save_conversation(conversation_title)
+            if (
+                SPECULATIVE_QUIZ
+                and last_handoff is not None
+                and last_handoff.source == TOPIC_EXPLAINER_AGENT.name
+                and last_handoff.target == "user"
+            ):
+                self._speculate_quiz(team_state)
+            status = "ok"
+        except asyncio.CancelledError:
+            status = "cancelled"
+            logger.info("Cancelled %s of conversation %s.", operation, self.get_team_id())
+            # The rollback must finish even if the caller is cancelled again.
+            await asyncio.shield(self._reload())
+            raise
+        except VersionConflict as e:
+            status = "conflict"
+            # Another worker saved the conversation during this turn; its turn wins and this one is discarded.
+            logger.warning("Discarding %s of conversation %s: %s", operation, self.get_team_id(), e)
+            await asyncio.shield(self._reload())
+            raise
         except Exception as e:
-            logger.exception("Error during send_message: %s", e)
+            logger.exception("Error during %s: %s", operation, e)
             raise e
-        
-        team_state = await self.team.save_state()
-        # conversation_id = self.get_team_id()
-        # conversation_title = user_message
-
-        # Load existing conversations from the JSON file
-        conversations_file = "conversations.json"
-        if os.path.exists(conversations_file):
-            with open(conversations_file, "r") as file:
-                conversations = json.load(file)
-        else:
-            conversations = []
+        finally:
+            self.is_running = False
+            self._cancellation_token = None
+            elapsed = recorder.finish(status)
+            logger.info("Finished %s of conversation %s (%s) in %.2f seconds.", operation, self.get_team_id(), status, elapsed)
+
+    def cancel_turn(self) -> None:
+        """Stops the running turn's model calls; the turn raises CancelledError and is rolled back."""
+        if self._cancellation_token is not None:
+            self._cancellation_token.cancel()
+
+    @asynccontextmanager
+    async def _turn(self):
+        """
+        Runs a turn of this conversation exclusively:
+        - in this worker, through an admission turn (see `admission.AdmissionController.turn`);
+        - across the workers sharing the store, by holding the conversation's lease (see `leases.hold_lease`).
+          The lease is taken before a run slot, so that waiting for another worker does not hold one.
+        Once both are held, the team is reloaded if another worker has saved the conversation since this one did.
+        """
+
+        def claim_lease():
+            return hold_lease(self.store, self.get_team_id(), on_lost=self.cancel_turn)
+
+        async with get_admission_controller().turn(self, claim=claim_lease):
+            await self._sync_with_store()
+            yield
 
-        # Check if the conversation_id already exists
-        conversation_id = self.get_team_id()
-        conversation_title = user_message
-        existing_conversation = next((conv for conv in conversations if conv["conversation_id"] == conversation_id), None)
+    async def _sync_with_store(self) -> None:
+        version = await run_io(
+            STORAGE_SECONDS.wrap(self.store.get_version, operation="get_version"), self.get_team_id()
+        )
+        if version is not None and version != self.state_writer.version:
+            logger.info(
+                "Conversation %s is at version %d in storage, %d here; reloading it.",
+                self.get_team_id(),
+                version,
+                self.state_writer.version,
+            )
+            await self._reload()
 
-        if existing_conversation:
-            # Update the existing conversation
-            existing_conversation["state"] = team_state
-            existing_conversation["conversation_title"] = conversation_title
+    async def _reload(self) -> None:
+        """
+        Restores the last saved state (or a fresh team if none was saved), discarding what is not in the store:
+        the partial turn that was cancelled, or a stale copy of a conversation updated by another worker.
+        """
+        self.quiz_agent.discard_speculation()
+        versioned_state = await run_io(
+            STORAGE_SECONDS.wrap(self.store.get_versioned_state, operation="get_state"), self.get_team_id()
+        )
+        conversation_state, version = versioned_state or (None, 0)
+        self.last_message = None
+        self.retrieval_index = None
+        self._retrieval_index_loaded = False
+        self._retrieval_index_dirty = False
+        if conversation_state is None:
+            await self.team.reset()
         else:
-            # Create a new conversation entry
-            new_conversation = {
-            "conversation_id": conversation_id,
-            "conversation_title": conversation_title,
-            "state": team_state,
-            }
-            conversations.append(new_conversation)
-
-        # Save the updated conversations back to the JSON file
-        with open(conversations_file, "w") as file:
-            json.dump(conversations, file, indent=4)
-        return conversation
\ No newline at end of file
+            await self.team.load_state(conversation_state)
+            self.last_message_source = last_handoff_source(conversation_state, self.get_team_id())
+        self.state_writer.persisted_state = conversation_state
+        self.state_writer.version = version
+
+    async def save_conversation(self, conversation_title: str) -> dict:
+        """
+        Persists the current team state under this team's conversation id, and returns it.
+        Only this conversation is read or written; the store makes the write atomic.
+        Usually only the turn's new messages are appended to the state log (see `state_log.StateWriter`).
+        """
+        team_state = await self.team.save_state()
+        if self._retrieval_index_dirty:
+            data = await run_io(self.retrieval_index.to_bytes)
+            save_artifact = STORAGE_SECONDS.wrap(self.store.save_artifact, operation="save_artifact")
+            await run_io(save_artifact, self.get_team_id(), RETRIEVAL_INDEX_ARTIFACT, data)
+            self._retrieval_index_dirty = False
+        # Diffing, serializing and writing the state is blocking, so it runs on the I/O executor.
+        await run_io(
+            STORAGE_SECONDS.wrap(self.state_writer.write, operation="save_state"),
+            self.store,
+            self.get_team_id(),
+            conversation_title,
+            team_state,
+            title_changed=conversation_title != self.conversation_title,
+        )
+        self.conversation_title = conversation_title
+        return team_state
+
+    async def persist(self) -> None:
+        """
+        Saves the team state before the team is evicted from memory.
+        - Teams that have not run a turn in this process have nothing new to persist.
+        - The save holds the conversation's lease, so it cannot land in the middle of another worker's turn.
+          A team that another worker has saved since is outdated, and is dropped without saving.
+        """
+        self.quiz_agent.discard_speculation()
+        if self.conversation_title is None:
+            return
+        async with hold_lease(self.store, self.get_team_id(), on_lost=self.cancel_turn):
+            try:
+                await self.save_conversation(self.conversation_title)
+            except VersionConflict as e:
+                logger.info("Not persisting conversation %s: %s", self.get_team_id(), e)
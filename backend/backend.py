@@ -1,10 +1,60 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from ai_teacher import AITeacher
+from autogen_agentchat.messages import HandoffMessage, TextMessage
+from browser_pool import get_browser_pool
+from http_fetcher import get_http_fetcher
+from model_client import close_model_client
+from conversation_store import VersionConflict, get_conversation_store
+from manager_cache import create_manager_cache
+from scrape_cache import get_scrape_cache
+from context_compaction import compaction_stats
+from state_log import persistence_stats
+from speculative_quiz import speculation_stats
+from leases import lease_stats
+from metrics import REGISTRY, STORAGE_SECONDS
+from executors import executor_stats, run_io, shutdown_executors
+from admission import Overloaded, get_admission_controller
+from ingestion import IngestionJob, IngestionManager
+from jobs import get_job_manager
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+import asyncio
+import logging
 import json
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the conversation store (and migrate legacy conversations) off the event loop.
+    await run_io(get_conversation_store)
+    # Open the job table and fail jobs that stopped workers left unfinished.
+    jobs = await run_io(get_job_manager)
+    # Resolve the chromedriver binary and warm up the browser pool before serving requests.
+    browser_pool = get_browser_pool()
+    try:
+        await run_io(browser_pool.start)
+    except Exception as e:
+        # Browsers are launched lazily on the first scrape if startup fails.
+        logger.exception("Failed to start browser pool: %s", e)
+    # Evict idle teams even when no requests come in.
+    expiry = asyncio.create_task(managers.run_expiry())
+    # Keep this worker's jobs from being failed by its siblings.
+    heartbeat = asyncio.create_task(jobs.run_heartbeat())
+    yield
+    expiry.cancel()
+    heartbeat.cancel()
+    await get_job_manager().shutdown()
+    await get_http_fetcher().aclose()
+    await close_model_client()
+    await run_io(browser_pool.shutdown)
+    shutdown_executors()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 app.add_middleware(
@@ -15,7 +65,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-managers = {}
+managers = create_manager_cache(AITeacher.restore)
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    # Rejected turns fail fast with 429 (conversation busy) or 503 (server at capacity).
+    return JSONResponse(
+        status_code=exc.status_code, content={"detail": exc.detail}, headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+@app.exception_handler(VersionConflict)
+async def version_conflict_handler(request: Request, exc: VersionConflict):
+    # Another worker saved the conversation during the turn; the turn was discarded and can be sent again.
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
 
 
 class NewMessageRequest(BaseModel):
@@ -28,25 +92,231 @@ class MessageRequest(BaseModel):
 class ConversationRequest(BaseModel):
     conversation_id: str
 
+class IngestRequest(BaseModel):
+    urls: list[str]
+    crawl_depth: int = 0
+    max_pages: int | None = None
+
+
+async def build_course(job: IngestionJob) -> dict:
+    """Starts a conversation from the pages of a finished ingestion job."""
+    pages = job.documents
+    agent_manager = AITeacher()
+    await managers.put(agent_manager.get_team_id(), agent_manager)
+    title = pages[0].title if len(pages) == 1 else f"{pages[0].title} (+{len(pages) - 1} pages)"
+    response = await agent_manager.start_course(pages, title)
+    return {"conversation_id": agent_manager.get_team_id(), "conversation": response}
+
+
+ingestion = IngestionManager(build_course)
+
 
 @app.post("/start_conversation")
 async def start_conversation(request: NewMessageRequest):
     try:
+        get_admission_controller().check()
         agent_manager = AITeacher()
-        managers[agent_manager.get_team_id()] = agent_manager
+        await managers.put(agent_manager.get_team_id(), agent_manager)
         response = await agent_manager.start_conversation(request.message)
         return {"conversation_id": agent_manager.get_team_id(), "conversation": response}
+    except (Overloaded, VersionConflict):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/jobs/start_conversation", status_code=202)
+async def start_conversation_job(
+    request: NewMessageRequest, idempotency_key: str | None = Header(default=None, alias="Idempotency-Key")
+):
+    """
+    Starts a conversation as a background job and returns at once, so that long course creation
+    turns (scraping and outlining) do not hold the request open. Poll /jobs/{job_id} for the result.
+    """
+    jobs = get_job_manager()
+    if idempotency_key:
+        # A retried submission returns the job it started the first time.
+        job = await jobs.get_by_idempotency_key(idempotency_key)
+        if job is not None:
+            return job.to_dict()
+    get_admission_controller().check()
+    agent_manager = AITeacher()
+    conversation_id = agent_manager.get_team_id()
+
+    async def work() -> dict:
+        response = await agent_manager.start_conversation(request.message)
+        return {"conversation_id": conversation_id, "conversation": response}
+
+    job = await jobs.submit(
+        "start_conversation", work, conversation_id, idempotency_key, on_cancel=agent_manager.cancel_turn
+    )
+    # The team is only cached once its job exists: a rejected submission, or one that returned the job
+    # of a concurrent request with the same key, leaves no team behind.
+    if job.conversation_id == conversation_id:
+        await managers.put(conversation_id, agent_manager)
+    return job.to_dict()
+
+
+@app.post("/jobs/send_message", status_code=202)
+async def send_message_job(
+    request: MessageRequest, idempotency_key: str | None = Header(default=None, alias="Idempotency-Key")
+):
+    """Sends a message as a background job and returns at once. Poll /jobs/{job_id} for the reply."""
+    jobs = get_job_manager()
+    if idempotency_key:
+        job = await jobs.get_by_idempotency_key(idempotency_key)
+        if job is not None:
+            return job.to_dict()
+    try:
+        agent_manager = await managers.get(request.conversation_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Chat history not found")
+    get_admission_controller().check(agent_manager)
+
+    async def work() -> dict:
+        response = await agent_manager.send_message(request.message)
+        return {"conversation_id": request.conversation_id, "conversation": response}
+
+    job = await jobs.submit(
+        "send_message", work, request.conversation_id, idempotency_key, on_cancel=agent_manager.cancel_turn
+    )
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str, wait: float = 0.0, version: int | None = None):
+    """
+    Returns a job's status, and its result once done.
+    With `wait` (seconds, at most 30), the request is held until the job's version differs from
+    `version` or the job finishes, so that clients can long-poll instead of polling in a tight loop.
+    """
+    job = await get_job_manager().get(job_id, wait=max(0.0, wait), version=version)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancels a queued or running job. A cancelled turn is rolled back to the last saved conversation state."""
+    job = await get_job_manager().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+# Disable caching and proxy buffering so that events reach the client immediately.
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_events(conversation_id: str, messages):
+    """
+    Formats agent messages as server-sent events:
+      - 'message' for each TextMessage, 'handoff' for each HandoffMessage,
+      - 'done' once the run has finished and the state is saved, or 'error' if it failed.
+    """
+    try:
+        async for message in messages:
+            if isinstance(message, TextMessage):
+                yield sse_event("message", {"source": message.source, "content": message.content})
+            elif isinstance(message, HandoffMessage):
+                yield sse_event("handoff", {"source": message.source, "target": message.target})
+        yield sse_event("done", {"conversation_id": conversation_id})
+    except Overloaded as e:
+        yield sse_event("error", {"detail": e.detail, "status_code": e.status_code, "retry_after": e.retry_after})
+    except VersionConflict as e:
+        yield sse_event("error", {"detail": str(e), "status_code": 409})
+    except Exception as e:
+        yield sse_event("error", {"detail": str(e)})
+
+
+@app.post("/start_conversation_stream")
+async def start_conversation_stream(request: NewMessageRequest):
+    get_admission_controller().check()
+    agent_manager = AITeacher()
+    conversation_id = agent_manager.get_team_id()
+    await managers.put(conversation_id, agent_manager)
+
+    async def events():
+        yield sse_event("start", {"conversation_id": conversation_id})
+        async for event in stream_events(conversation_id, agent_manager.stream_conversation(request.message)):
+            yield event
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.post("/send_message_stream")
+async def send_message_stream(request: MessageRequest):
+    try:
+        agent_manager = await managers.get(request.conversation_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Chat history not found")
+
+    # Reject before the response starts, so that overload is reported with a status code.
+    get_admission_controller().check(agent_manager)
+    messages = agent_manager.stream_message(request.message)
+    return StreamingResponse(
+        stream_events(request.conversation_id, messages), media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
+
+@app.post("/ingest", status_code=202)
+async def ingest(request: IngestRequest):
+    """
+    Starts a batch ingestion of a list of URLs, or of a doc-site root crawled `crawl_depth` links deep.
+    Returns at once; progress is reported by /ingest/{job_id} and /ingest/{job_id}/events.
+    """
+    if not request.urls:
+        raise HTTPException(status_code=422, detail="At least one URL is required")
+    if any(not url.strip().lower().startswith(("http://", "https://")) for url in request.urls):
+        raise HTTPException(status_code=422, detail="Only http and https URLs can be ingested")
+    if request.crawl_depth < 0:
+        raise HTTPException(status_code=422, detail="crawl_depth must not be negative")
+    job = ingestion.start(request.urls, request.crawl_depth, request.max_pages)
+    return {"job_id": job.id, "status": job.status}
+
+
+@app.get("/ingest/{job_id}")
+async def ingest_progress(job_id: str):
+    try:
+        return ingestion.get(job_id).progress()
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+
+
+@app.get("/ingest/{job_id}/events")
+async def ingest_events(job_id: str):
+    """Streams a 'progress' event whenever the job changes, and a final 'done' or 'error' event."""
+    try:
+        job = ingestion.get(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+
+    async def events():
+        while True:
+            version = job.version
+            progress = job.progress()
+            if job.finished:
+                yield sse_event("done" if job.status == "done" else "error", progress)
+                return
+            yield sse_event("progress", progress)
+            await job.wait_for_change(version, timeout=15)
+            if job.version == version:
+                # Comment line that keeps idle connections open through proxies.
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @app.get("/fetch_conversations")
 async def fetch_conversations():
     try:
-        with open('conversations.json', 'r') as file:
-            conversations = json.load(file)
-
-        conversation_list = [(conv['conversation_id'], conv['conversation_title']) for conv in conversations]
+        list_conversations = STORAGE_SECONDS.wrap(get_conversation_store().list_conversations, operation="list")
+        conversation_list = await run_io(list_conversations)
         return {
             "conversations":conversation_list
         }
@@ -57,14 +327,8 @@ async def fetch_conversations():
 @app.post("/load_conversation")
 async def load_conversation(request: ConversationRequest):
     try:
-        with open('conversations.json', 'r') as file:
-            conversations = json.load(file)
-
-        conversation_state = None
-        for conv in conversations:
-            if conv['conversation_id'] == request.conversation_id:
-                conversation_state = conv['state']
-                break
+        get_state = STORAGE_SECONDS.wrap(get_conversation_store().get_state, operation="get_state")
+        conversation_state = await run_io(get_state, request.conversation_id)
 
         if conversation_state is None:
                 raise HTTPException(status_code=404, detail="Chat history not found")
@@ -82,16 +346,11 @@ async def load_conversation(request: ConversationRequest):
 @app.delete("/delete_conversation")
 async def delete_conversation(request: ConversationRequest):
     try:
-        with open('conversations.json', 'r') as file:
-            conversations = json.load(file)
+        await run_io(STORAGE_SECONDS.wrap(get_conversation_store().delete, operation="delete"), request.conversation_id)
 
-        conversations = [conv for conv in conversations if conv['conversation_id'] != request.conversation_id]
-
-        with open('conversations.json', 'w') as file:
-            json.dump(conversations, file, indent=4)
-
-        if request.conversation_id in managers:
-            del managers[request.conversation_id]
+        agent_manager = await managers.discard(request.conversation_id)
+        if agent_manager is not None:
+            agent_manager.quiz_agent.discard_speculation()
 
         return {"detail": "Conversation deleted successfully"}
     except Exception as e:
@@ -99,31 +358,45 @@ async def delete_conversation(request: ConversationRequest):
 
 @app.post("/send_message")
 async def send_message(request: MessageRequest):
-    last_message_source = None
     try:
-        if request.conversation_id not in managers:
-            agent_manager = AITeacher()
-
-            with open('conversations.json', 'r') as file:
-                conversations = json.load(file)
-
-            conversation_state = None
-            for conv in conversations:
-                if conv['conversation_id'] == request.conversation_id:
-                    conversation_state = conv['state']
-                    break
+        try:
+            agent_manager = await managers.get(request.conversation_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Chat history not found")
 
-            if conversation_state is None:
-                raise HTTPException(status_code=404, detail="Chat history not found")
-            
-            message_thread = conversation_state.get("agent_states").get(f'group_chat_manager/{request.conversation_id}').get('message_thread')
-            filtered_messages = list(filter(lambda msg: msg['type'] == 'HandoffMessage', message_thread))
-            last_message_source = filtered_messages[-1]['source']
-            await agent_manager.team.load_state(conversation_state)
-            managers[request.conversation_id] = agent_manager
-        
-        print(last_message_source)
-        response = await managers[request.conversation_id].send_message(request.message, last_message_source)
+        response = await agent_manager.send_message(request.message)
         return {"conversation": response}
+    except (Overloaded, VersionConflict):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def collect_stats() -> dict:
+    return {
+        "manager_cache": managers.stats(),
+        "browser_pool": get_browser_pool().stats(),
+        "scrape_cache": get_scrape_cache().stats(),
+        "context_compaction": compaction_stats(),
+        "persistence": persistence_stats(),
+        "speculation": speculation_stats(),
+        "leases": lease_stats(),
+        "ingestion": ingestion.stats(),
+        "executors": executor_stats(),
+        "admission": get_admission_controller().stats(),
+        "jobs": get_job_manager().stats(),
+    }
+
+
+@app.get("/stats")
+async def stats():
+    return collect_stats()
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics: turn, per-agent, tool call, scrape and storage timings, token usage and handoffs,
+    plus the numbers of /stats as gauges.
+    """
+    return PlainTextResponse(REGISTRY.render(collect_stats()), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,166 @@
+"""
+Load test: latency of GET /fetch_conversations while browser scrapes and conversation saves
+run in the same process.
+
+- `idle`: no background work.
+- `inline`: the previous behaviour. Selenium work and state writes run directly in the
+  coroutines that need them, blocking the event loop for their whole duration.
+- `executor`: the current behaviour. Browser sessions run on the browser executor and
+  state writes on the I/O executor; the event loop only awaits them.
+
+Browser sessions are simulated without Chrome: each one sleeps `--scrape-seconds` (page load
+and settle wait) and converts a saved fixture to markdown. Conversation states are written to a
+temporary file store, like the saves at the end of every turn.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_event_loop_latency [--duration 5] [--scrapers 4] [--savers 2]
+"""
+import os
+import glob
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+for name, value in {
+    "AZURE_DEPLOYMENT": "benchmark",
+    "MODEL": "gpt-4o",
+    "API_VERSION": "2024-06-01",
+    "AZURE_ENDPOINT": "https://benchmark.openai.azure.com",
+    "API_KEY": "benchmark",
+}.items():
+    os.environ.setdefault(name, value)
+
+import httpx
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def make_state(conversation_id: str, messages: int) -> dict:
+    """A team state of roughly the size a conversation reaches after a few chapters."""
+    thread = [
+        {"type": "TextMessage", "source": "topic_explainer", "content": f"Explanation {index}. " * 60}
+        for index in range(messages)
+    ]
+    return {"agent_states": {f"group_chat_manager/{conversation_id}": {"message_thread": thread}}}
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_mode(mode: str, args, store, scraper, fixture_urls: list[str]) -> list[float]:
+    from executors import run_io
+
+    stop = asyncio.Event()
+
+    async def scrape_loop(worker: int):
+        index = worker
+        while not stop.is_set():
+            url = fixture_urls[index % len(fixture_urls)]
+            if mode == "inline":
+                scraper.scrape_text(url)
+            else:
+                await scraper.scrape(url)
+            index += 1
+            await asyncio.sleep(args.scrape_interval)
+
+    async def save_loop(worker: int):
+        conversation_id = f"bench-save-{worker}"
+        state = make_state(conversation_id, args.messages)
+        while not stop.is_set():
+            if mode == "inline":
+                store.save(conversation_id, "Benchmark", state)
+            else:
+                await run_io(store.save, conversation_id, "Benchmark", state)
+            await asyncio.sleep(args.save_interval)
+
+    import backend
+
+    latencies = []
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+
+        async def probe():
+            while not stop.is_set():
+                started = time.perf_counter()
+                response = await client.get("/fetch_conversations")
+                response.raise_for_status()
+                latencies.append((time.perf_counter() - started) * 1000)
+                await asyncio.sleep(args.probe_interval)
+
+        workers = []
+        if mode != "idle":
+            workers += [asyncio.create_task(scrape_loop(worker)) for worker in range(args.scrapers)]
+            workers += [asyncio.create_task(save_loop(worker)) for worker in range(args.savers)]
+        probes = [asyncio.create_task(probe()) for _ in range(args.clients)]
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*probes, *workers)
+    return latencies
+
+
+async def run(args):
+    from browser_pool import get_browser_pool
+    from html_to_markdown import html_to_markdown
+    from web_scraper import WebScraper
+    from conversation_store import get_conversation_store
+
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.html"))):
+        with open(path, encoding="utf-8") as file:
+            fixtures[f"https://example.com/{os.path.basename(path)}"] = file.read()
+
+    class SimulatedBrowserScraper(WebScraper):
+        """Always takes the browser tier; a session blocks its thread like Selenium does."""
+
+        async def fetch_static(self, url, validators=None):
+            return None
+
+        def scrape_text(self, url):
+            time.sleep(args.scrape_seconds)
+            return html_to_markdown(fixtures[url], url)
+
+    store = get_conversation_store()
+    for index in range(args.conversations):
+        store.save(f"bench-{index}", f"Conversation {index}", make_state(f"bench-{index}", args.messages))
+    scraper = SimulatedBrowserScraper(pool=get_browser_pool())
+
+    print(
+        f"{args.conversations} conversations, {args.scrapers} scrapers ({args.scrape_seconds:.2f} s each), "
+        f"{args.savers} savers, {args.clients} clients, {args.duration:.0f} s per mode"
+    )
+    print(f"{'mode':<10}{'requests':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for mode in ("idle", "inline", "executor"):
+        latencies = await run_mode(mode, args, store, scraper, list(fixtures))
+        print(
+            f"{mode:<10}{len(latencies):>10}{statistics.median(latencies):>10.1f}{percentile(latencies, 0.95):>10.1f}"
+            f"{percentile(latencies, 0.99):>10.1f}{max(latencies):>10.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds to measure each mode.")
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=40, help="Messages per stored conversation.")
+    parser.add_argument("--scrapers", type=int, default=4, help="Concurrent browser scrapes.")
+    parser.add_argument("--scrape-seconds", type=float, default=0.5, help="Blocking time of one browser session.")
+    parser.add_argument("--scrape-interval", type=float, default=0.25, help="Seconds between scrapes of one scraper.")
+    parser.add_argument("--savers", type=int, default=2, help="Concurrent conversation savers.")
+    parser.add_argument("--save-interval", type=float, default=0.05, help="Seconds between saves of one saver.")
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent /fetch_conversations clients.")
+    parser.add_argument("--probe-interval", type=float, default=0.01, help="Seconds between requests of a client.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["CONVERSATION_STORE"] = "files"
+        os.environ["CONVERSATION_STORE_PATH"] = os.path.join(directory, "conversations")
+        os.environ.setdefault("BROWSER_POOL_SIZE", str(args.scrapers))
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Compares the legacy per-link WebDriver loop in WebScraper.scrape_text with the
+single-pass html_to_markdown conversion over the saved HTML fixtures.
+
+The legacy loop issued two WebDriver commands per <a> element (`get_attribute('href')`
+and `.text`) and then ran `text.replace(link_text, ...)` over the whole body once per
+link. WebDriver round trips are simulated with a configurable latency so the benchmark
+runs without a browser.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_link_conversion [--ipc-ms 1.0] [--repeat 20] [--scale 1]
+
+`--scale N` concatenates each fixture N times to emulate long pages. The legacy loop
+is O(links x text length), and anchors whose text repeats are wrapped again on every
+occurrence, so its output (and cost) blows up on pages with repeated navigation links.
+The `legacy ok` column reports whether the legacy output matched the single-pass output.
+"""
+import re
+import glob
+import time
+import argparse
+import os
+
+from html_to_markdown import html_to_markdown
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+MARKDOWN_LINK = re.compile(r"\[([^\]]+)\]\(([^)]+)\)")
+
+
+def simulated_round_trip(ipc_seconds: float) -> None:
+    if ipc_seconds:
+        time.sleep(ipc_seconds)
+
+
+def legacy_conversion(body_text: str, links: list, ipc_seconds: float) -> str:
+    """The pre-existing algorithm: one replace over the whole text per link, two round trips per link."""
+    simulated_round_trip(ipc_seconds)  # find_element(body).text
+    simulated_round_trip(ipc_seconds)  # find_elements(a)
+    text = body_text
+    for href, link_text in links:
+        simulated_round_trip(ipc_seconds)  # get_attribute('href')
+        simulated_round_trip(ipc_seconds)  # .text
+        if href and link_text:
+            text = text.replace(link_text, f'[{link_text}]({href})')
+    return text
+
+
+def single_pass_conversion(html: str, base_url: str, ipc_seconds: float) -> str:
+    simulated_round_trip(ipc_seconds)  # page_source
+    simulated_round_trip(ipc_seconds)  # current_url
+    return html_to_markdown(html, base_url)
+
+
+def time_call(function, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ipc-ms", type=float, default=1.0, help="Simulated WebDriver round-trip latency.")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--scale", type=int, default=1, help="Concatenate each fixture this many times.")
+    args = parser.parse_args()
+    ipc_seconds = args.ipc_ms / 1000
+    base_url = "https://example.com/docs/"
+
+    print(f"{'fixture':<28}{'links':>7}{'legacy ms':>12}{'single ms':>12}{'speedup':>10}{'legacy ok':>11}")
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.html"))):
+        with open(path, encoding="utf-8") as file:
+            html = file.read() * args.scale
+
+        # Reconstruct what Selenium returned to the legacy loop: the plain body text and the links.
+        markdown = html_to_markdown(html, base_url)
+        links = [(href, link_text) for link_text, href in MARKDOWN_LINK.findall(markdown)]
+        body_text = MARKDOWN_LINK.sub(r"\1", markdown)
+
+        legacy = time_call(lambda: legacy_conversion(body_text, links, ipc_seconds), args.repeat)
+        single = time_call(lambda: single_pass_conversion(html, base_url, ipc_seconds), args.repeat)
+        correct = legacy_conversion(body_text, links, 0) == markdown
+        print(
+            f"{os.path.basename(path):<28}{len(links):>7}{legacy * 1000:>12.2f}"
+            f"{single * 1000:>12.2f}{legacy / single:>9.1f}x{'yes' if correct else 'no':>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
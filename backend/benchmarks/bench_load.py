@@ -0,0 +1,275 @@
+"""
+Load test of the FastAPI endpoints, offline: a scripted model client stands in for Azure OpenAI and
+the saved fixture pages are served over local HTTP.
+
+Every simulated user runs complete sessions against the app:
+
+    POST /start_conversation        greeting from the master agent
+    POST /send_message [url]        scrape, clean and outline a fixture page
+    POST /send_message [accept]     "looks good": the first chapter is explained
+    POST /send_message [got it]     the chapter's quiz                  } repeated
+    POST /send_message [answers]    feedback and the next chapter       } --chapters times
+    GET  /fetch_conversations
+    POST /load_conversation
+
+The report gives throughput and p50/p95/p99 latency per endpoint and step, and the time, turns,
+model calls and tokens per agent (from the /metrics instrumentation), and the hit rate of speculative
+quizzes. `--no-speculative-quiz` and `--no-url-pre-routing` turn those optimizations off for comparison.
+Scraped pages are cleaned locally, as in the app by default; `--llm-cleaner` uses the data cleaning agent.
+`--store redis` keeps the conversations in a Redis stand-in (see `benchmarks/redis_stand_in.py`) to measure
+the shared store's overhead.
+`--output` also writes the results as JSON, so runs can be compared to track regressions.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_load [--users 8] [--sessions 16] [--chapters 2] [--model-base-ms 300]
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+from contextlib import nullcontext
+from collections import defaultdict
+
+for name, value in {
+    "AZURE_DEPLOYMENT": "benchmark",
+    "MODEL": "gpt-4o",
+    "API_VERSION": "2024-06-01",
+    "AZURE_ENDPOINT": "https://benchmark.openai.azure.com",
+    "API_KEY": "benchmark",
+}.items():
+    os.environ.setdefault(name, value)
+
+import httpx
+
+from benchmarks.fixture_server import FixtureServer
+from benchmarks.redis_stand_in import RedisStandIn
+
+DEFAULT_PAGES = ["docs_python_lists.html", "blog_http_caching.html", "wiki_binary_search.html"]
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Session:
+    """One simulated user going through a course."""
+
+    def __init__(self, client: httpx.AsyncClient, latencies: dict, errors: dict):
+        self.client = client
+        self.latencies = latencies
+        self.errors = errors
+
+    async def request(self, label: str, method: str, url: str, body: dict | None = None) -> dict | None:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, json=body)
+        except httpx.HTTPError as e:
+            self.errors[label] += 1
+            print(f"{label}: {e!r}")
+            return None
+        elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code != 200:
+            self.errors[label] += 1
+            print(f"{label}: {response.status_code} {response.text[:200]}")
+            return None
+        self.latencies[label].append(elapsed)
+        return response.json()
+
+    async def run(self, page_url: str, chapters: int) -> bool:
+        started = await self.request("POST /start_conversation", "POST", "/start_conversation", {"message": "Hi"})
+        if started is None:
+            return False
+        conversation_id = started["conversation_id"]
+
+        async def send(step: str, message: str) -> bool:
+            body = {"message": message, "conversation_id": conversation_id}
+            return await self.request(f"POST /send_message [{step}]", "POST", "/send_message", body) is not None
+
+        if not await send("url", f"Teach me from {page_url}"):
+            return False
+        if not await send("accept", "The outline looks good, let's start."):
+            return False
+        for _ in range(chapters):
+            if not await send("got it", "Got it, thanks."):
+                return False
+            if not await send("answers", "1. A 2. C 3. B"):
+                return False
+        await self.request("GET /fetch_conversations", "GET", "/fetch_conversations")
+        await self.request("POST /load_conversation", "POST", "/load_conversation", {"conversation_id": conversation_id})
+        return True
+
+
+async def run(args, fixtures: FixtureServer) -> dict:
+    import backend
+    from metrics import AGENT_SECONDS, MODEL_TOKENS, TOOL_CALL_SECONDS
+    from speculative_quiz import speculation_stats
+    from model_client import set_model_client
+    from benchmarks.scripted_model_client import ScriptedModelClient
+
+    model_client = ScriptedModelClient(
+        base_ms=args.model_base_ms, ms_per_token=args.model_ms_per_token, completion_tokens=args.completion_tokens
+    )
+    await set_model_client(model_client)
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    pages = [fixtures.url(page) for page in args.pages]
+    remaining = iter(range(args.sessions))
+    completed = 0
+
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=args.timeout) as client:
+
+        async def user():
+            nonlocal completed
+            for index in remaining:
+                if await Session(client, latencies, errors).run(pages[index % len(pages)], args.chapters):
+                    completed += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*[user() for _ in range(args.users)])
+        wall_time = time.perf_counter() - started
+
+    endpoints = {
+        label: {
+            "requests": len(values),
+            "errors": errors[label],
+            "p50_ms": round(statistics.median(values), 1),
+            "p95_ms": round(percentile(values, 0.95), 1),
+            "p99_ms": round(percentile(values, 0.99), 1),
+            "max_ms": round(max(values), 1),
+        }
+        for label, values in latencies.items()
+    }
+    for label, count in errors.items():
+        endpoints.setdefault(label, {"requests": 0, "errors": count})
+
+    tokens = MODEL_TOKENS.totals()
+    agents = {}
+    for (agent,), (turns, seconds) in sorted(AGENT_SECONDS.totals().items()):
+        agents[agent] = {
+            "turns": turns,
+            "total_s": round(seconds, 3),
+            "mean_ms": round(seconds / turns * 1000, 1),
+            "model_calls": model_client.calls.get(agent, 0),
+            "prompt_tokens": tokens.get((agent, "prompt"), 0),
+            "completion_tokens": tokens.get((agent, "completion"), 0),
+        }
+    tools = {
+        f"{agent}/{tool}": {"calls": calls, "mean_ms": round(seconds / calls * 1000, 1)}
+        for (agent, tool), (calls, seconds) in sorted(TOOL_CALL_SECONDS.totals().items())
+    }
+    requests = sum(len(values) for values in latencies.values())
+    return {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "wall_time_s": round(wall_time, 3),
+        "sessions_completed": completed,
+        "requests": requests,
+        "requests_per_s": round(requests / wall_time, 2),
+        "sessions_per_min": round(completed / wall_time * 60, 2),
+        "endpoints": endpoints,
+        "agents": agents,
+        "tools": tools,
+        "speculation": speculation_stats(),
+    }
+
+
+def print_report(results: dict) -> None:
+    config = results["config"]
+    print(
+        f"{config['users']} users, {results['sessions_completed']}/{config['sessions']} sessions, "
+        f"{config['chapters']} chapters each, {config['store']} store, model {config['model_base_ms']:g} ms + "
+        f"{config['model_ms_per_token']:g} ms/token, LLM cleaner {'on' if config['llm_cleaner'] else 'off'}, "
+        f"speculative quiz {'off' if config['no_speculative_quiz'] else 'on'}, "
+        f"URL pre-routing {'off' if config['no_url_pre_routing'] else 'on'}"
+    )
+    print(
+        f"{results['requests']} requests in {results['wall_time_s']:.1f} s: "
+        f"{results['requests_per_s']:.2f} requests/s, {results['sessions_per_min']:.1f} sessions/min"
+    )
+    print()
+    print(f"{'endpoint':<34}{'requests':>9}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for label, row in results["endpoints"].items():
+        if not row["requests"]:
+            print(f"{label:<34}{0:>9}{row['errors']:>8}")
+            continue
+        print(
+            f"{label:<34}{row['requests']:>9}{row['errors']:>8}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+            f"{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}"
+        )
+    print()
+    print(f"{'agent':<24}{'turns':>7}{'total s':>10}{'mean ms':>10}{'calls':>8}{'prompt tok':>12}{'compl. tok':>12}")
+    for agent, row in results["agents"].items():
+        print(
+            f"{agent:<24}{row['turns']:>7}{row['total_s']:>10.2f}{row['mean_ms']:>10.1f}{row['model_calls']:>8}"
+            f"{row['prompt_tokens']:>12}{row['completion_tokens']:>12}"
+        )
+    print()
+    print(f"{'tool call':<52}{'calls':>7}{'mean ms':>10}")
+    for tool, row in results["tools"].items():
+        print(f"{tool:<52}{row['calls']:>7}{row['mean_ms']:>10.1f}")
+    speculation = results["speculation"]
+    if speculation["started"]:
+        print()
+        print(
+            f"speculative quizzes: {speculation['started']} started ({speculation['skipped']} skipped), "
+            f"{speculation['served']} served, {speculation['missed']} missed, {speculation['discarded']} discarded, "
+            f"{speculation['failed']} failed, {speculation['pending']} pending, hit rate {speculation['hit_rate']:.0%}, "
+            f"{speculation['avg_latency_saved_seconds'] * 1000:.0f} ms saved per hit"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=8, help="Concurrent simulated users.")
+    parser.add_argument("--sessions", type=int, default=16, help="Sessions to run in total.")
+    parser.add_argument("--chapters", type=int, default=2, help="Chapters (explanation and quiz) per session.")
+    parser.add_argument("--pages", nargs="+", default=DEFAULT_PAGES, help="Fixture pages the sessions learn from.")
+    parser.add_argument("--model-base-ms", type=float, default=300, help="Latency of every model call.")
+    parser.add_argument("--model-ms-per-token", type=float, default=5, help="Added latency per completion token.")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="Completion tokens of text replies.")
+    parser.add_argument("--llm-cleaner", action="store_true", help="Clean pages with the data cleaning agent.")
+    parser.add_argument("--no-speculative-quiz", action="store_true", help="Generate quizzes only when asked for.")
+    parser.add_argument("--no-url-pre-routing", action="store_true", help="Let the agents route URLs.")
+    parser.add_argument("--store", choices=["sqlite", "files", "redis"], default="sqlite", help="Conversation store.")
+    parser.add_argument("--timeout", type=float, default=300, help="Request timeout in seconds.")
+    parser.add_argument("--output", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    redis = RedisStandIn() if args.store == "redis" else nullcontext()
+    with tempfile.TemporaryDirectory() as directory, FixtureServer() as fixtures, redis:
+        store_paths = {
+            "sqlite": os.path.join(directory, "conversations.db"),
+            "files": os.path.join(directory, "conversations"),
+            "redis": redis.url if args.store == "redis" else None,
+        }
+        settings = {
+            "CONVERSATION_STORE": args.store,
+            "CONVERSATION_STORE_PATH": store_paths[args.store],
+            "SCRAPE_CACHE_DIR": os.path.join(directory, "scrape_cache"),
+            "JOB_STORE_PATH": os.path.join(directory, "jobs.db"),
+            "BROWSER_POOL_SIZE": "0",
+            "USE_LLM_CLEANER": "true" if args.llm_cleaner else "false",
+        }
+        os.environ.update(settings)
+        import ai_teacher
+
+        # ai_teacher loads .env with override; the benchmark's settings take precedence again.
+        os.environ.update(settings)
+        ai_teacher.USE_LLM_CLEANER = args.llm_cleaner
+        ai_teacher.SPECULATIVE_QUIZ = not args.no_speculative_quiz
+        ai_teacher.URL_PRE_ROUTING = not args.no_url_pre_routing
+
+        results = asyncio.run(run(args, fixtures))
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Compares single-shot course outlining with the map-reduce path of outline_map_reduce
+on a large document built from the saved fixtures.
+
+- `single-shot`: one outline request with the whole document in the prompt.
+- `map-reduce`: concurrent section summaries (condense_document) followed by one outline
+  request over the summaries.
+
+By default requests go to a simulated model whose latency is
+`--base-ms + prompt tokens x --prefill-ms + output tokens x --decode-ms`, scaled by
+`--time-scale` so the benchmark finishes quickly. `--live` sends real requests through
+the configured Azure OpenAI deployment instead.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_outline_map_reduce [--scale 20] [--concurrency 1 4 8] [--live]
+
+The table reports wall time, the number of model calls, the largest prompt of a single
+call (compare it with `--context-window`) and the total prompt tokens billed.
+"""
+import os
+import glob
+import time
+import asyncio
+import argparse
+
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    ModelCapabilities,
+    RequestUsage,
+    SystemMessage,
+    UserMessage,
+)
+
+from agent_templates import COURSE_OUTLINE_AGENT
+from content_extractor import extract_main_content
+from context_compaction import count_tokens
+from html_to_markdown import html_to_markdown
+from outline_map_reduce import condense_document
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+class SimulatedModelClient(ChatCompletionClient):
+    """Answers every request with filler text after a latency derived from the prompt and output sizes."""
+
+    def __init__(self, base_ms: float, prefill_ms: float, decode_ms: float, output_tokens: int, time_scale: float):
+        self.base_ms = base_ms
+        self.prefill_ms = prefill_ms
+        self.decode_ms = decode_ms
+        self.output_tokens = output_tokens
+        self.time_scale = time_scale
+        self._usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+
+    async def create(self, messages, *, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        prompt_tokens = sum(count_tokens(message.content) for message in messages if isinstance(message.content, str))
+        output_tokens = min(self.output_tokens, extra_create_args.get("max_tokens", self.output_tokens))
+        latency_ms = self.base_ms + prompt_tokens * self.prefill_ms + output_tokens * self.decode_ms
+        await asyncio.sleep(latency_ms * self.time_scale / 1000)
+        usage = RequestUsage(prompt_tokens=prompt_tokens, completion_tokens=output_tokens)
+        self._usage = RequestUsage(
+            prompt_tokens=self._usage.prompt_tokens + prompt_tokens,
+            completion_tokens=self._usage.completion_tokens + output_tokens,
+        )
+        return CreateResult(finish_reason="stop", content="- point " * (output_tokens // 2), usage=usage, cached=False)
+
+    def create_stream(self, *args, **kwargs):
+        raise NotImplementedError
+
+    def actual_usage(self) -> RequestUsage:
+        return self._usage
+
+    def total_usage(self) -> RequestUsage:
+        return self._usage
+
+    def count_tokens(self, messages, *, tools=[]) -> int:
+        return sum(count_tokens(message.content) for message in messages if isinstance(message.content, str))
+
+    def remaining_tokens(self, messages, *, tools=[]) -> int:
+        return 128000 - self.count_tokens(messages)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:
+        return {"vision": False, "function_calling": True, "json_output": True}
+
+    @property
+    def model_info(self):
+        return {"vision": False, "function_calling": True, "json_output": True, "family": "unknown"}
+
+
+class RecordingClient:
+    """Wraps a model client and records the prompt size of every request."""
+
+    def __init__(self, client: ChatCompletionClient):
+        self.client = client
+        self.prompt_tokens = []
+
+    async def create(self, messages, **kwargs):
+        self.prompt_tokens.append(
+            sum(count_tokens(message.content) for message in messages if isinstance(message.content, str))
+        )
+        return await self.client.create(messages, **kwargs)
+
+
+def load_document(scale: int) -> str:
+    texts = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.html"))):
+        with open(path, encoding="utf-8") as file:
+            texts.append(extract_main_content(html_to_markdown(file.read(), "https://example.com/")))
+    return "\n".join(texts * scale)
+
+
+async def outline(client, document: str, outline_tokens: int):
+    messages = [
+        SystemMessage(content=COURSE_OUTLINE_AGENT.system_message),
+        UserMessage(content=document, source="web_scraping_agent"),
+    ]
+    return await client.create(messages, extra_create_args={"max_tokens": outline_tokens})
+
+
+async def single_shot(client, document: str, outline_tokens: int):
+    await outline(client, document, outline_tokens)
+
+
+async def map_reduce(client, document: str, outline_tokens: int):
+    condensed = await condense_document(document, client)
+    await outline(client, condensed, outline_tokens)
+
+
+async def run(args):
+    if args.live:
+        from dotenv import load_dotenv
+        from model_client import get_model_client
+
+        load_dotenv()
+        client = get_model_client()
+    else:
+        client = SimulatedModelClient(args.base_ms, args.prefill_ms, args.decode_ms, args.outline_tokens, args.time_scale)
+    document = load_document(args.scale)
+    print(f"document: {count_tokens(document)} tokens, context window: {args.context_window} tokens")
+    # Always take the map-reduce path for this comparison.
+    os.environ["OUTLINE_MAP_REDUCE_THRESHOLD"] = "0"
+
+    print(f"{'path':<16}{'concurrency':>12}{'wall s':>10}{'calls':>7}{'max prompt':>12}{'prompt total':>14}{'fits':>6}")
+    runs = [("single-shot", None)] + [("map-reduce", concurrency) for concurrency in args.concurrency]
+    for name, concurrency in runs:
+        recorder = RecordingClient(client)
+        if concurrency is not None:
+            os.environ["OUTLINE_MAP_CONCURRENCY"] = str(concurrency)
+        started = time.perf_counter()
+        if concurrency is None:
+            await single_shot(recorder, document, args.outline_tokens)
+        else:
+            await map_reduce(recorder, document, args.outline_tokens)
+        elapsed = (time.perf_counter() - started) / (1 if args.live else args.time_scale)
+        largest = max(recorder.prompt_tokens)
+        print(
+            f"{name:<16}{concurrency or 1:>12}{elapsed:>10.2f}{len(recorder.prompt_tokens):>7}"
+            f"{largest:>12}{sum(recorder.prompt_tokens):>14}{'yes' if largest <= args.context_window else 'no':>6}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=20, help="Concatenate the fixtures this many times.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--outline-tokens", type=int, default=800, help="Output tokens of an outline.")
+    parser.add_argument("--context-window", type=int, default=128000)
+    parser.add_argument("--base-ms", type=float, default=400.0, help="Simulated per-request latency.")
+    parser.add_argument("--prefill-ms", type=float, default=0.05, help="Simulated latency per prompt token.")
+    parser.add_argument("--decode-ms", type=float, default=15.0, help="Simulated latency per output token.")
+    parser.add_argument("--time-scale", type=float, default=0.02, help="Fraction of simulated latency to sleep.")
+    parser.add_argument("--live", action="store_true", help="Send real requests to the configured deployment.")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark: bytes written per turn when saving the team state of a long conversation.
+
+- `full`: the previous behaviour. Every turn writes the complete team state.
+- `log`: the current behaviour. Every turn appends its delta (the new messages) to the state log,
+  and a full snapshot is written every `--snapshot-interval` turns.
+
+Team states grow like a Swarm team's: each turn adds messages to the manager's message thread and
+to the agents' buffers and model contexts. Both modes write to a temporary store of each backend,
+and the time to rehydrate the final state (snapshot plus replayed log) is reported.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_state_persistence [--turns 200] [--snapshot-interval 20]
+"""
+import os
+import time
+import argparse
+import tempfile
+import statistics
+
+from conversation_store import FileConversationStore, SQLiteConversationStore
+from state_log import StateWriter, persistence_stats
+
+AGENTS = ["master_agent", "web_scraping_agent", "data_cleaning_agent", "course_outline_agent", "topic_explainer", "quiz_agent"]
+
+
+def make_state(conversation_id: str) -> dict:
+    """An empty team state shaped like the one `Swarm.save_state` returns."""
+    agent_states = {
+        f"group_chat_manager/{conversation_id}": {
+            "type": "SwarmManagerState",
+            "version": "1.0.0",
+            "message_thread": [],
+            "current_turn": 0,
+            "current_speaker": "master_agent",
+        },
+        f"collect_output_messages/{conversation_id}": {},
+    }
+    for agent in AGENTS:
+        agent_states[f"{agent}/{conversation_id}"] = {
+            "type": "ChatAgentContainerState",
+            "version": "1.0.0",
+            "agent_state": {"type": "AssistantAgentState", "version": "1.0.0", "llm_context": {"messages": []}},
+            "message_buffer": [],
+        }
+    return {"type": "TeamState", "version": "1.0.0", "agent_states": agent_states, "team_id": conversation_id}
+
+
+def next_turn(state: dict, conversation_id: str, turn: int, words: int) -> dict:
+    """Returns a new state with one more user message, agent reply and handoff."""
+    agent = AGENTS[3 + turn % 3]
+    user = {"source": "user", "models_usage": None, "content": f"Message {turn}", "type": "TextMessage"}
+    reply = {
+        "source": agent,
+        "models_usage": {"prompt_tokens": 1000 + turn, "completion_tokens": words},
+        "content": f"Chapter {turn}: " + "explanation " * words,
+        "type": "TextMessage",
+    }
+    handoff = {"source": agent, "models_usage": None, "target": "user", "content": "Transferred to user.", "type": "HandoffMessage"}
+
+    agent_states = state["agent_states"]
+    manager = agent_states[f"group_chat_manager/{conversation_id}"]
+    new_state = {**state, "agent_states": dict(agent_states)}
+    new_state["agent_states"][f"group_chat_manager/{conversation_id}"] = {
+        **manager,
+        "message_thread": [*manager["message_thread"], user, reply, handoff],
+        "current_speaker": agent,
+    }
+    container = agent_states[f"{agent}/{conversation_id}"]
+    context = container["agent_state"]["llm_context"]["messages"]
+    new_state["agent_states"][f"{agent}/{conversation_id}"] = {
+        **container,
+        "agent_state": {
+            **container["agent_state"],
+            "llm_context": {"messages": [*context, {"content": user["content"], "source": "user", "type": "UserMessage"},
+                                         {"content": reply["content"], "source": agent, "type": "AssistantMessage"}]},
+        },
+        # The buffer is emptied when the agent runs
+        "message_buffer": [],
+    }
+    return new_state
+
+
+def run_mode(store, mode: str, args) -> tuple[list[int], list[float], float]:
+    conversation_id = f"bench-{mode}"
+    writer = StateWriter(snapshot_interval=1 if mode == "full" else args.snapshot_interval)
+    state = make_state(conversation_id)
+    sizes, durations = [], []
+    for turn in range(args.turns):
+        state = next_turn(state, conversation_id, turn, args.words)
+        before = persistence_stats()
+        started = time.perf_counter()
+        writer.write(store, conversation_id, "Benchmark", state, title_changed=False)
+        durations.append((time.perf_counter() - started) * 1000)
+        after = persistence_stats()
+        sizes.append(after["snapshot_bytes"] + after["delta_bytes"] - before["snapshot_bytes"] - before["delta_bytes"])
+
+    started = time.perf_counter()
+    restored = store.get_state(conversation_id)
+    load_ms = (time.perf_counter() - started) * 1000
+    assert restored == state, "Rehydrated state differs from the last saved state"
+    return sizes, durations, load_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--words", type=int, default=300, help="Words per agent reply.")
+    parser.add_argument("--snapshot-interval", type=int, default=20)
+    args = parser.parse_args()
+
+    checkpoints = sorted({turn for turn in (10, 50, 100, 200, args.turns) if turn <= args.turns})
+    print(f"{args.turns} turns, {args.words} words per reply, snapshot every {args.snapshot_interval} turns")
+    print(f"{'store':<8}{'mode':<6}" + "".join(f"{f'turn {turn} KB':>13}" for turn in checkpoints)
+          + f"{'avg KB':>9}{'total MB':>10}{'avg ms':>8}{'p99 ms':>8}{'load ms':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        stores = {
+            "sqlite": SQLiteConversationStore(os.path.join(directory, "conversations.db")),
+            "files": FileConversationStore(os.path.join(directory, "conversations")),
+        }
+        for name, store in stores.items():
+            for mode in ("full", "log"):
+                sizes, durations, load_ms = run_mode(store, mode, args)
+                ordered = sorted(durations)
+                print(
+                    f"{name:<8}{mode:<6}" + "".join(f"{sizes[turn - 1] / 1024:>13.1f}" for turn in checkpoints)
+                    + f"{statistics.mean(sizes) / 1024:>9.1f}{sum(sizes) / 1024 / 1024:>10.1f}"
+                    f"{statistics.mean(durations):>8.2f}{ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]:>8.2f}"
+                    f"{load_ms:>9.1f}"
+                )
+            store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Measures the cost of constructing an AITeacher, which happens on every new conversation
+and on every cold rehydrate in /send_message.
+
+- `legacy` reproduces the previous construction: a new AzureOpenAIChatCompletionClient per
+  team (with its own HTTP connection pool and TLS context) and six agents whose handoff and
+  scrape tools are rebuilt from plain names and functions.
+- `shared` is the current AITeacher(): the process-wide model client and agents instantiated
+  from prebuilt templates.
+
+No requests are sent; placeholder Azure settings are used when none are configured.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_teacher_construction [--repeat 100]
+"""
+import os
+import time
+import argparse
+import tempfile
+
+for name, value in {
+    "AZURE_DEPLOYMENT": "benchmark",
+    "MODEL": "gpt-4o",
+    "API_VERSION": "2024-06-01",
+    "AZURE_ENDPOINT": "https://benchmark.openai.azure.com",
+    "API_KEY": "benchmark",
+}.items():
+    os.environ.setdefault(name, value)
+
+from autogen_agentchat.agents import AssistantAgent
+from autogen_agentchat.conditions import HandoffTermination, TextMentionTermination
+from autogen_agentchat.teams import Swarm
+from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
+
+import agent_templates
+from ai_teacher import AITeacher, scrape_content_from_url
+from conversation_store import FileConversationStore
+
+TEMPLATES = [
+    agent_templates.MASTER_AGENT,
+    agent_templates.WEB_SCRAPING_AGENTS[False],
+    agent_templates.DATA_CLEANING_AGENT,
+    agent_templates.COURSE_OUTLINE_AGENT,
+    agent_templates.TOPIC_EXPLAINER_AGENT,
+    agent_templates.QUIZ_AGENT,
+]
+
+
+def legacy_construction() -> Swarm:
+    """The pre-existing construction: a new client and freshly built agents for every team."""
+    client = AzureOpenAIChatCompletionClient(
+        azure_deployment=os.getenv("AZURE_DEPLOYMENT"),
+        model=os.getenv("MODEL"),
+        api_version=os.getenv("API_VERSION"),
+        azure_endpoint=os.getenv("AZURE_ENDPOINT"),
+        api_key=os.getenv("API_KEY"),
+    )
+    agents = [
+        AssistantAgent(
+            name=template.name,
+            handoffs=list(template.handoff_targets),
+            model_client=client,
+            tools=[scrape_content_from_url] if template.name == "web_scraping_agent" else None,
+            system_message=template.system_message,
+        )
+        for template in TEMPLATES
+    ]
+    termination = HandoffTermination(target="user") | TextMentionTermination("TERMINATE")
+    return Swarm(agents, termination_condition=termination)
+
+
+def time_call(function, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        store = FileConversationStore(root)
+        # Warm up imports and the shared client so that only per-team work is measured.
+        legacy_construction()
+        AITeacher(store=store)
+
+        legacy = time_call(legacy_construction, args.repeat)
+        shared = time_call(lambda: AITeacher(store=store), args.repeat)
+
+    print(f"{'construction':<16}{'ms/team':>10}")
+    print(f"{'legacy':<16}{legacy * 1000:>10.2f}")
+    print(f"{'shared':<16}{shared * 1000:>10.2f}")
+    print(f"speedup: {legacy / shared:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
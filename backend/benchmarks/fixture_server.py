@@ -0,0 +1,49 @@
+"""
+Serves the saved pages in `benchmarks/fixtures` over local HTTP, so that scrapes go through the real
+fetch, cache and extraction path without reaching the internet.
+"""
+import os
+import threading
+import functools
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer:
+    """
+    A threaded HTTP server on a free local port, used as a context manager:
+
+        with FixtureServer() as server:
+            url = server.url("docs_python_lists.html")
+    """
+
+    def __init__(self, directory: str = FIXTURES_DIR, host: str = "127.0.0.1", port: int = 0):
+        handler = functools.partial(QuietHandler, directory=directory)
+        self.directory = directory
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fixture-server", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, filename: str) -> str:
+        return f"{self.base_url}/{filename}"
+
+    def pages(self) -> list[str]:
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(".html"))
+
+    def __enter__(self) -> "FixtureServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,381 @@
+"""
+A small in-process stand-in for a Redis server, to run the redis conversation store (and several
+workers sharing it) without installing Redis. It speaks RESP2 and implements the commands that
+`conversation_store.RedisConversationStore` uses, including key expiry and WATCH/MULTI/EXEC transactions.
+Data is kept in memory only.
+
+Used as a context manager:
+
+    with RedisStandIn() as server:
+        store = RedisConversationStore(server.url)
+
+or on its own, so that worker processes can share it:
+
+    python -m benchmarks.redis_stand_in [--port 6379]
+"""
+import time
+import argparse
+import threading
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+
+
+class CommandError(Exception):
+    pass
+
+
+class Status(str):
+    """A simple string reply, such as OK."""
+
+
+# Reply of an EXEC whose watched keys changed
+ABORTED = object()
+
+WRONG_TYPE = "WRONGTYPE Operation against a key holding the wrong kind of value"
+
+
+def _index_range(length: int, start: int, stop: int) -> slice:
+    start = max(length + start, 0) if start < 0 else start
+    stop = length + stop if stop < 0 else stop
+    return slice(start, stop + 1)
+
+
+def encode(reply) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if reply is ABORTED:
+        return b"*-1\r\n"
+    if isinstance(reply, CommandError):
+        return f"-{reply}\r\n".encode()
+    if isinstance(reply, Status):
+        return f"+{reply}\r\n".encode()
+    if isinstance(reply, bool):
+        return f":{int(reply)}\r\n".encode()
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    if isinstance(reply, str):
+        reply = reply.encode()
+    if isinstance(reply, bytes):
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    if isinstance(reply, list):
+        return b"*%d\r\n" % len(reply) + b"".join(encode(item) for item in reply)
+    raise TypeError(f"Cannot encode {reply!r}")
+
+
+class Database:
+    """The keyspace. Every command runs under one lock, so commands and transactions are atomic."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._data: dict[bytes, object] = {}
+        self._expires: dict[bytes, float] = {}
+        # Incremented whenever a key is written, deleted or expires, for WATCH
+        self._versions: dict[bytes, int] = {}
+
+    def version(self, key: bytes) -> int:
+        self._get(key)
+        return self._versions.get(key, 0)
+
+    def _touch(self, key: bytes) -> None:
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+    def _get(self, key: bytes, kind: type | None = None):
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self._delete(key)
+        value = self._data.get(key)
+        if value is not None and kind is not None and not isinstance(value, kind):
+            raise CommandError(WRONG_TYPE)
+        return value
+
+    def _delete(self, key: bytes) -> bool:
+        self._expires.pop(key, None)
+        if self._data.pop(key, None) is None:
+            return False
+        self._touch(key)
+        return True
+
+    def _container(self, key: bytes, kind: type):
+        value = self._get(key, kind)
+        if value is None:
+            value = self._data[key] = kind()
+        self._touch(key)
+        return value
+
+    def execute(self, name: str, args: list[bytes]):
+        handler = getattr(self, f"command_{name}", None)
+        if handler is None:
+            raise CommandError(f"ERR unknown command '{name}'")
+        try:
+            return handler(*args)
+        except TypeError:
+            raise CommandError(f"ERR wrong number of arguments for '{name}' command")
+
+    # Server
+    def command_ping(self, message: bytes | None = None):
+        return Status("PONG") if message is None else message
+
+    def command_client(self, *args):
+        return Status("OK")
+
+    def command_select(self, index: bytes):
+        return Status("OK")
+
+    def command_flushall(self, *args):
+        for key in list(self._data):
+            self._delete(key)
+        return Status("OK")
+
+    command_flushdb = command_flushall
+
+    def command_dbsize(self):
+        return sum(1 for key in list(self._data) if self._get(key) is not None)
+
+    # Keys
+    def command_del(self, *keys: bytes):
+        return sum(self._delete(key) for key in keys)
+
+    def command_exists(self, *keys: bytes):
+        return sum(self._get(key) is not None for key in keys)
+
+    def command_pexpire(self, key: bytes, milliseconds: bytes):
+        if self._get(key) is None:
+            return 0
+        self._expires[key] = time.time() + int(milliseconds) / 1000
+        self._touch(key)
+        return 1
+
+    def command_pttl(self, key: bytes):
+        if self._get(key) is None:
+            return -2
+        expires_at = self._expires.get(key)
+        return -1 if expires_at is None else int((expires_at - time.time()) * 1000)
+
+    # Strings
+    def command_get(self, key: bytes):
+        return self._get(key, bytes)
+
+    def command_set(self, key: bytes, value: bytes, *options: bytes):
+        options = [option.upper() for option in options]
+        exists = self._get(key) is not None
+        if (b"NX" in options and exists) or (b"XX" in options and not exists):
+            return None
+        expires_at = None
+        for unit, scale in ((b"PX", 1000), (b"EX", 1)):
+            if unit in options:
+                expires_at = time.time() + int(options[options.index(unit) + 1]) / scale
+        self._delete(key)
+        self._data[key] = value
+        if expires_at is not None:
+            self._expires[key] = expires_at
+        self._touch(key)
+        return Status("OK")
+
+    # Hashes
+    def command_hget(self, key: bytes, field: bytes):
+        return (self._get(key, dict) or {}).get(field)
+
+    def command_hmget(self, key: bytes, *fields: bytes):
+        values = self._get(key, dict) or {}
+        return [values.get(field) for field in fields]
+
+    def command_hgetall(self, key: bytes):
+        return [item for pair in (self._get(key, dict) or {}).items() for item in pair]
+
+    def command_hset(self, key: bytes, *pairs: bytes):
+        if not pairs or len(pairs) % 2:
+            raise TypeError
+        values = self._container(key, dict)
+        added = 0
+        for field, value in zip(pairs[::2], pairs[1::2]):
+            added += field not in values
+            values[field] = value
+        return added
+
+    def command_hsetnx(self, key: bytes, field: bytes, value: bytes):
+        if field in (self._get(key, dict) or {}):
+            return 0
+        self._container(key, dict)[field] = value
+        return 1
+
+    def command_hdel(self, key: bytes, *fields: bytes):
+        values = self._get(key, dict)
+        if values is None:
+            return 0
+        removed = sum(values.pop(field, None) is not None for field in fields)
+        if not values:
+            self._delete(key)
+        elif removed:
+            self._touch(key)
+        return removed
+
+    # Lists
+    def command_rpush(self, key: bytes, *values: bytes):
+        if not values:
+            raise TypeError
+        items = self._container(key, list)
+        items.extend(values)
+        return len(items)
+
+    def command_lrange(self, key: bytes, start: bytes, stop: bytes):
+        items = self._get(key, list) or []
+        return items[_index_range(len(items), int(start), int(stop))]
+
+    def command_llen(self, key: bytes):
+        return len(self._get(key, list) or [])
+
+    # Sorted sets, as {member: score}
+    def command_zadd(self, key: bytes, *args: bytes):
+        options = set()
+        while args and args[0].upper() in (b"NX", b"XX"):
+            options.add(args[0].upper())
+            args = args[1:]
+        if not args or len(args) % 2:
+            raise TypeError
+        scores = self._container(key, dict)
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            exists = member in scores
+            if (b"NX" in options and exists) or (b"XX" in options and not exists):
+                continue
+            added += not exists
+            scores[member] = float(score)
+        return added
+
+    def command_zrange(self, key: bytes, start: bytes, stop: bytes):
+        scores = self._get(key, dict) or {}
+        members = sorted(scores, key=lambda member: (scores[member], member))
+        return members[_index_range(len(members), int(start), int(stop))]
+
+    def command_zrem(self, key: bytes, *members: bytes):
+        scores = self._get(key, dict)
+        if scores is None:
+            return 0
+        removed = sum(scores.pop(member, None) is not None for member in members)
+        if not scores:
+            self._delete(key)
+        elif removed:
+            self._touch(key)
+        return removed
+
+
+class Handler(StreamRequestHandler):
+    def _read_command(self) -> list[bytes] | None:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline command, as sent by telnet
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        database: Database = self.server.database
+        # Versions of the watched keys, and the commands queued since MULTI (None outside a transaction)
+        watched: dict[bytes, int] = {}
+        queued: list | None = None
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            if not args:
+                continue
+            name, args = args[0].decode().lower(), args[1:]
+            if name == "multi":
+                reply = CommandError("ERR MULTI calls can not be nested") if queued is not None else Status("OK")
+                queued = [] if queued is None else queued
+            elif name == "discard":
+                reply = Status("OK") if queued is not None else CommandError("ERR DISCARD without MULTI")
+                queued = None
+                watched.clear()
+            elif name == "watch":
+                if queued is not None:
+                    reply = CommandError("ERR WATCH inside MULTI is not allowed")
+                else:
+                    with database.lock:
+                        for key in args:
+                            watched.setdefault(key, database.version(key))
+                    reply = Status("OK")
+            elif name == "unwatch":
+                watched.clear()
+                reply = Status("OK")
+            elif name == "exec":
+                if queued is None:
+                    reply = CommandError("ERR EXEC without MULTI")
+                else:
+                    with database.lock:
+                        if any(database.version(key) != version for key, version in watched.items()):
+                            reply = ABORTED
+                        else:
+                            reply = []
+                            for queued_name, queued_args in queued:
+                                try:
+                                    reply.append(database.execute(queued_name, queued_args))
+                                except CommandError as e:
+                                    reply.append(e)
+                    queued = None
+                    watched.clear()
+            elif queued is not None:
+                queued.append((name, args))
+                reply = Status("QUEUED")
+            else:
+                try:
+                    with database.lock:
+                        reply = database.execute(name, args)
+                except CommandError as e:
+                    reply = e
+            self.wfile.write(encode(reply))
+            self.wfile.flush()
+
+
+class StandInServer(ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, Handler)
+        self.database = Database()
+
+
+class RedisStandIn:
+    """A stand-in Redis server on a local port (a free one by default), run in a background thread."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self._server = StandInServer((host, port))
+        self._thread = threading.Thread(target=self._server.serve_forever, name="redis-stand-in", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def __enter__(self) -> "RedisStandIn":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    server = StandInServer((args.host, args.port))
+    host, port = server.server_address[:2]
+    print(f"Redis stand-in listening on redis://{host}:{port}/0")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
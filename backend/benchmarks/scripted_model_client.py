@@ -0,0 +1,189 @@
+"""
+A scripted stand-in for the Azure OpenAI chat completion client, for benchmarks that run without a model.
+
+Each request is answered according to the agent that sent it (recognized by its system prompt) and the
+last message in its context, so a team goes through the same handoffs as with a real model:
+
+    master_agent -> web_scraping_agent -> data_cleaning_agent (with the LLM cleaner) -> course_outline_agent
+    -> topic_explainer <-> quiz_agent
+
+User messages steer the conversation like they would steer the real agents:
+  - a message with a URL starts a course,
+  - a message containing "looks good" accepts the outline,
+  - a message containing "got it" finishes a chapter and starts its quiz,
+  - any other message to the quiz agent is taken as answers, after which the next chapter is explained.
+
+Every request waits `base_ms + completion tokens x ms_per_token` milliseconds before answering.
+"""
+import re
+import json
+import uuid
+import asyncio
+
+from autogen_core import FunctionCall
+from autogen_core.models import (
+    AssistantMessage,
+    ChatCompletionClient,
+    CreateResult,
+    FunctionExecutionResultMessage,
+    ModelCapabilities,
+    RequestUsage,
+    SystemMessage,
+    UserMessage,
+)
+
+from agent_templates import (
+    COURSE_OUTLINE_AGENT,
+    DATA_CLEANING_AGENT,
+    MASTER_AGENT,
+    QUIZ_AGENT,
+    TOPIC_EXPLAINER_AGENT,
+    WEB_SCRAPING_AGENTS,
+)
+
+AGENTS_BY_PROMPT = {
+    template.system_message: template.name
+    for template in (
+        MASTER_AGENT, *WEB_SCRAPING_AGENTS.values(), DATA_CLEANING_AGENT, COURSE_OUTLINE_AGENT, TOPIC_EXPLAINER_AGENT, QUIZ_AGENT
+    )
+}
+
+URL_PATTERN = re.compile(r"https?://\S+")
+# Completion tokens of a tool call
+TOOL_CALL_TOKENS = 20
+
+
+def _text(content) -> str:
+    return content if isinstance(content, str) else ""
+
+
+def _approximate_tokens(messages) -> int:
+    # About four characters per token; exact counts are not worth the CPU time in a load test.
+    return sum(len(_text(message.content)) for message in messages) // 4
+
+
+class ScriptedModelClient(ChatCompletionClient):
+    """Answers requests of the teaching agents from a script, after a simulated latency."""
+
+    def __init__(self, base_ms: float = 300, ms_per_token: float = 5, completion_tokens: int = 200):
+        self.base_ms = base_ms
+        self.ms_per_token = ms_per_token
+        self.completion_tokens = completion_tokens
+        self.calls: dict[str, int] = {}
+        self._usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+
+    async def create(self, messages, *, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        system = next((message.content for message in messages if isinstance(message, SystemMessage)), "")
+        agent = AGENTS_BY_PROMPT.get(system.strip())
+        if agent is None:
+            # A request made outside the team, such as a section summary of a long page
+            result = self._reply("- summary point " * (self.completion_tokens // 3))
+        else:
+            self.calls[agent] = self.calls.get(agent, 0) + 1
+            result = self._script(agent, messages, [tool.name for tool in tools])
+
+        usage = RequestUsage(prompt_tokens=_approximate_tokens(messages), completion_tokens=result.usage.completion_tokens)
+        self._usage = RequestUsage(
+            prompt_tokens=self._usage.prompt_tokens + usage.prompt_tokens,
+            completion_tokens=self._usage.completion_tokens + usage.completion_tokens,
+        )
+        await asyncio.sleep((self.base_ms + usage.completion_tokens * self.ms_per_token) / 1000)
+        return CreateResult(finish_reason=result.finish_reason, content=result.content, usage=usage, cached=False)
+
+    def _script(self, agent: str, messages, tool_names: list[str]) -> CreateResult:
+        last = messages[-1]
+        own_reply = isinstance(last, AssistantMessage) and isinstance(last.content, str)
+        tool_result = isinstance(last, FunctionExecutionResultMessage)
+        from_user = isinstance(last, UserMessage) and last.source == "user"
+        user_text = _text(last.content).lower() if from_user else ""
+
+        if agent == "master_agent":
+            if own_reply:
+                return self._call("transfer_to_user")
+            if URL_PATTERN.search(user_text):
+                return self._call("transfer_to_web_scraping_agent")
+            return self._reply("Welcome! Send me a link to the material you want to learn from.", words=12)
+
+        if agent == "web_scraping_agent":
+            if tool_result or own_reply:
+                return self._call(next(name for name in tool_names if name.startswith("transfer_to_")))
+            url = next(
+                URL_PATTERN.search(_text(message.content)).group(0)
+                for message in reversed(messages)
+                if isinstance(message, UserMessage) and URL_PATTERN.search(_text(message.content))
+            )
+            return self._call("scrape_content_from_url", {"url": url})
+
+        if agent == "data_cleaning_agent":
+            if own_reply:
+                return self._call("transfer_to_course_outline_agent")
+            page = max((_text(message.content) for message in messages if isinstance(message, UserMessage)), key=len)
+            return self._reply("Cleaned content: " + " ".join(page.split()[: self.completion_tokens]))
+
+        if agent == "course_outline_agent":
+            if own_reply:
+                return self._call("transfer_to_user")
+            if "looks good" in user_text:
+                return self._call("transfer_to_topic_explainer")
+            return self._reply("Course outline:\n" + "".join(f"{index}. Chapter {index}\n" for index in range(1, 6)))
+
+        if agent == "topic_explainer":
+            if own_reply:
+                return self._call("transfer_to_user")
+            if tool_result:
+                return self._reply("Explanation: ")
+            if "got it" in user_text:
+                return self._call("transfer_to_quiz_agent")
+            return self._call("search_course_material", {"query": "Chapter"})
+
+        if agent == "quiz_agent":
+            if own_reply:
+                answered = isinstance(messages[-2], UserMessage) and messages[-2].source == "user"
+                return self._call("transfer_to_topic_explainer" if answered else "transfer_to_user")
+            if tool_result:
+                return self._reply("Quiz: ")
+            if from_user:
+                return self._reply("Feedback: all answers are correct. ", words=30)
+            return self._call("search_course_material", {"query": "Chapter"})
+
+        raise ValueError(f"No script for agent {agent}")
+
+    def _reply(self, prefix: str, words: int | None = None) -> CreateResult:
+        words = self.completion_tokens if words is None else words
+        filler = max(0, words - len(prefix.split()))
+        content = prefix + " ".join(["lorem"] * filler)
+        return CreateResult(
+            finish_reason="stop", content=content, usage=RequestUsage(prompt_tokens=0, completion_tokens=words), cached=False
+        )
+
+    def _call(self, name: str, arguments: dict | None = None) -> CreateResult:
+        call = FunctionCall(id=uuid.uuid4().hex, name=name, arguments=json.dumps(arguments or {}))
+        return CreateResult(
+            finish_reason="function_calls",
+            content=[call],
+            usage=RequestUsage(prompt_tokens=0, completion_tokens=TOOL_CALL_TOKENS),
+            cached=False,
+        )
+
+    def create_stream(self, *args, **kwargs):
+        raise NotImplementedError
+
+    def actual_usage(self) -> RequestUsage:
+        return self._usage
+
+    def total_usage(self) -> RequestUsage:
+        return self._usage
+
+    def count_tokens(self, messages, *, tools=[]) -> int:
+        return _approximate_tokens(messages)
+
+    def remaining_tokens(self, messages, *, tools=[]) -> int:
+        return 128000 - self.count_tokens(messages)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:
+        return {"vision": False, "function_calling": True, "json_output": True}
+
+    @property
+    def model_info(self):
+        return {"vision": False, "function_calling": True, "json_output": True, "family": "unknown"}
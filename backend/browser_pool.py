@@ -0,0 +1,166 @@
+import os
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+from webdriver_manager.chrome import ChromeDriverManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_MAX_PAGES = 50
+DEFAULT_CHECKOUT_TIMEOUT = 60  # seconds
+
+
+class BrowserPoolExhausted(RuntimeError):
+    """Raised when no browser becomes available within the checkout timeout."""
+
+
+class PooledBrowser:
+    """A headless Chrome driver owned by the pool, with the number of pages it has served."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+    def is_healthy(self) -> bool:
+        try:
+            return self.driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def quit(self) -> None:
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logger.warning("Failed to quit browser: %s", e)
+
+
+class BrowserPool:
+    """
+    Fixed-size pool of warm headless Chrome drivers shared by all WebScraper instances.
+    - The chromedriver binary is resolved once, when the pool starts.
+    - Browsers are checked out for a single page load and checked back in afterwards.
+    - A browser that fails its health check, raises during use, or has served `max_pages`
+      pages is quit and replaced with a fresh one.
+    """
+
+    def __init__(
+        self,
+        size: int = DEFAULT_POOL_SIZE,
+        max_pages: int = DEFAULT_MAX_PAGES,
+        checkout_timeout: float = DEFAULT_CHECKOUT_TIMEOUT,
+    ):
+        self.size = size
+        self.max_pages = max_pages
+        self.checkout_timeout = checkout_timeout
+        self.driver_path = None
+        self._idle = queue.Queue()
+        self._all = set()
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+
+    def start(self) -> None:
+        """Resolves the driver binary and launches all browsers. Safe to call more than once."""
+        with self._lock:
+            if self._started:
+                return
+            self.driver_path = ChromeDriverManager().install()
+            self._started = True
+            self._closed = False
+        try:
+            for _ in range(self.size):
+                self._idle.put(self._launch())
+        except Exception:
+            self.shutdown()
+            raise
+        logger.info("Browser pool started with %d browsers.", self.size)
+
+    def _launch(self) -> PooledBrowser:
+        chrome_options = Options()
+        chrome_options.add_argument("--headless")  # Run in headless mode
+        browser = PooledBrowser(webdriver.Chrome(service=Service(self.driver_path), options=chrome_options))
+        with self._lock:
+            self._all.add(browser)
+        return browser
+
+    def _retire(self, browser: PooledBrowser) -> None:
+        with self._lock:
+            self._all.discard(browser)
+        browser.quit()
+
+    @contextmanager
+    def browser(self):
+        """Checks out a healthy driver for the duration of the `with` block."""
+        if not self._started:
+            self.start()
+        try:
+            browser = self._idle.get(timeout=self.checkout_timeout)
+        except queue.Empty:
+            raise BrowserPoolExhausted(f"No browser available after {self.checkout_timeout} seconds")
+
+        healthy = True
+        try:
+            if not browser.is_healthy():
+                logger.info("Replacing unhealthy browser.")
+                self._retire(browser)
+                browser = self._launch()
+            browser.pages += 1
+            yield browser.driver
+        except BaseException:
+            # Page errors are common; only recycle the browser if it is actually broken.
+            healthy = browser.is_healthy()
+            raise
+        finally:
+            self._check_in(browser, healthy)
+
+    def _check_in(self, browser: PooledBrowser, healthy: bool) -> None:
+        if self._closed:
+            self._retire(browser)
+            return
+        if not healthy or browser.pages >= self.max_pages:
+            self._retire(browser)
+            try:
+                browser = self._launch()
+            except Exception as e:
+                # Return the dead browser to keep the pool size constant;
+                # the health check on its next checkout retries the launch.
+                logger.exception("Failed to launch replacement browser: %s", e)
+        self._idle.put(browser)
+
+    def stats(self) -> dict:
+        return {"size": self.size, "idle": self._idle.qsize(), "live": len(self._all)}
+
+    def shutdown(self) -> None:
+        """Quits every browser. Browsers still checked out are quit when they are returned."""
+        with self._lock:
+            self._closed = True
+            self._started = False
+        while True:
+            try:
+                self._retire(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        logger.info("Browser pool shut down.")
+
+
+_browser_pool = None
+_browser_pool_lock = threading.Lock()
+
+
+def get_browser_pool() -> BrowserPool:
+    """Returns the process-wide browser pool configured by BROWSER_POOL_SIZE and BROWSER_MAX_PAGES."""
+    global _browser_pool
+    with _browser_pool_lock:
+        if _browser_pool is None:
+            _browser_pool = BrowserPool(
+                size=int(os.getenv("BROWSER_POOL_SIZE") or DEFAULT_POOL_SIZE),
+                max_pages=int(os.getenv("BROWSER_MAX_PAGES") or DEFAULT_MAX_PAGES),
+                checkout_timeout=float(os.getenv("BROWSER_CHECKOUT_TIMEOUT") or DEFAULT_CHECKOUT_TIMEOUT),
+            )
+        return _browser_pool
@@ -0,0 +1,94 @@
+import re
+from dataclasses import dataclass
+
+MARKDOWN_LINK = re.compile(r"\[([^\]]*)\]\(([^)\s]*)\)")
+
+# Short lines that are interface chrome rather than content.
+BOILERPLATE_PATTERN = re.compile(
+    r"^(advertisement|sponsored|share( on \w+)?|tweet|email|print|log ?in|sign ?(in|up)|subscribe|"
+    r"accept( all)?( cookies)?|reject( all)?|load (more|comments)|read more|show more|skip to (main )?content|"
+    r"jump to (content|navigation)|toggle (theme|navigation|menu)|menu|search|back to top|\[?edit\]?|"
+    r"previous|next|home|copyright|all rights reserved|privacy( policy)?|terms( of (use|service))?)\W*$",
+    re.IGNORECASE,
+)
+EDIT_MARKER = re.compile(r"\[edit\]", re.IGNORECASE)
+COPYRIGHT_PATTERN = re.compile(r"^(©|\(c\)|copyright\b)", re.IGNORECASE)
+COOKIE_PATTERN = re.compile(r"\b(cookies?|consent)\b", re.IGNORECASE)
+CODE_PATTERN = re.compile(r"[=(){}\[\];]|^\s*(>>>|\$ |#|//|def |class |import |return )")
+SENTENCE_END = re.compile(r"[.!?:]\W*$")
+
+MIN_CONTENT_WORDS = 10
+MAX_LINK_DENSITY = 0.5
+CONTEXT_WINDOW = 3
+
+
+@dataclass
+class Line:
+    text: str
+    words: int
+    link_density: float
+    kind: str = "short"
+
+
+def strip_markdown_links(text: str) -> str:
+    """Replaces markdown links `[text](href)` with their text."""
+    return MARKDOWN_LINK.sub(lambda match: match.group(1), text)
+
+
+def _analyze(raw_line: str) -> Line:
+    # Leading whitespace is kept so that code blocks stay indented.
+    text = EDIT_MARKER.sub("", strip_markdown_links(raw_line)).rstrip()
+    link_chars = sum(len(match.group(1)) for match in MARKDOWN_LINK.finditer(raw_line))
+    link_density = link_chars / max(1, len(text.strip()))
+    return Line(text=text, words=len(text.split()), link_density=link_density)
+
+
+def _classify(line: Line) -> str:
+    text = line.text.strip()
+    if not text or BOILERPLATE_PATTERN.match(text) or COPYRIGHT_PATTERN.match(text):
+        return "boilerplate"
+    if line.words < MIN_CONTENT_WORDS * 2 and COOKIE_PATTERN.search(text) and line.link_density > 0:
+        return "boilerplate"
+    if line.link_density > MAX_LINK_DENSITY:
+        return "boilerplate"
+    if line.words >= MIN_CONTENT_WORDS or (line.words >= 4 and SENTENCE_END.search(text)):
+        return "content"
+    if line.link_density == 0 and CODE_PATTERN.search(text):
+        return "code"
+    return "short"
+
+
+def extract_main_content(text: str) -> str:
+    """
+    Removes navigation, ads, buttons and other boilerplate from scraped text.
+    - Lines dominated by links (menus, link lists, footers) are dropped.
+    - Lines matching common interface chrome (share buttons, cookie banners, login links) are dropped.
+    - Repeated short lines, such as a header menu repeated in the footer, are kept only once.
+    - Short lines (headings, list items) are kept only when they sit close to real content.
+    - Markdown links are reduced to their text.
+    """
+    lines = [_analyze(raw_line) for raw_line in text.splitlines()]
+
+    for line in lines:
+        line.kind = _classify(line)
+
+    anchors = [index for index, line in enumerate(lines) if line.kind in ("content", "code")]
+    kept = []
+    seen = set()
+    anchor_position = 0
+    for index, line in enumerate(lines):
+        if line.kind == "boilerplate":
+            continue
+        if line.kind == "short":
+            # Advance to the first anchor that is not too far behind this line.
+            while anchor_position < len(anchors) and anchors[anchor_position] < index - CONTEXT_WINDOW:
+                anchor_position += 1
+            if anchor_position == len(anchors) or anchors[anchor_position] > index + CONTEXT_WINDOW:
+                continue
+            # Keep only the first occurrence of a repeated short line near content.
+            key = line.text.strip().lower()
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(line.text)
+    return "\n".join(kept)
@@ -0,0 +1,284 @@
+import os
+import re
+import logging
+import threading
+from functools import lru_cache
+from typing import Any, List, Mapping
+
+import tiktoken
+from autogen_core import FunctionCall
+from autogen_core.model_context import ChatCompletionContext
+from autogen_core.models import FunctionExecutionResultMessage, LLMMessage, UserMessage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = 12000
+DEFAULT_SUMMARY_TOKENS = 200
+MESSAGE_OVERHEAD_TOKENS = 4
+FALLBACK_ENCODING = "o200k_base"
+
+# Agents whose messages carry the scraped page, raw or cleaned.
+SCRAPED_CONTENT_SOURCES = {"web_scraping_agent", "data_cleaning_agent"}
+OUTLINE_SOURCE = "course_outline_agent"
+EXPLAINER_SOURCE = "topic_explainer"
+QUIZ_SOURCE = "quiz_agent"
+SUMMARY_SOURCE = "context_summary"
+# Content of the messages that announce a handoff.
+HANDOFF_NOTE_PREFIX = "Transferred to "
+
+HEADING = re.compile(r"^\s*(#{1,6}\s+|\*\*[^*]+\*\*\s*:?\s*$)")
+SENTENCE = re.compile(r"^(.+?[.!?])(\s|$)")
+
+
+@lru_cache(maxsize=None)
+def _get_encoding() -> tiktoken.Encoding | None:
+    try:
+        return tiktoken.encoding_for_model(os.getenv("MODEL") or "")
+    except KeyError:
+        pass
+    except Exception as e:
+        logger.warning("Could not load the tiktoken encoding (%s); estimating tokens from text length.", e)
+        return None
+    try:
+        return tiktoken.get_encoding(FALLBACK_ENCODING)
+    except Exception as e:
+        logger.warning("Could not load the tiktoken encoding (%s); estimating tokens from text length.", e)
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[: max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+
+def count_message_tokens(message: LLMMessage) -> int:
+    if isinstance(message, FunctionExecutionResultMessage):
+        return sum(count_tokens(result.content) + MESSAGE_OVERHEAD_TOKENS for result in message.content)
+    if isinstance(message.content, str):
+        return count_tokens(message.content) + MESSAGE_OVERHEAD_TOKENS
+    tokens = MESSAGE_OVERHEAD_TOKENS
+    for part in message.content:
+        if isinstance(part, FunctionCall):
+            tokens += count_tokens(part.name) + count_tokens(part.arguments)
+        elif isinstance(part, str):
+            tokens += count_tokens(part)
+    return tokens
+
+
+def _text(message: LLMMessage) -> str | None:
+    """Returns the text of a message, or None for tool calls, tool results and handoff notes."""
+    if isinstance(message, FunctionExecutionResultMessage) or not isinstance(message.content, str):
+        return None
+    if message.content.startswith(HANDOFF_NOTE_PREFIX):
+        return None
+    return message.content
+
+
+def summarize_chapter(messages: List[LLMMessage], max_tokens: int) -> str:
+    """
+    Extractive summary of a finished chapter: the headings and the first sentence
+    of each explanation, quiz and user reply, cut to `max_tokens`.
+    """
+    points = []
+    for message in messages:
+        text = _text(message)
+        if not text:
+            continue
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        headings = [line.strip("#* :") for line in lines if HEADING.match(line)]
+        first_line = next((line for line in lines if not HEADING.match(line)), "")
+        match = SENTENCE.match(first_line)
+        first_sentence = match.group(1) if match else first_line
+        point = "; ".join(dict.fromkeys(filter(None, headings + [first_sentence])))
+        if point:
+            points.append(f"- {message.source}: {point}")
+    summary = "Summary of an earlier chapter:\n" + "\n".join(points)
+    return truncate_to_tokens(summary, max_tokens)
+
+
+class _Unit:
+    """Messages that must be kept or removed together: a tool call and its results stay paired."""
+
+    def __init__(self, messages: List[LLMMessage], tokens: int):
+        self.messages = messages
+        self.tokens = tokens
+        self.pinned = False
+
+    @property
+    def source(self) -> str | None:
+        return getattr(self.messages[0], "source", None)
+
+    @property
+    def text(self) -> str | None:
+        return _text(self.messages[0])
+
+    def replace(self, message: LLMMessage) -> None:
+        self.messages = [message]
+        self.tokens = count_message_tokens(message)
+
+
+_stats_lock = threading.Lock()
+_stats = {"turns": 0, "compacted_turns": 0, "tokens_before": 0, "tokens_after": 0}
+
+
+def compaction_stats() -> dict:
+    with _stats_lock:
+        return {**_stats, "tokens_saved": _stats["tokens_before"] - _stats["tokens_after"]}
+
+
+class TokenBudgetContext(ChatCompletionContext):
+    """
+    Model context that keeps what an agent sends to the model under a token budget.
+    - Every message is kept (and saved with the team state); only the view returned by `get_messages` is compacted.
+    - Once the course outline exists, scraped page content is replaced by a short placeholder.
+    - The latest outline and the current chapter are pinned and always sent verbatim.
+    - While over budget, finished chapters are replaced by extractive summaries, oldest first,
+      and then the oldest unpinned messages are dropped.
+    - Tokens saved are logged per model call and aggregated in `compaction_stats`.
+    """
+
+    def __init__(
+        self,
+        agent_name: str,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        summary_tokens: int = DEFAULT_SUMMARY_TOKENS,
+        drop_scraped_content: bool = True,
+        initial_messages: List[LLMMessage] | None = None,
+    ):
+        super().__init__(initial_messages)
+        self.agent_name = agent_name
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.drop_scraped_content = drop_scraped_content
+        self._token_counts = [count_message_tokens(message) for message in self._messages]
+        # Tokens removed from the last model call
+        self.last_tokens_saved = 0
+
+    async def add_message(self, message: LLMMessage) -> None:
+        await super().add_message(message)
+        self._token_counts.append(count_message_tokens(message))
+
+    async def clear(self) -> None:
+        await super().clear()
+        self._token_counts = []
+
+    async def load_state(self, state: Mapping[str, Any]) -> None:
+        await super().load_state(state)
+        self._token_counts = [count_message_tokens(message) for message in self._messages]
+
+    def _units(self) -> List[_Unit]:
+        units = []
+        for message, tokens in zip(self._messages, self._token_counts):
+            if isinstance(message, FunctionExecutionResultMessage) and units:
+                units[-1].messages.append(message)
+                units[-1].tokens += tokens
+            else:
+                units.append(_Unit([message], tokens))
+        return units
+
+    async def get_messages(self) -> List[LLMMessage]:
+        tokens_before = sum(self._token_counts)
+        units = self._units()
+        outline_index = next(
+            (index for index in range(len(units) - 1, -1, -1)
+             if units[index].source == OUTLINE_SOURCE and units[index].text),
+            None,
+        )
+        # The scraped page is the source of the outline: it is kept until an outline exists,
+        # and for good in contexts that do not drop it.
+        keep_scraped_content = outline_index is None or not self.drop_scraped_content
+        for unit in units:
+            if unit.source in SCRAPED_CONTENT_SOURCES and unit.text:
+                unit.pinned = keep_scraped_content
+        if outline_index is not None:
+            units[outline_index].pinned = True
+            if self.drop_scraped_content:
+                self._drop_scraped_content(units[:outline_index])
+            chapters = self._split_chapters(units[outline_index + 1:])
+            for unit in chapters[-1] if chapters else []:
+                unit.pinned = True
+            self._summarize_chapters(units, chapters[:-1])
+        else:
+            # Before the outline exists, the latest message is what the agent is responding to.
+            if units:
+                units[-1].pinned = True
+        self._drop_oldest(units)
+
+        messages = [message for unit in units for message in unit.messages]
+        tokens_after = sum(unit.tokens for unit in units)
+        self.last_tokens_saved = tokens_before - tokens_after
+        with _stats_lock:
+            _stats["turns"] += 1
+            _stats["tokens_before"] += tokens_before
+            _stats["tokens_after"] += tokens_after
+            if self.last_tokens_saved:
+                _stats["compacted_turns"] += 1
+        if self.last_tokens_saved:
+            logger.info(
+                "Compacted context of %s from %d to %d tokens (%d saved).",
+                self.agent_name, tokens_before, tokens_after, self.last_tokens_saved,
+            )
+        return messages
+
+    def _drop_scraped_content(self, units: List[_Unit]) -> None:
+        for unit in units:
+            if unit.source in SCRAPED_CONTENT_SOURCES and unit.text:
+                placeholder = f"[Scraped page content omitted ({unit.tokens} tokens); the course outline covers it.]"
+                unit.replace(UserMessage(content=placeholder, source=unit.source))
+
+    @staticmethod
+    def _split_chapters(units: List[_Unit]) -> List[List[_Unit]]:
+        """A new chapter starts when the topic explainer speaks after the quiz agent."""
+        chapters = []
+        previous_source = None
+        for unit in units:
+            if not unit.text:
+                if chapters:
+                    chapters[-1].append(unit)
+                else:
+                    chapters.append([unit])
+                continue
+            if not chapters or (unit.source == EXPLAINER_SOURCE and previous_source == QUIZ_SOURCE):
+                chapters.append([])
+            chapters[-1].append(unit)
+            if unit.source in (EXPLAINER_SOURCE, QUIZ_SOURCE):
+                previous_source = unit.source
+        return chapters
+
+    def _summarize_chapters(self, units: List[_Unit], chapters: List[List[_Unit]]) -> None:
+        for chapter in chapters:
+            if sum(unit.tokens for unit in units) <= self.token_budget:
+                return
+            messages = [message for unit in chapter for message in unit.messages]
+            summary = UserMessage(content=summarize_chapter(messages, self.summary_tokens), source=SUMMARY_SOURCE)
+            first = units.index(chapter[0])
+            units[first:first + len(chapter)] = [_Unit([summary], count_message_tokens(summary))]
+
+    def _drop_oldest(self, units: List[_Unit]) -> None:
+        total = sum(unit.tokens for unit in units)
+        index = 0
+        while total > self.token_budget and index < len(units):
+            if units[index].pinned:
+                index += 1
+                continue
+            total -= units.pop(index).tokens
+
+
+def create_model_context(agent_name: str, drop_scraped_content: bool = True) -> TokenBudgetContext:
+    """Creates a token-budgeted context configured by CONTEXT_TOKEN_BUDGET and CONTEXT_SUMMARY_TOKENS."""
+    return TokenBudgetContext(
+        agent_name,
+        token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET") or DEFAULT_TOKEN_BUDGET),
+        summary_tokens=int(os.getenv("CONTEXT_SUMMARY_TOKENS") or DEFAULT_SUMMARY_TOKENS),
+        drop_scraped_content=drop_scraped_content,
+    )
@@ -0,0 +1,843 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import logging
+import tempfile
+import threading
+
+from state_log import apply_delta, record_write
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Storage configuration: backend type and location come from the environment.
+# -----------------------------------------------------------------------------
+LEGACY_CONVERSATIONS_FILE = "conversations.json"
+DEFAULT_SQLITE_PATH = "conversations.db"
+DEFAULT_FILES_PATH = "conversations"
+DEFAULT_REDIS_URL = "redis://localhost:6379/0"
+
+_CONVERSATION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def is_valid_conversation_id(conversation_id: str) -> bool:
+    """
+    Conversation ids are team ids (UUIDs). Anything else is rejected so that
+    ids coming from requests can never be used to escape the storage location.
+    """
+    return bool(conversation_id) and bool(_CONVERSATION_ID_PATTERN.match(conversation_id))
+
+
+class VersionConflict(Exception):
+    """
+    Raised when a conversation is written with an `expected_version` that is no longer its version:
+    another worker has written it since this one read it, and the write would lose that update.
+    """
+
+    def __init__(self, conversation_id: str, expected_version: int, version: int):
+        super().__init__(
+            f"Conversation {conversation_id} is at version {version}, not {expected_version}: "
+            "it was updated by another worker."
+        )
+        self.conversation_id = conversation_id
+        self.expected_version = expected_version
+        self.version = version
+
+
+def _check_version(conversation_id: str, expected_version: int | None, version: int) -> None:
+    if expected_version is not None and expected_version != version:
+        raise VersionConflict(conversation_id, expected_version, version)
+
+
+class ConversationStore:
+    """
+    Interface for conversation storage backends.
+
+    Every operation touches a single conversation (plus a small index for
+    listing), so the cost of a turn does not depend on how many conversations
+    have been stored.
+
+    Stores shared by several workers also coordinate them:
+    - Every write (snapshot or delta) increments the conversation's version; a conversation that does
+      not exist is at version 0. Writes given an `expected_version` raise VersionConflict unless it is
+      the current version, so a worker holding an outdated team cannot overwrite newer turns.
+    - A lease gives one worker (`owner`) exclusive use of a conversation for `ttl` seconds, renewed
+      while a turn runs. An expired lease can be taken by any worker.
+    """
+
+    def list_conversations(self) -> list:
+        """Returns a list of (conversation_id, conversation_title) tuples in creation order."""
+        raise NotImplementedError
+
+    def get_state(self, conversation_id: str) -> dict | None:
+        """Returns the saved team state of a conversation, or None if it does not exist."""
+        versioned_state = self.get_versioned_state(conversation_id)
+        return None if versioned_state is None else versioned_state[0]
+
+    def get_versioned_state(self, conversation_id: str) -> tuple[dict, int] | None:
+        """Returns the saved team state of a conversation and its version, or None if it does not exist."""
+        raise NotImplementedError
+
+    def get_version(self, conversation_id: str) -> int | None:
+        """Returns the version of a conversation, or None if it does not exist."""
+        versioned_state = self.get_versioned_state(conversation_id)
+        return None if versioned_state is None else versioned_state[1]
+
+    def save(self, conversation_id: str, conversation_title: str, state: dict, expected_version: int | None = None) -> None:
+        """Atomically creates or replaces a conversation with a snapshot of its state, discarding its state log."""
+        raise NotImplementedError
+
+    def append_delta(
+        self, conversation_id: str, conversation_title: str, operations: list, expected_version: int | None = None
+    ) -> int | None:
+        """
+        Appends a state delta (see `state_log.state_delta`) to the conversation's state log.
+        Returns the number of deltas logged since the last snapshot, or None if the conversation
+        has no snapshot to append to, in which case the caller saves a snapshot instead.
+        """
+        return None
+
+    def delete(self, conversation_id: str) -> bool:
+        """Deletes a conversation and its artifacts. Returns True if it existed."""
+        raise NotImplementedError
+
+    def get_artifact(self, conversation_id: str, name: str) -> bytes | None:
+        """Returns a named artifact stored next to a conversation (e.g. its retrieval index), or None."""
+        raise NotImplementedError
+
+    def save_artifact(self, conversation_id: str, name: str, data: bytes) -> None:
+        """Atomically creates or replaces a named artifact of a conversation."""
+        raise NotImplementedError
+
+    def acquire_lease(self, conversation_id: str, owner: str, ttl: float) -> bool:
+        """Takes (or extends) the lease of a conversation unless another owner holds it. Returns True on success."""
+        raise NotImplementedError
+
+    def renew_lease(self, conversation_id: str, owner: str, ttl: float) -> bool:
+        """Extends a lease held by `owner` by `ttl` seconds. Returns False if the lease was lost."""
+        raise NotImplementedError
+
+    def release_lease(self, conversation_id: str, owner: str) -> None:
+        """Gives up a lease held by `owner`; does nothing if it was lost."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    Stores conversations in a SQLite database running in WAL mode.
+    - Readers never block the writer and vice versa.
+    - A snapshot is a single-row upsert that also clears the conversation's deltas, in one transaction.
+    - A delta is a single-row insert into `state_deltas`; reads replay them on top of the snapshot.
+    - Versions are checked inside write transactions, and leases are rows of `leases`, so that every
+      worker process using the same database file is coordinated.
+    """
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS conversations (
+                    conversation_id TEXT PRIMARY KEY,
+                    conversation_title TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    version INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(conversations)")]
+            if "version" not in columns:
+                # Databases created before versions existed
+                connection.execute("ALTER TABLE conversations ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS state_deltas (
+                    id INTEGER PRIMARY KEY,
+                    conversation_id TEXT NOT NULL,
+                    operations TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS state_deltas_conversation ON state_deltas (conversation_id, id)"
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    conversation_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (conversation_id, name)
+                )
+                """
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS leases (
+                    conversation_id TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections must not be shared across threads.
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def list_conversations(self) -> list:
+        rows = self._connection().execute(
+            "SELECT conversation_id, conversation_title FROM conversations ORDER BY created_at, rowid"
+        ).fetchall()
+        return [(row[0], row[1]) for row in rows]
+
+    def get_versioned_state(self, conversation_id: str) -> tuple[dict, int] | None:
+        connection = self._connection()
+        # Read the snapshot and its deltas in one transaction, so that a concurrent snapshot cannot interleave.
+        connection.execute("BEGIN")
+        try:
+            row = connection.execute(
+                "SELECT state, version FROM conversations WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+            deltas = connection.execute(
+                "SELECT operations FROM state_deltas WHERE conversation_id = ? ORDER BY id", (conversation_id,)
+            ).fetchall()
+        finally:
+            connection.commit()
+        if row is None:
+            return None
+        state = json.loads(row[0])
+        for delta in deltas:
+            apply_delta(state, json.loads(delta[0]))
+        return state, row[1]
+
+    def get_version(self, conversation_id: str) -> int | None:
+        row = self._connection().execute(
+            "SELECT version FROM conversations WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def _locked_version(self, connection: sqlite3.Connection, conversation_id: str) -> int | None:
+        # Takes the database write lock first, so that no other process writes between the check and the write.
+        connection.execute("BEGIN IMMEDIATE")
+        row = connection.execute(
+            "SELECT version FROM conversations WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def save(self, conversation_id: str, conversation_title: str, state: dict, expected_version: int | None = None) -> None:
+        now = time.time()
+        data = json.dumps(state)
+        with self._connection() as connection:
+            version = self._locked_version(connection, conversation_id)
+            _check_version(conversation_id, expected_version, version or 0)
+            connection.execute(
+                """
+                INSERT INTO conversations (conversation_id, conversation_title, state, created_at, updated_at, version)
+                VALUES (?, ?, ?, ?, ?, 1)
+                ON CONFLICT(conversation_id) DO UPDATE SET
+                    conversation_title = excluded.conversation_title,
+                    state = excluded.state,
+                    updated_at = excluded.updated_at,
+                    version = conversations.version + 1
+                """,
+                (conversation_id, conversation_title, data, now, now),
+            )
+            connection.execute("DELETE FROM state_deltas WHERE conversation_id = ?", (conversation_id,))
+        record_write("snapshot", len(data))
+
+    def append_delta(
+        self, conversation_id: str, conversation_title: str, operations: list, expected_version: int | None = None
+    ) -> int | None:
+        now = time.time()
+        data = json.dumps(operations)
+        with self._connection() as connection:
+            version = self._locked_version(connection, conversation_id)
+            if version is None:
+                return None
+            _check_version(conversation_id, expected_version, version)
+            connection.execute(
+                """
+                UPDATE conversations SET conversation_title = ?, updated_at = ?, version = version + 1
+                WHERE conversation_id = ?
+                """,
+                (conversation_title, now, conversation_id),
+            )
+            connection.execute(
+                "INSERT INTO state_deltas (conversation_id, operations, created_at) VALUES (?, ?, ?)",
+                (conversation_id, data, now),
+            )
+            count = connection.execute(
+                "SELECT COUNT(*) FROM state_deltas WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()[0]
+        record_write("delta", len(data))
+        return count
+
+    def delete(self, conversation_id: str) -> bool:
+        with self._connection() as connection:
+            cursor = connection.execute("DELETE FROM conversations WHERE conversation_id = ?", (conversation_id,))
+            connection.execute("DELETE FROM state_deltas WHERE conversation_id = ?", (conversation_id,))
+            connection.execute("DELETE FROM artifacts WHERE conversation_id = ?", (conversation_id,))
+            connection.execute("DELETE FROM leases WHERE conversation_id = ?", (conversation_id,))
+        return cursor.rowcount > 0
+
+    def get_artifact(self, conversation_id: str, name: str) -> bytes | None:
+        row = self._connection().execute(
+            "SELECT data FROM artifacts WHERE conversation_id = ? AND name = ?", (conversation_id, name)
+        ).fetchone()
+        return None if row is None else bytes(row[0])
+
+    def save_artifact(self, conversation_id: str, name: str, data: bytes) -> None:
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO artifacts (conversation_id, name, data, updated_at) VALUES (?, ?, ?, ?)",
+                (conversation_id, name, data, time.time()),
+            )
+
+    def acquire_lease(self, conversation_id: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._connection() as connection:
+            cursor = connection.execute(
+                """
+                INSERT INTO leases (conversation_id, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(conversation_id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE leases.owner = excluded.owner OR leases.expires_at <= ?
+                """,
+                (conversation_id, owner, now + ttl, now),
+            )
+        return cursor.rowcount > 0
+
+    def renew_lease(self, conversation_id: str, owner: str, ttl: float) -> bool:
+        with self._connection() as connection:
+            cursor = connection.execute(
+                "UPDATE leases SET expires_at = ? WHERE conversation_id = ? AND owner = ?",
+                (time.time() + ttl, conversation_id, owner),
+            )
+        return cursor.rowcount > 0
+
+    def release_lease(self, conversation_id: str, owner: str) -> None:
+        with self._connection() as connection:
+            connection.execute("DELETE FROM leases WHERE conversation_id = ? AND owner = ?", (conversation_id, owner))
+
+    def close(self) -> None:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def _atomic_write_json(path: str, data) -> int:
+    """Writes JSON to a temporary file in the same directory and renames it over the target. Returns its size."""
+    encoded = json.dumps(data).encode("utf-8")
+    _atomic_write_bytes(path, encoded)
+    return len(encoded)
+
+
+def _atomic_write_bytes(path: str, data: bytes) -> None:
+    directory = os.path.dirname(path) or "."
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class FileConversationStore(ConversationStore):
+    """
+    Stores each conversation in its own JSON file, plus an index file used for listing.
+    - <root>/<conversation_id>.json holds the last snapshot of the team state.
+    - <root>/<conversation_id>.log holds the deltas since that snapshot, one JSON line each. Its first line
+      names the snapshot it belongs to, so a log left behind by a crash during a snapshot is ignored.
+    - <root>/.index.json lists the conversations in creation order, with their first title. It is only
+      rewritten when a conversation is created or deleted.
+    - <root>/<conversation_id>.title holds the latest title, once it differs from the first one.
+    - <root>/<conversation_id>.artifacts/<name> holds the named artifacts of a conversation.
+    All files except the log are replaced atomically via rename; the log is only appended to.
+    A turn reads and writes the files of its own conversation only.
+    A conversation's version is the version of its snapshot plus the deltas logged since. It is read from
+    the files once, then kept in memory and updated by every write. Versions and leases are only enforced
+    within one process; use the sqlite or redis store to run several workers.
+    """
+
+    INDEX_FILENAME = ".index.json"
+
+    def __init__(self, root: str = DEFAULT_FILES_PATH):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+        self._index_lock = threading.Lock()
+        # Held while a version is checked and written
+        self._write_lock = threading.Lock()
+        # (version, snapshot id) of the conversations read or written by this process, by conversation id
+        self._versions: dict[str, tuple[int, str | None]] = {}
+        # Latest titles of the conversations read or written by this process, by conversation id
+        self._titles: dict[str, str] = {}
+        # (owner, expiry) of the leases, by conversation id
+        self._leases: dict[str, tuple[str, float]] = {}
+        self._leases_lock = threading.Lock()
+
+    def _index_path(self) -> str:
+        return os.path.join(self.root, self.INDEX_FILENAME)
+
+    def _state_path(self, conversation_id: str) -> str:
+        if not is_valid_conversation_id(conversation_id):
+            raise ValueError(f"Invalid conversation id: {conversation_id!r}")
+        return os.path.join(self.root, f"{conversation_id}.json")
+
+    def _log_path(self, conversation_id: str) -> str:
+        if not is_valid_conversation_id(conversation_id):
+            raise ValueError(f"Invalid conversation id: {conversation_id!r}")
+        return os.path.join(self.root, f"{conversation_id}.log")
+
+    def _title_path(self, conversation_id: str) -> str:
+        if not is_valid_conversation_id(conversation_id):
+            raise ValueError(f"Invalid conversation id: {conversation_id!r}")
+        return os.path.join(self.root, f"{conversation_id}.title")
+
+    def _artifacts_path(self, conversation_id: str) -> str:
+        if not is_valid_conversation_id(conversation_id):
+            raise ValueError(f"Invalid conversation id: {conversation_id!r}")
+        return os.path.join(self.root, f"{conversation_id}.artifacts")
+
+    def _artifact_path(self, conversation_id: str, name: str) -> str:
+        if not is_valid_conversation_id(conversation_id) or not is_valid_conversation_id(name):
+            raise ValueError(f"Invalid artifact: {conversation_id!r}/{name!r}")
+        return os.path.join(self._artifacts_path(conversation_id), name)
+
+    def _read_index(self) -> list:
+        try:
+            with open(self._index_path(), "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return []
+
+    def _read_title(self, conversation_id: str) -> str | None:
+        title = self._titles.get(conversation_id)
+        if title is None:
+            try:
+                with open(self._title_path(conversation_id), "r", encoding="utf-8") as file:
+                    title = self._titles[conversation_id] = file.read()
+            except FileNotFoundError:
+                return None
+        return title
+
+    def list_conversations(self) -> list:
+        return [
+            (entry["conversation_id"], self._read_title(entry["conversation_id"]) or entry["conversation_title"])
+            for entry in self._read_index()
+        ]
+
+    def _read(self, conversation_id: str) -> tuple[dict, int, str | None] | None:
+        """Returns the state of a conversation, its version and the id of its snapshot, or None."""
+        try:
+            with open(self._state_path(conversation_id), "r") as file:
+                snapshot = json.load(file)
+        except FileNotFoundError:
+            return None
+        if "snapshot_id" not in snapshot:
+            # Written before state logs existed: the file is the state itself.
+            return snapshot, 0, None
+        state, version, snapshot_id = snapshot["state"], snapshot.get("version", 0), snapshot["snapshot_id"]
+        try:
+            with open(self._log_path(conversation_id), "r") as file:
+                lines = file.read().splitlines()
+        except FileNotFoundError:
+            return state, version, snapshot_id
+        if not lines or json.loads(lines[0]).get("snapshot_id") != snapshot_id:
+            return state, version, snapshot_id
+        for line in lines[1:]:
+            try:
+                operations = json.loads(line)
+            except json.JSONDecodeError:
+                # A line torn by a crash during an append; the delta it held was never acknowledged.
+                continue
+            apply_delta(state, operations)
+            version += 1
+        return state, version, snapshot_id
+
+    def get_versioned_state(self, conversation_id: str) -> tuple[dict, int] | None:
+        if not is_valid_conversation_id(conversation_id):
+            return None
+        read = self._read(conversation_id)
+        return None if read is None else read[:2]
+
+    def _current_version(self, conversation_id: str) -> tuple[int, str | None] | None:
+        # Callers hold the write lock, so that no write lands between reading a version and caching it.
+        current = self._versions.get(conversation_id)
+        if current is None:
+            read = self._read(conversation_id)
+            if read is None:
+                return None
+            current = self._versions[conversation_id] = read[1:]
+        return current
+
+    def get_version(self, conversation_id: str) -> int | None:
+        if not is_valid_conversation_id(conversation_id):
+            return None
+        with self._write_lock:
+            current = self._current_version(conversation_id)
+        return None if current is None else current[0]
+
+    def save(self, conversation_id: str, conversation_title: str, state: dict, expected_version: int | None = None) -> None:
+        snapshot_id = uuid.uuid4().hex
+        with self._write_lock:
+            current = self._current_version(conversation_id)
+            version = (current or (0, None))[0]
+            _check_version(conversation_id, expected_version, version)
+            size = _atomic_write_json(
+                self._state_path(conversation_id), {"snapshot_id": snapshot_id, "version": version + 1, "state": state}
+            )
+            # Start a new log for the snapshot; until it is written, the old log is ignored by its header.
+            _atomic_write_bytes(
+                self._log_path(conversation_id), (json.dumps({"snapshot_id": snapshot_id}) + "\n").encode()
+            )
+            self._versions[conversation_id] = (version + 1, snapshot_id)
+        record_write("snapshot", size)
+        if current is None:
+            self._add_to_index(conversation_id, conversation_title)
+        else:
+            self._update_title(conversation_id, conversation_title)
+
+    def append_delta(
+        self, conversation_id: str, conversation_title: str, operations: list, expected_version: int | None = None
+    ) -> int | None:
+        line = (json.dumps(operations) + "\n").encode("utf-8")
+        with self._write_lock:
+            current = self._current_version(conversation_id)
+            if current is None:
+                return None
+            version, snapshot_id = current
+            _check_version(conversation_id, expected_version, version)
+            try:
+                with open(self._log_path(conversation_id), "r+b") as file:
+                    content = file.read()
+                    header, _, _ = content.partition(b"\n")
+                    if json.loads(header or b"{}").get("snapshot_id") != snapshot_id:
+                        # The log of an earlier snapshot, left behind by a crash: a snapshot starts a new one.
+                        return None
+                    if not content.endswith(b"\n"):
+                        # Terminate a line torn by a crash, so that it cannot swallow this one.
+                        file.write(b"\n")
+                    file.write(line)
+                    file.flush()
+                    os.fsync(file.fileno())
+            except FileNotFoundError:
+                return None
+            self._versions[conversation_id] = (version + 1, snapshot_id)
+        record_write("delta", len(line))
+        self._update_title(conversation_id, conversation_title)
+        return content.count(b"\n") + (0 if content.endswith(b"\n") else 1)
+
+    def _add_to_index(self, conversation_id: str, conversation_title: str) -> None:
+        with self._index_lock:
+            index = self._read_index()
+            indexed = any(entry["conversation_id"] == conversation_id for entry in index)
+            if not indexed:
+                index.append({"conversation_id": conversation_id, "conversation_title": conversation_title})
+                _atomic_write_json(self._index_path(), index)
+        if indexed:
+            self._update_title(conversation_id, conversation_title)
+        else:
+            # The index holds the first title.
+            self._titles[conversation_id] = conversation_title
+
+    def _update_title(self, conversation_id: str, conversation_title: str) -> None:
+        # Titles change with most turns, so they are kept out of the index.
+        if self._read_title(conversation_id) != conversation_title:
+            _atomic_write_bytes(self._title_path(conversation_id), conversation_title.encode("utf-8"))
+            self._titles[conversation_id] = conversation_title
+
+    def delete(self, conversation_id: str) -> bool:
+        if not is_valid_conversation_id(conversation_id):
+            return False
+        with self._index_lock:
+            index = self._read_index()
+            remaining = [entry for entry in index if entry["conversation_id"] != conversation_id]
+            if len(remaining) != len(index):
+                _atomic_write_json(self._index_path(), remaining)
+        with self._leases_lock:
+            self._leases.pop(conversation_id, None)
+        with self._write_lock:
+            self._versions.pop(conversation_id, None)
+            self._titles.pop(conversation_id, None)
+            shutil.rmtree(self._artifacts_path(conversation_id), ignore_errors=True)
+            for path in (self._log_path(conversation_id), self._title_path(conversation_id)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            try:
+                os.remove(self._state_path(conversation_id))
+            except FileNotFoundError:
+                return len(remaining) != len(index)
+        return True
+
+    def get_artifact(self, conversation_id: str, name: str) -> bytes | None:
+        try:
+            with open(self._artifact_path(conversation_id, name), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def save_artifact(self, conversation_id: str, name: str, data: bytes) -> None:
+        os.makedirs(self._artifacts_path(conversation_id), exist_ok=True)
+        _atomic_write_bytes(self._artifact_path(conversation_id, name), data)
+
+    def acquire_lease(self, conversation_id: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._leases_lock:
+            holder, expires_at = self._leases.get(conversation_id, (owner, now))
+            if holder != owner and expires_at > now:
+                return False
+            self._leases[conversation_id] = (owner, now + ttl)
+            return True
+
+    def renew_lease(self, conversation_id: str, owner: str, ttl: float) -> bool:
+        with self._leases_lock:
+            holder, _ = self._leases.get(conversation_id, (None, 0))
+            if holder != owner:
+                return False
+            self._leases[conversation_id] = (owner, time.time() + ttl)
+            return True
+
+    def release_lease(self, conversation_id: str, owner: str) -> None:
+        with self._leases_lock:
+            if self._leases.get(conversation_id, (None, 0))[0] == owner:
+                del self._leases[conversation_id]
+
+
+class RedisConversationStore(ConversationStore):
+    """
+    Stores conversations in Redis (or any server speaking its protocol), so that workers on several
+    machines share them:
+    - <prefix>:conversation:<id> is a hash of the title, the last snapshot, the version and timestamps.
+    - <prefix>:deltas:<id> is a list of the deltas logged since that snapshot.
+    - <prefix>:artifacts:<id> is a hash of the named artifacts.
+    - <prefix>:conversations is a sorted set of the conversation ids by creation time, used for listing.
+    - <prefix>:lease:<id> holds the owner of a conversation's lease and expires with it.
+    Writes that check a version or a lease owner run in WATCH/MULTI/EXEC transactions.
+    """
+
+    def __init__(self, url: str = DEFAULT_REDIS_URL, prefix: str = "teacher"):
+        # Imported here, so that the redis package is only needed when this backend is used.
+        import redis
+
+        self.url = url
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._index_key = f"{prefix}:conversations"
+
+    def _key(self, kind: str, conversation_id: str) -> str:
+        if not is_valid_conversation_id(conversation_id):
+            raise ValueError(f"Invalid conversation id: {conversation_id!r}")
+        return f"{self.prefix}:{kind}:{conversation_id}"
+
+    def list_conversations(self) -> list:
+        conversation_ids = [value.decode() for value in self._client.zrange(self._index_key, 0, -1)]
+        pipeline = self._client.pipeline(transaction=False)
+        for conversation_id in conversation_ids:
+            pipeline.hget(self._key("conversation", conversation_id), "conversation_title")
+        titles = pipeline.execute()
+        # Conversations deleted since the index was read have no title.
+        return [
+            (conversation_id, title.decode())
+            for conversation_id, title in zip(conversation_ids, titles)
+            if title is not None
+        ]
+
+    def get_versioned_state(self, conversation_id: str) -> tuple[dict, int] | None:
+        if not is_valid_conversation_id(conversation_id):
+            return None
+        # Read the snapshot and its deltas in one transaction, so that a concurrent snapshot cannot interleave.
+        pipeline = self._client.pipeline(transaction=True)
+        pipeline.hmget(self._key("conversation", conversation_id), "state", "version")
+        pipeline.lrange(self._key("deltas", conversation_id), 0, -1)
+        (data, version), deltas = pipeline.execute()
+        if data is None:
+            return None
+        state = json.loads(data)
+        for delta in deltas:
+            apply_delta(state, json.loads(delta))
+        return state, int(version)
+
+    def get_version(self, conversation_id: str) -> int | None:
+        version = self._client.hget(self._key("conversation", conversation_id), "version")
+        return None if version is None else int(version)
+
+    def save(self, conversation_id: str, conversation_title: str, state: dict, expected_version: int | None = None) -> None:
+        key = self._key("conversation", conversation_id)
+        data = json.dumps(state)
+
+        def write(pipeline) -> None:
+            version = int(pipeline.hget(key, "version") or 0)
+            _check_version(conversation_id, expected_version, version)
+            now = time.time()
+            pipeline.multi()
+            pipeline.hsetnx(key, "created_at", now)
+            pipeline.hset(
+                key,
+                mapping={"conversation_title": conversation_title, "state": data, "version": version + 1, "updated_at": now},
+            )
+            pipeline.delete(self._key("deltas", conversation_id))
+            pipeline.zadd(self._index_key, {conversation_id: now}, nx=True)
+
+        self._client.transaction(write, key)
+        record_write("snapshot", len(data))
+
+    def append_delta(
+        self, conversation_id: str, conversation_title: str, operations: list, expected_version: int | None = None
+    ) -> int | None:
+        key = self._key("conversation", conversation_id)
+        data = json.dumps(operations)
+        exists = True
+
+        def write(pipeline) -> None:
+            nonlocal exists
+            version = pipeline.hget(key, "version")
+            exists = version is not None
+            if not exists:
+                return
+            _check_version(conversation_id, expected_version, int(version))
+            pipeline.multi()
+            pipeline.hset(
+                key, mapping={"conversation_title": conversation_title, "version": int(version) + 1, "updated_at": time.time()}
+            )
+            pipeline.rpush(self._key("deltas", conversation_id), data)
+
+        results = self._client.transaction(write, key)
+        if not exists:
+            return None
+        record_write("delta", len(data))
+        return results[-1]
+
+    def delete(self, conversation_id: str) -> bool:
+        if not is_valid_conversation_id(conversation_id):
+            return False
+        pipeline = self._client.pipeline(transaction=True)
+        pipeline.delete(self._key("conversation", conversation_id))
+        pipeline.delete(self._key("deltas", conversation_id), self._key("artifacts", conversation_id))
+        pipeline.delete(self._key("lease", conversation_id))
+        pipeline.zrem(self._index_key, conversation_id)
+        return pipeline.execute()[0] > 0
+
+    def get_artifact(self, conversation_id: str, name: str) -> bytes | None:
+        return self._client.hget(self._key("artifacts", conversation_id), name)
+
+    def save_artifact(self, conversation_id: str, name: str, data: bytes) -> None:
+        self._client.hset(self._key("artifacts", conversation_id), name, data)
+
+    def acquire_lease(self, conversation_id: str, owner: str, ttl: float) -> bool:
+        if self._client.set(self._key("lease", conversation_id), owner, nx=True, px=int(ttl * 1000)):
+            return True
+        # Already held: succeeds only if this owner holds it.
+        return self.renew_lease(conversation_id, owner, ttl)
+
+    def _update_lease(self, conversation_id: str, owner: str, update) -> bool:
+        """Runs `update(pipeline, key)` in a transaction if `owner` holds the lease. Returns whether it did."""
+        key = self._key("lease", conversation_id)
+        held = False
+
+        def transaction(pipeline) -> None:
+            nonlocal held
+            held = pipeline.get(key) == owner.encode()
+            if held:
+                pipeline.multi()
+                update(pipeline, key)
+
+        self._client.transaction(transaction, key)
+        return held
+
+    def renew_lease(self, conversation_id: str, owner: str, ttl: float) -> bool:
+        return self._update_lease(conversation_id, owner, lambda pipeline, key: pipeline.pexpire(key, int(ttl * 1000)))
+
+    def release_lease(self, conversation_id: str, owner: str) -> None:
+        self._update_lease(conversation_id, owner, lambda pipeline, key: pipeline.delete(key))
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def migrate_json_file(store: ConversationStore, path: str = LEGACY_CONVERSATIONS_FILE) -> int:
+    """
+    Imports conversations from the legacy single conversations.json file into a store.
+    The legacy file is renamed to '<path>.migrated' afterwards so the import runs only once.
+    Returns the number of imported conversations.
+    """
+    if not os.path.exists(path):
+        return 0
+
+    with open(path, "r") as file:
+        conversations = json.load(file)
+
+    for conv in conversations:
+        store.save(conv["conversation_id"], conv["conversation_title"], conv["state"])
+
+    os.replace(path, f"{path}.migrated")
+    logger.info("Migrated %d conversations from %s.", len(conversations), path)
+    return len(conversations)
+
+
+def create_conversation_store(migrate: bool = True) -> ConversationStore:
+    """
+    Creates the store configured by CONVERSATION_STORE ('sqlite', 'files' or 'redis')
+    and CONVERSATION_STORE_PATH (a redis:// URL for redis), migrating the legacy JSON file if present.
+    """
+    backend = os.getenv("CONVERSATION_STORE", "sqlite").lower()
+    path = os.getenv("CONVERSATION_STORE_PATH")
+
+    if backend == "sqlite":
+        store = SQLiteConversationStore(path or DEFAULT_SQLITE_PATH)
+    elif backend == "files":
+        store = FileConversationStore(path or DEFAULT_FILES_PATH)
+    elif backend == "redis":
+        store = RedisConversationStore(path or DEFAULT_REDIS_URL)
+    else:
+        raise ValueError(f"Unknown conversation store backend: {backend}")
+
+    if migrate:
+        migrate_json_file(store)
+    return store
+
+
+_conversation_store = None
+_conversation_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """Returns the process-wide conversation store, creating it on first use."""
+    global _conversation_store
+    with _conversation_store_lock:
+        if _conversation_store is None:
+            _conversation_store = create_conversation_store()
+        return _conversation_store
+
+
+if __name__ == "__main__":
+    import sys
+
+    legacy_path = sys.argv[1] if len(sys.argv) > 1 else LEGACY_CONVERSATIONS_FILE
+    count = migrate_json_file(create_conversation_store(migrate=False), legacy_path)
+    print(f"Migrated {count} conversations.")
@@ -0,0 +1,169 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from browser_pool import get_browser_pool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IO_WORKERS = 16
+DEFAULT_IO_MAX_QUEUE = 256
+DEFAULT_BROWSER_MAX_QUEUE = 32
+
+T = TypeVar("T")
+
+
+class BoundedExecutor:
+    """
+    Thread pool for blocking work called from async code, with a bounded queue and queue-depth metrics.
+    - At most `workers` calls run at once; up to `max_queue` more wait in the pool's queue.
+    - Callers beyond that wait on the event loop (without holding a thread) until the queue has room,
+      so a burst of blocking work cannot grow the queue without bound.
+    - `stats` reports the current and peak queue depth and the time calls spent queued and running.
+    """
+
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self._slots: asyncio.Semaphore | None = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        self.queued = 0
+        self.waiting = 0
+        self.peak_queued = 0
+        self.queue_time = 0.0
+        self.run_time = 0.0
+        self.max_queue_time = 0.0
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers + self.max_queue)
+        return self._slots
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Runs `func(*args, **kwargs)` on the pool and returns its result. Context variables are propagated."""
+        slots = self._get_slots()
+        self.waiting += 1
+        try:
+            await slots.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            with self._lock:
+                self.submitted += 1
+                self.queued += 1
+                self.peak_queued = max(self.peak_queued, self.queued)
+            call = functools.partial(contextvars.copy_context().run, self._call, time.monotonic(), func, *args, **kwargs)
+            return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+        finally:
+            slots.release()
+
+    def _call(self, submitted_at: float, func: Callable[..., T], *args, **kwargs) -> T:
+        started = time.monotonic()
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.queue_time += started - submitted_at
+            self.max_queue_time = max(self.max_queue_time, started - submitted_at)
+        failed = False
+        try:
+            return func(*args, **kwargs)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.run_time += time.monotonic() - started
+                if failed:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "running": self.running,
+                "queued": self.queued,
+                "waiting": self.waiting,
+                "peak_queued": self.peak_queued,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_queue_ms": round(self.queue_time / finished * 1000, 3) if finished else 0.0,
+                "max_queue_ms": round(self.max_queue_time * 1000, 3),
+                "avg_run_ms": round(self.run_time / finished * 1000, 3) if finished else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_io_executor = None
+_browser_executor = None
+_executors_lock = threading.Lock()
+
+
+def get_io_executor() -> BoundedExecutor:
+    """
+    Returns the process-wide executor for blocking file, database and parsing work,
+    configured by IO_EXECUTOR_WORKERS and IO_EXECUTOR_MAX_QUEUE.
+    """
+    global _io_executor
+    with _executors_lock:
+        if _io_executor is None:
+            _io_executor = BoundedExecutor(
+                "io",
+                workers=int(os.getenv("IO_EXECUTOR_WORKERS") or DEFAULT_IO_WORKERS),
+                max_queue=int(os.getenv("IO_EXECUTOR_MAX_QUEUE") or DEFAULT_IO_MAX_QUEUE),
+            )
+        return _io_executor
+
+
+def get_browser_executor() -> BoundedExecutor:
+    """
+    Returns the process-wide executor for Selenium sessions, configured by BROWSER_EXECUTOR_MAX_QUEUE.
+    It has one thread per pooled browser (BROWSER_POOL_SIZE), so a session never holds a thread
+    while it waits for a browser, and browser work never takes threads from file I/O.
+    """
+    global _browser_executor
+    with _executors_lock:
+        if _browser_executor is None:
+            _browser_executor = BoundedExecutor(
+                "browser",
+                workers=get_browser_pool().size,
+                max_queue=int(os.getenv("BROWSER_EXECUTOR_MAX_QUEUE") or DEFAULT_BROWSER_MAX_QUEUE),
+            )
+        return _browser_executor
+
+
+async def run_io(func: Callable[..., T], *args, **kwargs) -> T:
+    """Runs blocking file, database or parsing work on the I/O executor."""
+    return await get_io_executor().run(func, *args, **kwargs)
+
+
+def executor_stats() -> dict:
+    return {"io": get_io_executor().stats(), "browser": get_browser_executor().stats()}
+
+
+def shutdown_executors() -> None:
+    global _io_executor, _browser_executor
+    with _executors_lock:
+        for executor in (_io_executor, _browser_executor):
+            if executor is not None:
+                executor.shutdown()
+        _io_executor = _browser_executor = None
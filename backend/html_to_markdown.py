@@ -0,0 +1,152 @@
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+# Elements whose content is never visible text.
+SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg", "head", "iframe", "object", "canvas"}
+
+# Elements that start a new line of text.
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "dd", "details", "div", "dl", "dt",
+    "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header",
+    "hr", "li", "main", "nav", "ol", "p", "pre", "section", "summary", "table", "tr", "ul",
+}
+
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+_WHITESPACE = re.compile(r"[ \t\r\f\v\n]+")
+
+# Phrases that single-page apps and bot walls show when JavaScript is required.
+JS_GATED_MARKERS = (
+    "enable javascript",
+    "javascript is required",
+    "javascript is disabled",
+    "requires javascript",
+    "turn on javascript",
+    "please enable cookies",
+    "checking your browser",
+)
+MIN_STATIC_TEXT_LENGTH = 200
+
+
+def _escape_href(href: str) -> str:
+    """Percent-encodes characters that would end a markdown link target early."""
+    return href.strip().replace(" ", "%20").replace("(", "%28").replace(")", "%29")
+
+
+class HTMLToMarkdown(HTMLParser):
+    """
+    Converts an HTML document to plain text in a single pass over the markup.
+    - Visible text is kept, with block-level elements on their own lines.
+    - Links are inlined as markdown `[text](href)` at their position in the text,
+      with relative hrefs resolved against `base_url`.
+    """
+
+    def __init__(self, base_url: str = ""):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.lines = []
+        self._line = []
+        self._skip_depth = 0
+        self._pre_depth = 0
+        # Stack of (href, text parts) for the anchors currently open.
+        self._links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "body":
+            # Recover from an unclosed <head>.
+            self._skip_depth = 0
+            return
+        if tag in SKIPPED_TAGS:
+            if tag not in VOID_TAGS:
+                self._skip_depth += 1
+            return
+        if self._skip_depth:
+            return
+        if tag in BLOCK_TAGS:
+            self._break_line()
+        if tag == "pre":
+            self._pre_depth += 1
+        elif tag == "a":
+            href = dict(attrs).get("href")
+            self._links.append((href, []))
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in SKIPPED_TAGS or self._skip_depth:
+            return
+        if tag in BLOCK_TAGS:
+            self._break_line()
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            if tag not in VOID_TAGS and self._skip_depth:
+                self._skip_depth -= 1
+            return
+        if self._skip_depth:
+            return
+        if tag == "a" and self._links:
+            href, parts = self._links.pop()
+            text = _WHITESPACE.sub(" ", "".join(parts)).strip()
+            if href and text and not href.startswith(("javascript:", "#")):
+                self._emit(f"[{text}]({_escape_href(urljoin(self.base_url, href))})")
+            elif text:
+                self._emit(text)
+        if tag in BLOCK_TAGS:
+            self._break_line()
+        if tag == "pre" and self._pre_depth:
+            self._pre_depth -= 1
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if self._links:
+            self._links[-1][1].append(data)
+        elif self._pre_depth:
+            self._line.append(data)
+        else:
+            self._emit(data)
+
+    def _emit(self, text: str):
+        if self._links:
+            # Text of a nested anchor belongs to the enclosing one.
+            self._links[-1][1].append(text)
+        else:
+            self._line.append(text)
+
+    def _break_line(self):
+        if self._pre_depth:
+            line = "".join(self._line).rstrip()
+        else:
+            line = _WHITESPACE.sub(" ", "".join(self._line)).strip()
+        if line:
+            self.lines.append(line)
+        self._line = []
+
+    def get_text(self) -> str:
+        while self._links:
+            href, parts = self._links.pop()
+            self._emit("".join(parts))
+        self._break_line()
+        return "\n".join(self.lines)
+
+
+def html_to_markdown(html: str, base_url: str = "") -> str:
+    """Returns the visible text of an HTML document with links inlined as markdown."""
+    parser = HTMLToMarkdown(base_url)
+    parser.feed(html)
+    parser.close()
+    return parser.get_text()
+
+
+def looks_js_gated(html: str, text: str) -> bool:
+    """
+    Heuristically decides whether a statically fetched page needs a real browser:
+    the extracted text is (nearly) empty, or the page tells the visitor to enable JavaScript.
+    """
+    if len(text) < MIN_STATIC_TEXT_LENGTH:
+        return True
+    lowered = text[:2000].lower()
+    if any(marker in lowered for marker in JS_GATED_MARKERS):
+        return True
+    # App shells ship a handful of words and a lot of script.
+    return len(text) * 20 < len(html) and html.lower().count("<script") > 10
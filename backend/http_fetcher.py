@@ -0,0 +1,105 @@
+import os
+import logging
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 10.0  # seconds
+DEFAULT_MAX_CONNECTIONS = 50
+DEFAULT_MAX_KEEPALIVE = 20
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024  # decoded bytes of a page body
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+)
+
+TEXT_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+# Headers that describe the body as sent, not the decoded body a fetched response holds
+ENCODING_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+
+class ResponseTooLarge(httpx.HTTPError):
+    """A page body is larger than the fetcher's `max_bytes`."""
+
+
+class HttpFetcher:
+    """
+    Plain HTTP GET fetcher backed by one pooled, keep-alive httpx.AsyncClient.
+    The client is created lazily on first use and must be closed with `aclose`.
+    Responses are streamed: only the body of a 200 text response is downloaded, up to `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_keepalive: int = DEFAULT_MAX_KEEPALIVE,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self._client = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                follow_redirects=True,
+                headers={"User-Agent": USER_AGENT, "Accept": "text/html,application/xhtml+xml,text/plain;q=0.9"},
+            )
+        return self._client
+
+    async def fetch(self, url: str, headers: dict | None = None) -> httpx.Response:
+        """
+        Performs a GET request and returns the response with its decoded body.
+        - The body of a response that is not a 200 with a text content type is not downloaded; it is left empty.
+        - Raises ResponseTooLarge as soon as the body (by its Content-Length, or as it streams in) exceeds
+          `max_bytes`, and httpx.HTTPError on network errors.
+        """
+        async with self._get_client().stream("GET", url, headers=headers) as response:
+            body = b""
+            if response.status_code == 200 and self.is_text_response(response):
+                length = response.headers.get("content-length", "")
+                if length.isdigit() and int(length) > self.max_bytes:
+                    raise ResponseTooLarge(f"{url} is {length} bytes, over the limit of {self.max_bytes}.")
+                chunks, size = [], 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ResponseTooLarge(f"{url} is over the limit of {self.max_bytes} bytes.")
+                    chunks.append(chunk)
+                body = b"".join(chunks)
+        headers = [(name, value) for name, value in response.headers.multi_items() if name not in ENCODING_HEADERS]
+        return httpx.Response(response.status_code, headers=headers, content=body, request=response.request)
+
+    @staticmethod
+    def is_text_response(response: httpx.Response) -> bool:
+        content_type = response.headers.get("content-type", "text/html").split(";")[0].strip().lower()
+        return content_type in TEXT_CONTENT_TYPES
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_http_fetcher = None
+
+
+def get_http_fetcher() -> HttpFetcher:
+    """
+    Returns the process-wide HTTP fetcher configured by HTTP_FETCH_TIMEOUT, HTTP_MAX_CONNECTIONS
+    and HTTP_MAX_BYTES.
+    """
+    global _http_fetcher
+    if _http_fetcher is None:
+        _http_fetcher = HttpFetcher(
+            timeout=float(os.getenv("HTTP_FETCH_TIMEOUT") or DEFAULT_TIMEOUT),
+            max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS") or DEFAULT_MAX_CONNECTIONS),
+            max_bytes=int(os.getenv("HTTP_MAX_BYTES") or DEFAULT_MAX_BYTES),
+        )
+    return _http_fetcher
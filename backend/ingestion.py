@@ -0,0 +1,398 @@
+import os
+import re
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+from urllib.parse import urljoin, urlsplit
+
+from content_extractor import MARKDOWN_LINK, extract_main_content
+from executors import run_io
+from retrieval_index import HEADING, tokenize
+from scrape_cache import ScrapeCache, get_scrape_cache, normalize_url
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PAGES = 50
+DEFAULT_MAX_CRAWL_DEPTH = 3
+DEFAULT_CONCURRENCY = 8
+DEFAULT_HOST_CONCURRENCY = 2
+DEFAULT_HOST_INTERVAL = 0.5  # seconds between request starts to one host
+DEFAULT_NEAR_DUPLICATE_DISTANCE = 3  # differing simhash bits
+DEFAULT_MAX_JOBS = 100
+
+SIMHASH_BITS = 64
+SHINGLE_WORDS = 3
+# Links to files that are not pages are not crawled.
+SKIPPED_EXTENSIONS = re.compile(
+    r"\.(pdf|zip|gz|tar|tgz|png|jpe?g|gif|svg|webp|ico|css|js|json|xml|mp3|mp4|webm|woff2?|ttf|exe|dmg)$", re.IGNORECASE
+)
+
+
+class HostRateLimiter:
+    """
+    Per-host politeness for concurrent scraping.
+    - At most `concurrency` requests to the same host are in flight.
+    - Request starts to the same host are spaced by at least `interval` seconds.
+    - A host is forgotten once it has no request in flight or waiting and its interval has passed.
+    """
+
+    def __init__(self, concurrency: int = DEFAULT_HOST_CONCURRENCY, interval: float = DEFAULT_HOST_INTERVAL):
+        self.concurrency = concurrency
+        self.interval = interval
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._next_start: dict[str, float] = {}
+        # Requests in flight or waiting, by host
+        self._active: Counter[str] = Counter()
+
+    def _forget_idle_hosts(self, now: float) -> None:
+        for host in [host for host, start in self._next_start.items() if start <= now and not self._active[host]]:
+            del self._next_start[host]
+            self._semaphores.pop(host, None)
+
+    def __len__(self) -> int:
+        return len(self._semaphores)
+
+    @asynccontextmanager
+    async def limit(self, url: str):
+        host = urlsplit(url).netloc.lower()
+        self._forget_idle_hosts(time.monotonic())
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self.concurrency))
+        self._active[host] += 1
+        try:
+            async with semaphore:
+                # Reserve the next start slot before sleeping, so that waiting requests queue up in order.
+                now = time.monotonic()
+                start = max(now, self._next_start.get(host, 0.0))
+                self._next_start[host] = start + self.interval
+                if start > now:
+                    await asyncio.sleep(start - now)
+                yield
+        finally:
+            self._active[host] -= 1
+            if not self._active[host]:
+                del self._active[host]
+
+
+def content_hash(text: str) -> str:
+    """Hash of a page's words, insensitive to case, whitespace and punctuation."""
+    return hashlib.sha256(" ".join(tokenize(text)).encode("utf-8")).hexdigest()
+
+
+def simhash(text: str) -> int:
+    """64-bit simhash over word shingles; near-identical pages differ in only a few bits."""
+    words = tokenize(text)
+    shingles = Counter(" ".join(words[index:index + SHINGLE_WORDS]) for index in range(max(1, len(words) - SHINGLE_WORDS + 1)))
+    weights = [0] * SIMHASH_BITS
+    for shingle, count in shingles.items():
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += count if value >> bit & 1 else -count
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def page_title(content: str, url: str) -> str:
+    """The first heading-like line of a page, or its URL."""
+    for line in content.splitlines()[:20]:
+        stripped = line.strip()
+        if stripped and len(stripped.split()) <= 12 and HEADING.match(stripped):
+            return stripped.lstrip("#").strip()
+    return url
+
+
+def crawl_scope(root: str) -> tuple[str, str]:
+    """(host, path prefix) of the pages a crawl from `root` may visit: the root's directory on the same host."""
+    parts = urlsplit(root)
+    return parts.netloc.lower(), parts.path[: parts.path.rfind("/") + 1] or "/"
+
+
+def extract_links(text: str, base_url: str, scope: tuple[str, str]) -> list[str]:
+    """Returns the normalized, in-scope page links of a scraped page, in page order."""
+    host, prefix = scope
+    links = []
+    for _, href in MARKDOWN_LINK.findall(text):
+        url = urljoin(base_url, href)
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or parts.netloc.lower() != host:
+            continue
+        if not parts.path.startswith(prefix) or SKIPPED_EXTENSIONS.search(parts.path):
+            continue
+        links.append(normalize_url(url))
+    return list(dict.fromkeys(links))
+
+
+def merge_corpus(documents: list["IngestedPage"]) -> str:
+    """Joins the ingested pages into one document, one top-level section per page."""
+    return "\n\n".join(f"# {page.title}\nSource: {page.url}\n\n{page.content}" for page in documents)
+
+
+@dataclass
+class IngestedPage:
+    url: str
+    depth: int
+    status: str = "queued"  # queued, fetching, done, duplicate, failed
+    title: str = ""
+    content: str = ""
+    tier: str | None = None
+    duplicate_of: str | None = None
+    error: str | None = None
+
+    def progress(self) -> dict:
+        return {
+            "url": self.url,
+            "depth": self.depth,
+            "status": self.status,
+            "title": self.title,
+            "characters": len(self.content),
+            "tier": self.tier,
+            "duplicate_of": self.duplicate_of,
+            "error": self.error,
+        }
+
+
+@dataclass
+class IngestionJob:
+    """
+    A batch ingestion: crawls the given URLs, then builds a course from the merged corpus.
+    Status moves from 'queued' to 'crawling', 'outlining' and finally 'done' or 'failed'.
+    """
+
+    urls: list[str]
+    crawl_depth: int
+    max_pages: int
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"
+    pages: dict[str, IngestedPage] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    error: str | None = None
+    result: dict | None = None
+    # Incremented on every change, so that watchers can wait for the next one.
+    version: int = 0
+    _changed: asyncio.Condition = field(default_factory=asyncio.Condition, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    @property
+    def documents(self) -> list[IngestedPage]:
+        return [page for page in self.pages.values() if page.status == "done"]
+
+    async def notify(self) -> None:
+        async with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+    async def wait_for_change(self, version: int, timeout: float) -> None:
+        """Waits until the job has changed since `version`, or for `timeout` seconds."""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait_for(lambda: self.version != version), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def progress(self) -> dict:
+        counts = Counter(page.status for page in self.pages.values())
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "version": self.version,
+            "urls": self.urls,
+            "crawl_depth": self.crawl_depth,
+            "max_pages": self.max_pages,
+            "pages_discovered": len(self.pages),
+            "pages_done": counts["done"],
+            "pages_duplicate": counts["duplicate"],
+            "pages_failed": counts["failed"],
+            "pages_pending": counts["queued"] + counts["fetching"],
+            "pages": [page.progress() for page in self.pages.values()],
+            "elapsed": round((self.finished_at or time.time()) - self.created_at, 3),
+            "error": self.error,
+            "result": self.result,
+        }
+
+
+class Crawler:
+    """
+    Fetches the pages of an ingestion job concurrently through the scrape cache.
+    - At most `concurrency` pages are fetched at once; `limiter` applies the per-host limits.
+      Pages still fresh in the scrape cache skip the host limits, as they cost the host nothing.
+    - Links of pages above `crawl_depth` that stay under the root's directory are followed, up to `max_pages` pages.
+    - A page whose words hash like an earlier page's, or whose simhash is within `near_duplicate_distance`
+      bits of one, is recorded as a duplicate and left out of the corpus.
+    """
+
+    def __init__(
+        self,
+        cache: ScrapeCache | None = None,
+        limiter: HostRateLimiter | None = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        near_duplicate_distance: int = DEFAULT_NEAR_DUPLICATE_DISTANCE,
+    ):
+        self.cache = cache or get_scrape_cache()
+        self.limiter = limiter or HostRateLimiter()
+        self.concurrency = concurrency
+        self.near_duplicate_distance = near_duplicate_distance
+
+    async def crawl(self, job: IngestionJob) -> list[IngestedPage]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        fingerprints: list[tuple[str, str, int]] = []  # (url, content hash, simhash) of the pages kept
+        tasks = set()
+        scopes = {}
+
+        def enqueue(url: str, depth: int, scope: tuple[str, str]) -> None:
+            if url in job.pages or len(job.pages) >= job.max_pages:
+                return
+            job.pages[url] = IngestedPage(url=url, depth=depth)
+            scopes[url] = scope
+            tasks.add(asyncio.create_task(visit(job.pages[url])))
+
+        async def visit(page: IngestedPage) -> None:
+            async with semaphore:
+                page.status = "fetching"
+                await job.notify()
+                try:
+                    entry = await self._fetch(page.url)
+                except Exception as e:
+                    logger.warning("Ingestion job %s could not scrape %s: %s", job.id, page.url, e)
+                    page.status, page.error = "failed", str(e) or type(e).__name__
+                    await job.notify()
+                    return
+
+            page.tier = entry.tier
+            content = await run_io(extract_main_content, entry.text)
+            page_hash = content_hash(content)
+            page_simhash = await run_io(simhash, content)
+            duplicate_of = next(
+                (url for url, other_hash, other_simhash in fingerprints
+                 if other_hash == page_hash or hamming_distance(other_simhash, page_simhash) <= self.near_duplicate_distance),
+                None,
+            )
+            if not content.strip():
+                page.status, page.error = "failed", "No content could be extracted."
+            elif duplicate_of is not None:
+                page.status, page.duplicate_of = "duplicate", duplicate_of
+            else:
+                fingerprints.append((page.url, page_hash, page_simhash))
+                page.status, page.content, page.title = "done", content, page_title(content, page.url)
+            # Duplicates are still crawled through: a mirror of a page can link to pages the original does not.
+            if page.depth < job.crawl_depth:
+                for link in extract_links(entry.text, page.url, scopes[page.url]):
+                    enqueue(link, page.depth + 1, scopes[page.url])
+            await job.notify()
+
+        for url in job.urls:
+            normalized = normalize_url(url)
+            enqueue(normalized, 0, crawl_scope(normalized))
+        while tasks:
+            done, _ = await asyncio.wait(tasks)
+            tasks -= done
+        # The corpus follows discovery order, so the roots come first and a site reads top-down.
+        return job.documents
+
+    async def _fetch(self, url: str):
+        entry = await run_io(self.cache.get, url)
+        if entry is not None and entry.is_fresh(self.cache.ttl):
+            return await self.cache.scrape(url, cached=entry)
+        async with self.limiter.limit(url):
+            return await self.cache.scrape(url, cached=entry)
+
+
+class IngestionManager:
+    """
+    Runs ingestion jobs in the background and keeps their progress for polling.
+    - `build_course(job)` is awaited with the crawled pages and returns the job result (the new conversation).
+    - The last `max_jobs` jobs are kept; the oldest finished jobs are forgotten first.
+    """
+
+    def __init__(
+        self,
+        build_course: Callable[[IngestionJob], Awaitable[dict]],
+        crawler: Crawler | None = None,
+        max_jobs: int = DEFAULT_MAX_JOBS,
+    ):
+        self.build_course = build_course
+        self.crawler = crawler
+        self.max_jobs = max_jobs
+        self._jobs: OrderedDict[str, IngestionJob] = OrderedDict()
+        self._tasks: dict[str, asyncio.Task] = {}
+        self.completed = 0
+        self.failed = 0
+
+    def start(self, urls: list[str], crawl_depth: int = 0, max_pages: int | None = None) -> IngestionJob:
+        page_limit = int(os.getenv("INGEST_MAX_PAGES") or DEFAULT_MAX_PAGES)
+        job = IngestionJob(
+            urls=list(dict.fromkeys(urls)),
+            crawl_depth=min(crawl_depth, int(os.getenv("INGEST_MAX_CRAWL_DEPTH") or DEFAULT_MAX_CRAWL_DEPTH)),
+            max_pages=min(max_pages or page_limit, page_limit),
+        )
+        self._jobs[job.id] = job
+        self._forget_finished()
+        self._tasks[job.id] = asyncio.create_task(self._run(job))
+        logger.info("Started ingestion job %s for %d URLs (crawl depth %d).", job.id, len(job.urls), job.crawl_depth)
+        return job
+
+    def get(self, job_id: str) -> IngestionJob:
+        """Returns a job by id. Raises KeyError if it does not exist."""
+        return self._jobs[job_id]
+
+    async def _run(self, job: IngestionJob) -> None:
+        try:
+            job.status = "crawling"
+            await job.notify()
+            # One crawler serves all jobs, so that the per-host limits hold across jobs.
+            if self.crawler is None:
+                self.crawler = create_crawler()
+            documents = await self.crawler.crawl(job)
+            if not documents:
+                raise ValueError("None of the pages could be scraped.")
+            job.status = "outlining"
+            await job.notify()
+            job.result = await self.build_course(job)
+            job.status = "done"
+            self.completed += 1
+        except Exception as e:
+            logger.exception("Ingestion job %s failed: %s", job.id, e)
+            job.status, job.error = "failed", str(e)
+            self.failed += 1
+        finally:
+            job.finished_at = time.time()
+            self._tasks.pop(job.id, None)
+            logger.info("Ingestion job %s %s in %.2f seconds.", job.id, job.status, job.finished_at - job.created_at)
+            await job.notify()
+
+    def _forget_finished(self) -> None:
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished]:
+            if len(self._jobs) <= self.max_jobs:
+                break
+            del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        return {
+            "jobs": len(self._jobs),
+            "running": len(self._tasks),
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+def create_crawler() -> Crawler:
+    """Creates a crawler configured by INGEST_CONCURRENCY, INGEST_HOST_CONCURRENCY, INGEST_HOST_INTERVAL and INGEST_NEAR_DUPLICATE_DISTANCE."""
+    return Crawler(
+        limiter=HostRateLimiter(
+            concurrency=int(os.getenv("INGEST_HOST_CONCURRENCY") or DEFAULT_HOST_CONCURRENCY),
+            interval=float(os.getenv("INGEST_HOST_INTERVAL") or DEFAULT_HOST_INTERVAL),
+        ),
+        concurrency=int(os.getenv("INGEST_CONCURRENCY") or DEFAULT_CONCURRENCY),
+        near_duplicate_distance=int(os.getenv("INGEST_NEAR_DUPLICATE_DISTANCE") or DEFAULT_NEAR_DUPLICATE_DISTANCE),
+    )
@@ -0,0 +1,386 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from admission import Overloaded
+from executors import run_io
+from leases import WORKER_ID
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOB_STORE_PATH = "jobs.db"
+DEFAULT_MAX_RUNNING = 4
+DEFAULT_MAX_QUEUED = 64
+DEFAULT_MAX_WAIT = 30.0  # seconds a status request may be held open
+DEFAULT_RETENTION = 7 * 24 * 60 * 60  # seconds finished jobs are kept
+DEFAULT_HEARTBEAT_TTL = 60.0  # seconds without a heartbeat after which a worker's unfinished jobs are failed
+QUEUE_FULL_RETRY_AFTER = 10  # seconds
+
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+
+
+@dataclass
+class Job:
+    """
+    A unit of background work, such as an agent turn that scrapes and outlines a course.
+    Status moves from 'queued' to 'running' and finally 'done', 'failed' or 'cancelled'.
+    """
+
+    kind: str
+    conversation_id: str | None = None
+    idempotency_key: str | None = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    result: dict | None = None
+    error: str | None = None
+    # Incremented on every status change, so that long-polling clients can wait for the next one.
+    version: int = 0
+    _changed: asyncio.Condition | None = field(default=None, repr=False)
+    _task: asyncio.Task | None = field(default=None, repr=False)
+    _on_cancel: Callable[[], None] | None = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "conversation_id": self.conversation_id,
+            "status": self.status,
+            "version": self.version,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobStore:
+    """
+    SQLite job table, so that job status and results outlive the request that started the job.
+    - Several workers can share the table: each job is owned by the worker that accepted it (`worker_id`),
+      and every worker records a heartbeat in the `workers` table while it runs.
+    - Jobs still queued or running when their owner stopped are marked failed by `recover`, once the owner's
+      heartbeat has expired. Jobs of live workers are left alone.
+    """
+
+    def __init__(self, path: str = DEFAULT_JOB_STORE_PATH, worker_id: str = WORKER_ID):
+        self.path = path
+        self.worker_id = worker_id
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    conversation_id TEXT,
+                    idempotency_key TEXT UNIQUE,
+                    status TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    result TEXT,
+                    error TEXT,
+                    owner TEXT
+                )
+                """
+            )
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")]
+            if "owner" not in columns:
+                # Tables created before jobs had owners; their unfinished jobs are recovered as ownerless.
+                self._connection.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, heartbeat_at REAL NOT NULL)"
+            )
+
+    def save(self, job: Job) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+                INSERT OR REPLACE INTO jobs
+                (id, kind, conversation_id, idempotency_key, status, version, created_at, started_at, finished_at, result, error,
+                owner)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    job.id, job.kind, job.conversation_id, job.idempotency_key, job.status, job.version,
+                    job.created_at, job.started_at, job.finished_at,
+                    json.dumps(job.result) if job.result is not None else None, job.error, self.worker_id,
+                ),
+            )
+
+    def _load(self, where: str, value: str) -> Job | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT id, kind, conversation_id, idempotency_key, status, version, created_at, started_at, "
+                f"finished_at, result, error FROM jobs WHERE {where} = ?",
+                (value,),
+            ).fetchone()
+        if row is None:
+            return None
+        return Job(
+            id=row[0], kind=row[1], conversation_id=row[2], idempotency_key=row[3], status=row[4], version=row[5],
+            created_at=row[6], started_at=row[7], finished_at=row[8],
+            result=json.loads(row[9]) if row[9] is not None else None, error=row[10],
+        )
+
+    def get(self, job_id: str) -> Job | None:
+        return self._load("id", job_id)
+
+    def get_by_idempotency_key(self, key: str) -> Job | None:
+        return self._load("idempotency_key", key)
+
+    def heartbeat(self) -> None:
+        """Records that this worker is alive, which keeps its unfinished jobs from being recovered."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO workers (id, heartbeat_at) VALUES (?, ?)", (self.worker_id, time.time())
+            )
+
+    def recover(self, heartbeat_ttl: float = DEFAULT_HEARTBEAT_TTL, retention: float = DEFAULT_RETENTION) -> int:
+        """
+        Fails the unfinished jobs of workers without a heartbeat in the last `heartbeat_ttl` seconds,
+        and deletes finished jobs older than `retention` seconds.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            interrupted = self._connection.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Interrupted: the worker running it stopped.', "
+                "finished_at = ?, version = version + 1 WHERE status IN ('queued', 'running') "
+                "AND (owner IS NULL OR owner NOT IN (SELECT id FROM workers WHERE heartbeat_at >= ?))",
+                (now, now - heartbeat_ttl),
+            ).rowcount
+            self._connection.execute("DELETE FROM workers WHERE heartbeat_at < ?", (now - heartbeat_ttl,))
+            self._connection.execute("DELETE FROM jobs WHERE finished_at < ?", (now - retention,))
+        return interrupted
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class JobManager:
+    """
+    Runs jobs in the background and answers status requests, with long-polling.
+    - At most `max_running` jobs run at once; up to `max_queued` more wait, and further jobs are rejected.
+    - A job submitted again with the same idempotency key returns the existing job instead of running twice.
+    - Cancelling a job calls its cancel hook (which stops in-flight model calls) and cancels its task.
+    - Live jobs are kept in memory; every status change is written to the job table.
+    - `run_heartbeat` keeps this worker's jobs alive in the table, and fails those of stopped workers.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        max_running: int = DEFAULT_MAX_RUNNING,
+        max_queued: int = DEFAULT_MAX_QUEUED,
+        heartbeat_ttl: float = DEFAULT_HEARTBEAT_TTL,
+    ):
+        self.store = store
+        self.heartbeat_ttl = heartbeat_ttl
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self._slots: asyncio.Semaphore | None = None
+        self._live: dict[str, Job] = {}
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_running)
+        return self._slots
+
+    @property
+    def running(self) -> int:
+        return sum(1 for job in self._live.values() if job.status == "running")
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for job in self._live.values() if job.status == "queued")
+
+    async def submit(
+        self,
+        kind: str,
+        work: Callable[[], Awaitable[dict]],
+        conversation_id: str | None = None,
+        idempotency_key: str | None = None,
+        on_cancel: Callable[[], None] | None = None,
+    ) -> Job:
+        """
+        Starts `work` as a background job and returns the job at once.
+        Raises Overloaded (503) when the job queue is full.
+        """
+        if idempotency_key:
+            existing = await self.get_by_idempotency_key(idempotency_key)
+            if existing is not None:
+                return existing
+        # Queued jobs count until they start, so that simultaneous submissions cannot all pass the check.
+        if len(self._live) >= self.max_running + self.max_queued:
+            raise Overloaded("Too many jobs are queued; try again shortly.", 503, QUEUE_FULL_RETRY_AFTER)
+
+        job = Job(kind=kind, conversation_id=conversation_id, idempotency_key=idempotency_key)
+        job._changed = asyncio.Condition()
+        job._on_cancel = on_cancel
+        self._live[job.id] = job
+        self.submitted += 1
+        await run_io(self.store.save, job)
+        job._task = asyncio.create_task(self._run(job, work))
+        logger.info("Submitted %s job %s for conversation %s.", kind, job.id, conversation_id)
+        return job
+
+    def _find_live(self, idempotency_key: str) -> Job | None:
+        return next((job for job in self._live.values() if job.idempotency_key == idempotency_key), None)
+
+    async def get_by_idempotency_key(self, idempotency_key: str) -> Job | None:
+        """Returns the job submitted with `idempotency_key`, or None."""
+        job = self._find_live(idempotency_key) or await run_io(self.store.get_by_idempotency_key, idempotency_key)
+        # Look again: a concurrent submit with the same key may have registered its job meanwhile.
+        return job or self._find_live(idempotency_key)
+
+    async def _set_status(self, job: Job, status: str) -> None:
+        job.status = status
+        async with job._changed:
+            job.version += 1
+            job._changed.notify_all()
+        await run_io(self.store.save, job)
+
+    async def _run(self, job: Job, work: Callable[[], Awaitable[dict]]) -> None:
+        try:
+            async with self._get_slots():
+                job.started_at = time.time()
+                await self._set_status(job, "running")
+                job.result = await work()
+            job.finished_at = time.time()
+            self.completed += 1
+            await self._set_status(job, "done")
+        except asyncio.CancelledError:
+            job.finished_at = time.time()
+            job.error = job.error or "Cancelled."
+            self.cancelled += 1
+            await self._set_status(job, "cancelled")
+        except Exception as e:
+            logger.exception("%s job %s failed: %s", job.kind, job.id, e)
+            job.finished_at = time.time()
+            job.error = str(e)
+            if isinstance(e, Overloaded):
+                job.result = {"status_code": e.status_code, "retry_after": e.retry_after}
+            self.failed += 1
+            await self._set_status(job, "failed")
+        finally:
+            self._live.pop(job.id, None)
+            logger.info("%s job %s %s in %.2f seconds.", job.kind, job.id, job.status, time.time() - job.created_at)
+
+    async def get(self, job_id: str, wait: float = 0.0, version: int | None = None) -> Job | None:
+        """
+        Returns a job, or None if it does not exist.
+        With `wait`, holds the request until the job's version differs from `version`
+        (or it finishes) or `wait` seconds pass.
+        """
+        job = self._live.get(job_id)
+        if job is None:
+            return await run_io(self.store.get, job_id)
+        if wait > 0 and not job.finished:
+            since = job.version if version is None else version
+            async with job._changed:
+                try:
+                    await asyncio.wait_for(
+                        job._changed.wait_for(lambda: job.version != since or job.finished), min(wait, DEFAULT_MAX_WAIT)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        return job
+
+    async def cancel(self, job_id: str) -> Job | None:
+        """Cancels a queued or running job and waits until it has stopped. Finished jobs are returned unchanged."""
+        job = self._live.get(job_id)
+        if job is None:
+            return await run_io(self.store.get, job_id)
+        if job._on_cancel is not None and job.status == "running":
+            job._on_cancel()
+        job._task.cancel()
+        try:
+            await asyncio.shield(job._task)
+        except asyncio.CancelledError:
+            pass
+        return job
+
+    async def run_heartbeat(self, interval: float | None = None) -> None:
+        """
+        Records a heartbeat every `interval` seconds (a third of the heartbeat TTL by default) until cancelled,
+        and fails the unfinished jobs of workers whose heartbeat has expired.
+        """
+        interval = interval or self.heartbeat_ttl / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await run_io(self.store.heartbeat)
+                interrupted = await run_io(self.store.recover, self.heartbeat_ttl)
+                if interrupted:
+                    logger.warning("Marked %d jobs of stopped workers as failed.", interrupted)
+            except Exception as e:
+                logger.exception("Failed to record the job heartbeat: %s", e)
+
+    async def shutdown(self) -> None:
+        """Cancels every live job; they are recorded as cancelled."""
+        for job_id in list(self._live):
+            await self.cancel(job_id)
+        await run_io(self.store.close)
+
+    def stats(self) -> dict:
+        return {
+            "max_running": self.max_running,
+            "max_queued": self.max_queued,
+            "running": self.running,
+            "queued": self.queued,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+        }
+
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """
+    Returns the process-wide job manager configured by JOB_STORE_PATH, JOB_MAX_RUNNING, JOB_MAX_QUEUED
+    and JOB_HEARTBEAT_TTL.
+    On creation, jobs that stopped workers (including a previous process of this one) left unfinished are marked failed.
+    """
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            store = JobStore(os.getenv("JOB_STORE_PATH") or DEFAULT_JOB_STORE_PATH)
+            heartbeat_ttl = float(os.getenv("JOB_HEARTBEAT_TTL") or DEFAULT_HEARTBEAT_TTL)
+            store.heartbeat()
+            interrupted = store.recover(heartbeat_ttl)
+            if interrupted:
+                logger.warning("Marked %d jobs of stopped workers as failed.", interrupted)
+            _job_manager = JobManager(
+                store,
+                max_running=int(os.getenv("JOB_MAX_RUNNING") or DEFAULT_MAX_RUNNING),
+                max_queued=int(os.getenv("JOB_MAX_QUEUED") or DEFAULT_MAX_QUEUED),
+                heartbeat_ttl=heartbeat_ttl,
+            )
+        return _job_manager
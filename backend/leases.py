@@ -0,0 +1,95 @@
+import os
+import uuid
+import socket
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from typing import Callable
+
+from admission import Overloaded
+from executors import run_io
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_TTL = 30.0  # seconds
+DEFAULT_LEASE_WAIT = 10.0  # seconds a turn waits for a lease held by another worker
+LEASE_POLL_INTERVAL = 0.5  # seconds
+LEASE_BUSY_RETRY_AFTER = 5  # seconds
+
+# Identifies this worker process as the owner of its leases.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_stats = {"acquired": 0, "waited": 0, "rejected": 0, "lost": 0}
+_stats_lock = threading.Lock()
+
+
+def _record(event: str) -> None:
+    with _stats_lock:
+        _stats[event] += 1
+
+
+def lease_stats() -> dict:
+    with _stats_lock:
+        return {"worker_id": WORKER_ID, **_stats}
+
+
+def get_lease_ttl() -> float:
+    return float(os.getenv("LEASE_TTL") or DEFAULT_LEASE_TTL)
+
+
+def get_lease_wait() -> float:
+    return float(os.getenv("LEASE_WAIT") or DEFAULT_LEASE_WAIT)
+
+
+async def _renew(store, conversation_id: str, ttl: float, on_lost: Callable[[], None]) -> None:
+    while True:
+        await asyncio.sleep(ttl / 3)
+        try:
+            renewed = await run_io(store.renew_lease, conversation_id, WORKER_ID, ttl)
+        except Exception as e:
+            # The store may be back before the lease expires.
+            logger.warning("Failed to renew the lease of conversation %s: %s", conversation_id, e)
+            continue
+        if not renewed:
+            _record("lost")
+            logger.warning("Lost the lease of conversation %s; cancelling its turn.", conversation_id)
+            on_lost()
+            return
+
+
+@asynccontextmanager
+async def hold_lease(store, conversation_id: str, on_lost: Callable[[], None]):
+    """
+    Holds the lease of a conversation for the duration of the `async with` block, so that no other
+    worker sharing `store` runs a turn of it at the same time.
+    - A lease held by another worker is waited for up to LEASE_WAIT seconds, then Overloaded (429) is raised.
+    - The lease expires LEASE_TTL seconds after it was last renewed; it is renewed every third of that while held.
+    - `on_lost` is called if a renewal finds that the lease has expired and been taken over.
+    """
+    ttl = get_lease_ttl()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + get_lease_wait()
+    waited = False
+    while not await run_io(store.acquire_lease, conversation_id, WORKER_ID, ttl):
+        if loop.time() >= deadline:
+            _record("rejected")
+            raise Overloaded(
+                "The conversation is running a turn on another worker; try again shortly.", 429, LEASE_BUSY_RETRY_AFTER
+            )
+        waited = True
+        await asyncio.sleep(LEASE_POLL_INTERVAL)
+    _record("acquired")
+    if waited:
+        _record("waited")
+
+    renewal = asyncio.create_task(_renew(store, conversation_id, ttl, on_lost))
+    try:
+        yield
+    finally:
+        renewal.cancel()
+        try:
+            await run_io(store.release_lease, conversation_id, WORKER_ID)
+        except Exception as e:
+            # The lease expires on its own.
+            logger.warning("Failed to release the lease of conversation %s: %s", conversation_id, e)
@@ -0,0 +1,42 @@
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def start_queue_logging(filename: str, level: int = logging.INFO, format: str = logging.BASIC_FORMAT) -> None:
+    """
+    Configures the root logger to write to `filename` without blocking the caller.
+    - Records are put on an in-memory queue by a QueueHandler, so logging from the event loop never waits on disk.
+    - A QueueListener thread formats them and writes them to the file.
+    - Does nothing if the root logger already has handlers, like `logging.basicConfig`.
+    """
+    global _listener
+    with _listener_lock:
+        root = logging.getLogger()
+        if _listener is not None or root.handlers:
+            return
+        file_handler = logging.FileHandler(filename, mode="a")
+        file_handler.setFormatter(logging.Formatter(format))
+        records = queue.SimpleQueue()
+        _listener = QueueListener(records, file_handler, respect_handler_level=True)
+        _listener.start()
+        root.addHandler(QueueHandler(records))
+        root.setLevel(level)
+        atexit.register(stop_queue_logging)
+
+
+def stop_queue_logging() -> None:
+    """Writes the records still queued and stops the listener thread."""
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
@@ -0,0 +1,171 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 100
+DEFAULT_IDLE_TTL = 30 * 60  # seconds
+
+
+class ManagerCache:
+    """
+    Bounded LRU cache of live AITeacher instances keyed by conversation id.
+
+    - At most `max_size` teams are kept in memory; the least recently used one is evicted first.
+    - Teams idle for longer than `idle_ttl` seconds are evicted on the next cache access, and by
+      `run_expiry` (started by the app) when there is none.
+    - Evicted teams persist their state before being dropped, and a later `get` transparently
+      rehydrates them through `loader` (which calls `team.load_state`).
+    - Teams that are in the middle of a run, or have turns waiting to run, are never evicted.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], Awaitable[object | None]],
+        max_size: int = DEFAULT_MAX_SIZE,
+        idle_ttl: float = DEFAULT_IDLE_TTL,
+    ):
+        self.loader = loader
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._entries: OrderedDict[str, tuple[object, float]] = OrderedDict()
+        self._loading: dict[str, asyncio.Future] = {}
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return conversation_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, conversation_id: str):
+        """
+        Returns the live team for a conversation, rehydrating it from storage on a miss.
+        Raises KeyError if the conversation does not exist.
+        """
+        async with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is not None:
+                self.hits += 1
+                self._touch(conversation_id, entry[0])
+                evicted = self._collect_evictions()
+            else:
+                self.misses += 1
+                future = self._loading.get(conversation_id)
+                owner = future is None
+                if owner:
+                    # Concurrent misses for the same conversation share a single rehydration.
+                    future = asyncio.get_running_loop().create_future()
+                    self._loading[conversation_id] = future
+
+        if entry is not None:
+            await self._persist(evicted)
+            return entry[0]
+        if not owner:
+            return await future
+
+        try:
+            manager = await self.loader(conversation_id)
+            if manager is None:
+                raise KeyError(conversation_id)
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case no other request is waiting on it.
+            future.exception()
+            raise
+        finally:
+            async with self._lock:
+                self._loading.pop(conversation_id, None)
+
+        await self.put(conversation_id, manager)
+        future.set_result(manager)
+        return manager
+
+    async def put(self, conversation_id: str, manager) -> None:
+        """Adds a live team to the cache, evicting idle and least recently used teams as needed."""
+        async with self._lock:
+            self._touch(conversation_id, manager)
+            evicted = self._collect_evictions()
+        await self._persist(evicted)
+
+    async def discard(self, conversation_id: str):
+        """Drops a team without persisting it (used when the conversation is deleted), and returns it or None."""
+        async with self._lock:
+            entry = self._entries.pop(conversation_id, None)
+        return None if entry is None else entry[0]
+
+    async def evict_expired(self) -> int:
+        """Evicts every team that has been idle for longer than the TTL. Returns the number evicted."""
+        async with self._lock:
+            evicted = self._collect_evictions()
+        await self._persist(evicted)
+        return len(evicted)
+
+    async def run_expiry(self, interval: float | None = None) -> None:
+        """Evicts idle teams every `interval` seconds (a tenth of the TTL by default) until cancelled."""
+        interval = interval or max(1.0, self.idle_ttl / 10)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.evict_expired()
+            except Exception as e:
+                logger.exception("Failed to evict idle teams: %s", e)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "idle_ttl": self.idle_ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _touch(self, conversation_id: str, manager) -> None:
+        self._entries[conversation_id] = (manager, time.monotonic())
+        self._entries.move_to_end(conversation_id)
+
+    def _collect_evictions(self) -> list:
+        """Removes expired and overflowing entries (oldest first) and returns them for persisting."""
+        evicted = []
+        now = time.monotonic()
+        for conversation_id, (manager, last_used) in list(self._entries.items()):
+            if getattr(manager, "is_running", False) or getattr(manager, "pending_turns", 0):
+                continue
+            expired = now - last_used > self.idle_ttl
+            overflowing = len(self._entries) > self.max_size
+            if not expired and not overflowing:
+                break
+            del self._entries[conversation_id]
+            if expired:
+                self.expirations += 1
+            else:
+                self.evictions += 1
+            evicted.append((conversation_id, manager))
+        return evicted
+
+    async def _persist(self, evicted: list) -> None:
+        for conversation_id, manager in evicted:
+            try:
+                await manager.persist()
+                logger.info("Evicted conversation %s from the manager cache.", conversation_id)
+            except Exception as e:
+                logger.exception("Failed to persist evicted conversation %s: %s", conversation_id, e)
+
+
+def create_manager_cache(loader: Callable[[str], Awaitable[object | None]]) -> ManagerCache:
+    """Creates a cache sized by MANAGER_CACHE_MAX_SIZE and MANAGER_CACHE_IDLE_TTL (seconds)."""
+    return ManagerCache(
+        loader,
+        max_size=int(os.getenv("MANAGER_CACHE_MAX_SIZE") or DEFAULT_MAX_SIZE),
+        idle_ttl=float(os.getenv("MANAGER_CACHE_IDLE_TTL") or DEFAULT_IDLE_TTL),
+    )
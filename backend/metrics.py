@@ -0,0 +1,269 @@
+import math
+import time
+import functools
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from opentelemetry import trace
+from autogen_agentchat.messages import HandoffMessage, ToolCallExecutionEvent, ToolCallRequestEvent
+
+# Spans are no-ops unless a tracer provider is configured, e.g. by running under `opentelemetry-instrument`.
+tracer = trace.get_tracer(__name__)
+
+# Histogram buckets in seconds, from fast storage calls to multi-minute course outlines.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base class of the metrics exported at /metrics in the Prometheus text format."""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, object] = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}", *self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def totals(self) -> dict[tuple, float]:
+        """Returns the value of the counter, by label values."""
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            return [
+                f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())
+            ]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the wall time of the `with` block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def wrap(self, func, **labels):
+        """Returns `func` wrapped so that each call is observed, e.g. to time blocking work run on an executor."""
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            with self.time(**labels):
+                return func(*args, **kwargs)
+
+        return timed
+
+    def totals(self) -> dict[tuple, tuple[int, float]]:
+        """Returns the number and sum of observations, by label values."""
+        with self._lock:
+            return {key: (counts[-1], total) for key, (counts, total) in self._values.items()}
+
+    def samples(self) -> list[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            self._metrics.setdefault(metric.name, metric)
+            return self._metrics[metric.name]
+
+    def render(self, gauges: dict[str, dict] | None = None) -> str:
+        """
+        Renders every registered metric, plus `gauges`: the numbers of each /stats section,
+        exported as `teacher_<section>_<key>` (nested sections get a `name` label).
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        blocks = [metric.render() for metric in metrics]
+        for section, values in (gauges or {}).items():
+            blocks.extend(_render_gauges(f"teacher_{section}", values))
+        return "\n".join(blocks) + "\n"
+
+
+def _render_gauges(prefix: str, values: dict) -> list[str]:
+    samples: dict[str, list[str]] = {}
+    for key, value in values.items():
+        if isinstance(value, dict):
+            for nested_key, nested_value in value.items():
+                if isinstance(nested_value, (int, float)) and not isinstance(nested_value, bool):
+                    samples.setdefault(f"{prefix}_{nested_key}", []).append(
+                        f'{prefix}_{nested_key}{{name="{_escape(key)}"}} {_format_value(nested_value)}'
+                    )
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            samples.setdefault(f"{prefix}_{key}", []).append(f"{prefix}_{key} {_format_value(value)}")
+    return [f"# TYPE {name} gauge\n" + "\n".join(lines) for name, lines in samples.items()]
+
+
+REGISTRY = Registry()
+
+TURN_SECONDS = REGISTRY.register(
+    Histogram("teacher_turn_seconds", "Wall time of agent turns.", ("operation", "status"))
+)
+AGENT_SECONDS = REGISTRY.register(
+    Histogram("teacher_agent_seconds", "Wall time an agent spent producing its messages in one turn.", ("agent",))
+)
+MODEL_TOKENS = REGISTRY.register(
+    Counter("teacher_model_tokens_total", "Tokens reported by the model client, by agent.", ("agent", "type"))
+)
+HANDOFFS = REGISTRY.register(Counter("teacher_handoffs_total", "Handoffs between agents.", ("source", "target")))
+TOOL_CALL_SECONDS = REGISTRY.register(
+    Histogram("teacher_tool_call_seconds", "Wall time of tool calls, from request to result.", ("agent", "tool"))
+)
+SCRAPE_SECONDS = REGISTRY.register(
+    Histogram("teacher_scrape_seconds", "Wall time of page scrapes, by the tier that served them.", ("tier",))
+)
+STORAGE_SECONDS = REGISTRY.register(
+    Histogram("teacher_storage_seconds", "Wall time of conversation store calls.", ("operation",))
+)
+
+
+def record_usage(agent: str, usage) -> None:
+    """Counts the tokens of a model response's `RequestUsage` (or a message's `models_usage`)."""
+    if usage is None:
+        return
+    MODEL_TOKENS.inc(usage.prompt_tokens, agent=agent, type="prompt")
+    MODEL_TOKENS.inc(usage.completion_tokens, agent=agent, type="completion")
+
+
+class TurnRecorder:
+    """
+    Records the metrics of one agent turn from the messages of `run_stream`, and mirrors them as trace spans.
+    - The time between two messages is attributed to the agent that produced the second one.
+    - Token usage is taken from each message's `models_usage`.
+    - Tool calls are timed from their request event to their execution event.
+    """
+
+    def __init__(self, operation: str, conversation_id: str):
+        self.operation = operation
+        self.started = self.last = time.perf_counter()
+        self.agent_seconds = defaultdict(float)
+        # Tool calls in flight, by call id: (agent, tool, started, span)
+        self._tool_calls = {}
+        self.span = tracer.start_span(
+            "teacher.turn", attributes={"teacher.operation": operation, "teacher.conversation_id": conversation_id}
+        )
+        self._context = trace.set_span_in_context(self.span)
+
+    def _span(self, name: str, started: float, attributes: dict):
+        start_time = time.time_ns() - int((time.perf_counter() - started) * 1e9)
+        return tracer.start_span(name, context=self._context, start_time=start_time, attributes=attributes)
+
+    def record(self, message) -> None:
+        agent = getattr(message, "source", None)
+        if agent is None:
+            # The TaskResult that ends the stream
+            return
+        now = time.perf_counter()
+        if agent != "user":
+            self.agent_seconds[agent] += now - self.last
+            usage = message.models_usage
+            attributes = {"teacher.agent": agent, "teacher.message_type": type(message).__name__}
+            if usage is not None:
+                attributes.update(
+                    {"teacher.prompt_tokens": usage.prompt_tokens, "teacher.completion_tokens": usage.completion_tokens}
+                )
+            self._span("teacher.agent_step", self.last, attributes).end()
+        self.last = now
+        record_usage(agent, message.models_usage)
+
+        if isinstance(message, HandoffMessage):
+            HANDOFFS.inc(source=agent, target=message.target)
+        elif isinstance(message, ToolCallRequestEvent):
+            for call in message.content:
+                span = self._span("teacher.tool_call", now, {"teacher.agent": agent, "teacher.tool": call.name})
+                self._tool_calls[call.id] = (agent, call.name, now, span)
+        elif isinstance(message, ToolCallExecutionEvent):
+            for result in message.content:
+                call = self._tool_calls.pop(result.call_id, None)
+                if call is not None:
+                    TOOL_CALL_SECONDS.observe(now - call[2], agent=call[0], tool=call[1])
+                    call[3].end()
+
+    def finish(self, status: str) -> float:
+        """Records the turn's totals with `status` ('ok', 'error', 'cancelled' or 'conflict') and returns its wall time."""
+        elapsed = time.perf_counter() - self.started
+        for agent, seconds in self.agent_seconds.items():
+            AGENT_SECONDS.observe(seconds, agent=agent)
+        TURN_SECONDS.observe(elapsed, operation=self.operation, status=status)
+        for call in self._tool_calls.values():
+            call[3].end()
+        self.span.set_attribute("teacher.status", status)
+        self.span.end()
+        return elapsed
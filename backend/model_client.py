@@ -0,0 +1,79 @@
+import os
+import logging
+
+import httpx
+from autogen_core.models import ChatCompletionClient
+from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE = 20
+DEFAULT_KEEPALIVE_EXPIRY = 60.0  # seconds
+DEFAULT_TIMEOUT = 120.0  # seconds
+DEFAULT_MAX_RETRIES = 2
+
+
+def create_model_client(http_client: httpx.AsyncClient | None = None) -> AzureOpenAIChatCompletionClient:
+    """
+    Creates the Azure OpenAI chat completion client from the environment.
+    - The client sends its requests through one pooled, keep-alive httpx.AsyncClient, so TLS
+      connections to the endpoint are reused across requests and conversations.
+    - The pool is tuned by MODEL_MAX_CONNECTIONS, MODEL_MAX_KEEPALIVE, MODEL_KEEPALIVE_EXPIRY,
+      MODEL_TIMEOUT and MODEL_MAX_RETRIES.
+    """
+    http_client = http_client or create_http_client()
+    return AzureOpenAIChatCompletionClient(
+        azure_deployment=os.getenv("AZURE_DEPLOYMENT"),
+        model=os.getenv("MODEL"),
+        api_version=os.getenv("API_VERSION"),
+        azure_endpoint=os.getenv("AZURE_ENDPOINT"),
+        api_key=os.getenv("API_KEY"),
+        max_retries=int(os.getenv("MODEL_MAX_RETRIES") or DEFAULT_MAX_RETRIES),
+        http_client=http_client,
+    )
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Creates the pooled HTTP client used to talk to the model endpoint."""
+    return httpx.AsyncClient(
+        timeout=float(os.getenv("MODEL_TIMEOUT") or DEFAULT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=int(os.getenv("MODEL_MAX_CONNECTIONS") or DEFAULT_MAX_CONNECTIONS),
+            max_keepalive_connections=int(os.getenv("MODEL_MAX_KEEPALIVE") or DEFAULT_MAX_KEEPALIVE),
+            keepalive_expiry=float(os.getenv("MODEL_KEEPALIVE_EXPIRY") or DEFAULT_KEEPALIVE_EXPIRY),
+        ),
+    )
+
+
+_model_client = None
+_http_client = None
+
+
+def get_model_client() -> ChatCompletionClient:
+    """Returns the process-wide model client shared by every teaching team."""
+    global _model_client, _http_client
+    if _model_client is None:
+        _http_client = create_http_client()
+        _model_client = create_model_client(_http_client)
+        logger.info("Created the shared model client.")
+    return _model_client
+
+
+async def set_model_client(client: ChatCompletionClient | None, http_client: httpx.AsyncClient | None = None) -> None:
+    """
+    Replaces the process-wide model client, e.g. with a scripted client for benchmarks.
+    The connection pool of the client it replaces is closed; `http_client` is the new client's pool, if it has one,
+    to be closed in turn.
+    """
+    global _model_client, _http_client
+    await close_model_client()
+    _model_client, _http_client = client, http_client
+
+
+async def close_model_client() -> None:
+    """Closes the shared model client and its connection pool, on application shutdown or when it is replaced."""
+    global _model_client, _http_client
+    http_client, _http_client, _model_client = _http_client, None, None
+    if http_client is not None:
+        await http_client.aclose()
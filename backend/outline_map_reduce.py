@@ -0,0 +1,115 @@
+import os
+import time
+import asyncio
+import logging
+
+from autogen_core.models import ChatCompletionClient, SystemMessage, UserMessage
+
+from context_compaction import count_tokens, truncate_to_tokens
+from executors import run_io
+from retrieval_index import chunk_text
+from metrics import record_usage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD_TOKENS = 48000
+DEFAULT_SECTION_TOKENS = 3000
+DEFAULT_SUMMARY_TOKENS = 250
+DEFAULT_CONCURRENCY = 4
+
+SECTION_SUMMARY_PROMPT = """
+You summarize one section of a longer document for a course designer.
+List the main topics and key points of the section as concise bullet points.
+Keep technical terms, definitions, examples and code identifiers. Do not add information that is not in the section.
+"""
+
+CONDENSED_DOCUMENT_HEADER = (
+    "The document is long, so it was split into {count} sections that were summarized separately. "
+    "Merge these section summaries into one course outline, grouping related sections into chapters."
+)
+
+
+def split_sections(text: str, section_tokens: int = DEFAULT_SECTION_TOKENS) -> list[tuple[str, str]]:
+    """
+    Splits a document into (heading, text) sections of up to about `section_tokens` tokens.
+    Consecutive retrieval chunks are packed together, so sections end at headings or line breaks.
+    """
+    sections = []
+    heading, parts, tokens = "", [], 0
+    for chunk in chunk_text(text):
+        chunk_tokens = count_tokens(chunk.text)
+        if parts and tokens + chunk_tokens > section_tokens:
+            sections.append((heading, "\n".join(parts)))
+            parts, tokens = [], 0
+        if not parts:
+            heading = chunk.heading
+        parts.append(chunk.text)
+        tokens += chunk_tokens
+    if parts:
+        sections.append((heading, "\n".join(parts)))
+    return sections
+
+
+async def summarize_section(model_client: ChatCompletionClient, section: str, summary_tokens: int) -> str:
+    result = await model_client.create(
+        [SystemMessage(content=SECTION_SUMMARY_PROMPT.strip()), UserMessage(content=section, source="user")],
+        extra_create_args={"max_tokens": summary_tokens},
+    )
+    record_usage("outline_map_reduce", result.usage)
+    return result.content if isinstance(result.content, str) else ""
+
+
+async def summarize_sections(
+    model_client: ChatCompletionClient,
+    sections: list[str],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    summary_tokens: int = DEFAULT_SUMMARY_TOKENS,
+) -> list[str]:
+    """
+    Map step: summarizes sections concurrently, with at most `concurrency` requests in flight.
+    A section whose request fails is represented by its first `summary_tokens` tokens instead.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def summarize(index: int, section: str) -> str:
+        async with semaphore:
+            try:
+                return await summarize_section(model_client, section, summary_tokens)
+            except Exception as e:
+                logger.warning("Summarizing section %d failed (%s); using its opening instead.", index + 1, e)
+                return truncate_to_tokens(section, summary_tokens)
+
+    return await asyncio.gather(*(summarize(index, section) for index, section in enumerate(sections)))
+
+
+async def condense_document(text: str, model_client: ChatCompletionClient) -> str:
+    """
+    Returns the text to build the course outline from.
+    - Documents up to OUTLINE_MAP_REDUCE_THRESHOLD tokens are returned unchanged (single-shot outlining).
+    - Longer documents are split into sections of about OUTLINE_SECTION_TOKENS tokens that are summarized
+      concurrently (OUTLINE_MAP_CONCURRENCY); the course outline agent merges the summaries (reduce step).
+    The document is tokenized on the I/O executor, as very long pages take a while.
+    """
+    threshold = int(os.getenv("OUTLINE_MAP_REDUCE_THRESHOLD") or DEFAULT_THRESHOLD_TOKENS)
+    tokens = await run_io(count_tokens, text)
+    if tokens <= threshold:
+        return text
+
+    started = time.monotonic()
+    sections = await run_io(split_sections, text, int(os.getenv("OUTLINE_SECTION_TOKENS") or DEFAULT_SECTION_TOKENS))
+    concurrency = int(os.getenv("OUTLINE_MAP_CONCURRENCY") or DEFAULT_CONCURRENCY)
+    summaries = await summarize_sections(
+        model_client,
+        [section for _, section in sections],
+        concurrency=concurrency,
+        summary_tokens=int(os.getenv("OUTLINE_SECTION_SUMMARY_TOKENS") or DEFAULT_SUMMARY_TOKENS),
+    )
+    parts = [CONDENSED_DOCUMENT_HEADER.format(count=len(sections))]
+    for number, ((heading, _), summary) in enumerate(zip(sections, summaries), start=1):
+        parts.append(f"## Section {number}: {heading}".rstrip(": ") + f"\n{summary.strip()}")
+    condensed = "\n\n".join(parts)
+    logger.info(
+        "Condensed a %d-token document into %d section summaries (%d tokens) in %.2f seconds with concurrency %d.",
+        tokens, len(sections), count_tokens(condensed), time.monotonic() - started, concurrency,
+    )
+    return condensed
@@ -0,0 +1,193 @@
+import re
+import json
+import math
+import hashlib
+from collections import Counter
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable
+
+from pydantic import BaseModel, Field
+from autogen_core import CancellationToken
+from autogen_core.tools import BaseTool, ToolSchema
+
+DEFAULT_CHUNK_WORDS = 180
+DEFAULT_TOP_K = 4
+MAX_TOP_K = 8
+
+WORD = re.compile(r"[a-z0-9]+(?:['_][a-z0-9]+)*")
+# Markdown headings, or short capitalized lines without sentence punctuation, optionally numbered ("5.1. Lists").
+HEADING = re.compile(r"^\s*(#{1,6}\s+\S|(\d+(\.\d+)*\.?\s+)?[A-Z][^.!?]{0,80}$)")
+STOP_WORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in into is it its not of on or "
+    "so such that the their then there these they this to was we were what when where which while who "
+    "why will with you your".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [word for word in WORD.findall(text.lower()) if word not in STOP_WORDS]
+
+
+@dataclass
+class Chunk:
+    text: str
+    source: str
+    heading: str
+
+
+def chunk_text(text: str, source: str = "", max_words: int = DEFAULT_CHUNK_WORDS) -> list[Chunk]:
+    """
+    Splits a document into chunks of about `max_words` words along line boundaries.
+    A heading-like line starts a new chunk and is remembered as the heading of the chunks that follow.
+    """
+    chunks = []
+    heading = ""
+    lines = []
+    words = 0
+
+    def flush():
+        nonlocal lines, words
+        if lines:
+            chunks.append(Chunk(text="\n".join(lines), source=source, heading=heading))
+        lines, words = [], 0
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        line_words = len(stripped.split())
+        # Heading-like lines only start a new chunk once the current one has some body, to avoid tiny chunks.
+        if line_words <= 12 and HEADING.match(stripped) and (not words or words >= max_words // 3):
+            flush()
+            heading = stripped.lstrip("#").strip()
+        elif words + line_words > max_words:
+            flush()
+        lines.append(line.rstrip())
+        words += line_words
+    flush()
+    return chunks
+
+
+class BM25Index:
+    """
+    In-process BM25 index over chunks of scraped course material.
+    - Documents are chunked by `chunk_text`; identical documents are indexed once.
+    - Postings map each term to (chunk id, term frequency) pairs.
+    - `to_bytes`/`from_bytes` serialize the whole index, postings included, so it is never rebuilt on load.
+    """
+
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self):
+        self.chunks: list[Chunk] = []
+        self.lengths: list[int] = []
+        self.postings: dict[str, list[tuple[int, int]]] = {}
+        self.document_hashes: set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def add_document(self, text: str, source: str = "") -> int:
+        """Chunks and indexes a document. Returns the number of chunks added."""
+        document_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        if document_hash in self.document_hashes:
+            return 0
+        self.document_hashes.add(document_hash)
+
+        added = 0
+        for chunk in chunk_text(text, source):
+            # Headings are indexed with the chunk so that a chapter title matches its section.
+            terms = tokenize(f"{chunk.heading}\n{chunk.text}")
+            if not terms:
+                continue
+            chunk_id = len(self.chunks)
+            self.chunks.append(chunk)
+            self.lengths.append(len(terms))
+            for term, frequency in Counter(terms).items():
+                self.postings.setdefault(term, []).append((chunk_id, frequency))
+            added += 1
+        return added
+
+    def search(self, query: str, k: int = DEFAULT_TOP_K) -> list[tuple[float, Chunk]]:
+        """Returns up to `k` (score, chunk) pairs ranked by BM25 relevance to the query."""
+        if not self.chunks:
+            return []
+        count = len(self.chunks)
+        average_length = sum(self.lengths) / count
+        scores: dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, frequency in postings:
+                norm = self.K1 * (1 - self.B + self.B * self.lengths[chunk_id] / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (self.K1 + 1) / (frequency + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        # Return the hits in document order so that neighbouring chunks read naturally.
+        return [(score, self.chunks[chunk_id]) for chunk_id, score in sorted(ranked)]
+
+    def to_bytes(self) -> bytes:
+        return json.dumps(
+            {
+                "chunks": [asdict(chunk) for chunk in self.chunks],
+                "lengths": self.lengths,
+                "postings": self.postings,
+                "document_hashes": sorted(self.document_hashes),
+            }
+        ).encode("utf-8")
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BM25Index":
+        payload = json.loads(data)
+        index = cls()
+        index.chunks = [Chunk(**chunk) for chunk in payload["chunks"]]
+        index.lengths = payload["lengths"]
+        index.postings = {term: [tuple(posting) for posting in postings] for term, postings in payload["postings"].items()}
+        index.document_hashes = set(payload["document_hashes"])
+        return index
+
+
+class SearchCourseMaterialArgs(BaseModel):
+    query: str = Field(description="The chapter or subchapter title, or the question to find source material for.")
+    k: int = Field(default=DEFAULT_TOP_K, description="Number of passages to return.")
+
+
+class SearchCourseMaterialTool(BaseTool[SearchCourseMaterialArgs, str]):
+    """
+    Retrieval tool over the course material of one team.
+    `get_index` returns the team's index, loading it on first use; it is None until a page has been scraped.
+    """
+
+    _schema: ToolSchema | None = None
+
+    def __init__(self, get_index: Callable[[], Awaitable[BM25Index | None]]):
+        super().__init__(
+            SearchCourseMaterialArgs,
+            str,
+            "search_course_material",
+            "Retrieves the passages of the scraped course material that are most relevant to a chapter or question.",
+        )
+        self._get_index = get_index
+
+    @property
+    def schema(self) -> ToolSchema:
+        # The schema is the same for every team. It is built once, because AssistantAgent's
+        # isinstance checks against the Tool protocol read it on every agent construction.
+        if SearchCourseMaterialTool._schema is None:
+            SearchCourseMaterialTool._schema = super().schema
+        return SearchCourseMaterialTool._schema
+
+    async def run(self, args: SearchCourseMaterialArgs, cancellation_token: CancellationToken) -> str:
+        index = await self._get_index()
+        if index is None or not len(index):
+            return "No course material has been indexed for this conversation."
+        hits = index.search(args.query, max(1, min(args.k, MAX_TOP_K)))
+        if not hits:
+            return f"No passages of the course material match {args.query!r}."
+        passages = []
+        for _, chunk in hits:
+            title = f"[{chunk.heading}]\n" if chunk.heading else ""
+            passages.append(f"{title}{chunk.text}")
+        return "\n\n---\n\n".join(passages)
@@ -0,0 +1,282 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from executors import run_io
+from web_scraper import WebScraper, ScrapeResult
+from metrics import SCRAPE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = "scrape_cache"
+DEFAULT_TTL = 24 * 60 * 60  # seconds
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+# Default of `ScrapeCache.scrape(cached=...)`: the caller has not read the cache entry.
+NOT_READ = object()
+
+# Query parameters that only track the visitor and never change the page.
+TRACKING_PARAMETERS = {"fbclid", "gclid", "mc_cid", "mc_eid", "ref_src"}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Returns the cache key of a URL: lowercase scheme and host, no default port,
+    no fragment, no tracking parameters, and sorted query parameters.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.startswith("utm_") and key not in TRACKING_PARAMETERS
+    )
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    content_hash: str
+    text: str
+    tier: str
+    etag: str | None
+    last_modified: str | None
+    fetched_at: float
+
+    def is_fresh(self, ttl: float) -> bool:
+        return time.time() - self.fetched_at < ttl
+
+    def validators(self) -> dict:
+        """Conditional request headers for revalidating this entry."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ScrapeCache:
+    """
+    Disk-backed cache of scraped page text, keyed by normalized URL.
+    - Text is stored content-addressed under <root>/blobs/<sha256>.txt, so identical pages share one blob.
+    - A SQLite index holds the hash, ETag/Last-Modified, fetch time and last access time of every URL.
+    - Entries older than `ttl` are revalidated with a conditional request; a 304 refreshes them in place.
+    - When the blobs exceed `max_bytes`, the least recently used entries are evicted.
+    - Empty text is not cached.
+    - Concurrent scrapes of the same URL are coalesced into a single fetch.
+    """
+
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, ttl: float = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.blob_dir = os.path.join(root, "blobs")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(root, "index.db"), check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    url TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    tier TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.coalesced = 0
+        self.evictions = 0
+        # Size of the index, updated by `_evict` after every put, so that `stats` never queries it.
+        self.entries = 0
+        self.stored_bytes = 0
+        self._evict()
+
+    def _blob_path(self, content_hash: str) -> str:
+        return os.path.join(self.blob_dir, f"{content_hash}.txt")
+
+    def get(self, url: str) -> CacheEntry | None:
+        """Returns the cached entry for a URL (fresh or stale), or None."""
+        key = normalize_url(url)
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT content_hash, tier, etag, last_modified, fetched_at FROM entries WHERE url = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute("UPDATE entries SET last_access = ? WHERE url = ?", (time.time(), key))
+        try:
+            with open(self._blob_path(row[0]), "r", encoding="utf-8") as file:
+                text = file.read()
+        except FileNotFoundError:
+            return None
+        return CacheEntry(key, row[0], text, row[1], row[2], row[3], row[4])
+
+    def _write_blob(self, blob_path: str, data: bytes) -> None:
+        temp_path = f"{blob_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, blob_path)
+
+    def put(self, url: str, result: ScrapeResult) -> CacheEntry:
+        key = normalize_url(url)
+        data = result.text.encode("utf-8")
+        content_hash = hashlib.sha256(data).hexdigest()
+        blob_path = self._blob_path(content_hash)
+        if not os.path.exists(blob_path):
+            self._write_blob(blob_path, data)
+
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+                INSERT OR REPLACE INTO entries (url, content_hash, size, tier, etag, last_modified, fetched_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, content_hash, len(data), result.tier, result.etag, result.last_modified, now, now),
+            )
+            # An eviction may have deleted a shared blob since it was found on disk above.
+            if not os.path.exists(blob_path):
+                self._write_blob(blob_path, data)
+        self._evict()
+        return CacheEntry(key, content_hash, result.text, result.tier, result.etag, result.last_modified, now)
+
+    def refresh(self, url: str) -> None:
+        """Marks an entry as freshly fetched after a 304 Not Modified."""
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE entries SET fetched_at = ?, last_access = ? WHERE url = ?", (now, now, normalize_url(url))
+            )
+
+    def _evict(self) -> None:
+        """
+        Evicts least recently used entries until the stored blobs fit in `max_bytes`,
+        and records the resulting number of entries and stored bytes.
+        """
+        with self._lock, self._connection:
+            entries, total = self._connection.execute(
+                "SELECT (SELECT COUNT(*) FROM entries), "
+                "(SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT content_hash, size FROM entries))"
+            ).fetchone()
+            self.entries, self.stored_bytes = entries, total
+            if total <= self.max_bytes:
+                return
+            rows = self._connection.execute("SELECT url, content_hash, size FROM entries ORDER BY last_access").fetchall()
+            for url, content_hash, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self._connection.execute("DELETE FROM entries WHERE url = ?", (url,))
+                self.evictions += 1
+                self.entries -= 1
+                shared = self._connection.execute(
+                    "SELECT 1 FROM entries WHERE content_hash = ? LIMIT 1", (content_hash,)
+                ).fetchone()
+                if shared is None:
+                    total -= size
+                    self.stored_bytes = total
+                    # Removed under the lock, so that a concurrent `put` of the same text rewrites the blob.
+                    try:
+                        os.remove(self._blob_path(content_hash))
+                    except FileNotFoundError:
+                        pass
+
+    async def scrape(
+        self, url: str, scraper: WebScraper | None = None, cached: CacheEntry | None | object = NOT_READ
+    ) -> CacheEntry:
+        """
+        Returns the text of a page from the cache, fetching or revalidating it if needed.
+        - `cached` is what `get` just returned for the URL, if the caller read it already.
+        - The fetch runs in its own task that every concurrent request for the URL awaits, so a request
+          that is cancelled stops waiting without cancelling the fetch for the others.
+        """
+        key = normalize_url(url)
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.create_task(self._scrape(url, scraper or WebScraper(), cached))
+            self._inflight[key] = task
+            task.add_done_callback(lambda task: self._scrape_done(key, task))
+        return await asyncio.shield(task)
+
+    def _scrape_done(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved in case every request waiting on it was cancelled.
+        if not task.cancelled():
+            task.exception()
+
+    async def _scrape(self, url: str, scraper: WebScraper, cached: CacheEntry | None | object) -> CacheEntry:
+        # Index and blob access is blocking, so it runs on the I/O executor.
+        started = time.perf_counter()
+        entry = await run_io(self.get, url) if cached is NOT_READ else cached
+        if entry is not None and entry.is_fresh(self.ttl):
+            self.hits += 1
+            SCRAPE_SECONDS.observe(time.perf_counter() - started, tier="cache")
+            return entry
+
+        validators = entry.validators() if entry is not None else None
+        result = await scraper.scrape(url, validators or None)
+        SCRAPE_SECONDS.observe(result.elapsed, tier=result.tier)
+        if result.tier == "not_modified" and entry is not None:
+            self.revalidations += 1
+            await run_io(self.refresh, url)
+            return entry
+
+        self.misses += 1
+        if not (result.text or "").strip():
+            # An empty page is usually a failed render; it is fetched again next time rather than cached.
+            return CacheEntry(normalize_url(url), "", result.text or "", result.tier, None, None, time.time())
+        return await run_io(self.put, url, result)
+
+    def stats(self) -> dict:
+        # Served from memory: /stats and /metrics call this on the event loop.
+        return {
+            "entries": self.entries,
+            "bytes": self.stored_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+        }
+
+
+_scrape_cache = None
+_scrape_cache_lock = threading.Lock()
+
+
+def get_scrape_cache() -> ScrapeCache:
+    """Returns the process-wide scrape cache configured by SCRAPE_CACHE_DIR, SCRAPE_CACHE_TTL and SCRAPE_CACHE_MAX_BYTES."""
+    global _scrape_cache
+    with _scrape_cache_lock:
+        if _scrape_cache is None:
+            _scrape_cache = ScrapeCache(
+                root=os.getenv("SCRAPE_CACHE_DIR") or DEFAULT_CACHE_DIR,
+                ttl=float(os.getenv("SCRAPE_CACHE_TTL") or DEFAULT_TTL),
+                max_bytes=int(os.getenv("SCRAPE_CACHE_MAX_BYTES") or DEFAULT_MAX_BYTES),
+            )
+        return _scrape_cache
@@ -0,0 +1,238 @@
+import time
+import asyncio
+import logging
+import threading
+from typing import AsyncGenerator, Awaitable, Callable, Sequence
+
+from autogen_core import CancellationToken
+from autogen_core.models import AssistantMessage, FunctionExecutionResultMessage, UserMessage
+from autogen_agentchat.agents import AssistantAgent
+from autogen_agentchat.base import Response
+from autogen_agentchat.messages import (
+    AgentEvent,
+    ChatMessage,
+    HandoffMessage,
+    TextMessage,
+    ToolCallExecutionEvent,
+    ToolCallRequestEvent,
+)
+
+from metrics import record_usage
+from admission import Overloaded, get_admission_controller
+
+logger = logging.getLogger(__name__)
+
+# Token usage of speculative generations is counted under this agent name, served or not.
+SPECULATION_USAGE_AGENT = "quiz_agent_speculation"
+
+_stats_lock = threading.Lock()
+_stats = {
+    "started": 0,
+    "skipped": 0,
+    "served": 0,
+    "missed": 0,
+    "discarded": 0,
+    "failed": 0,
+    "latency_saved_seconds": 0.0,
+}
+# Final outcomes; every speculation ends with exactly one of them
+OUTCOMES = ("served", "missed", "discarded", "failed")
+
+
+def _record(event: str, latency_saved: float = 0.0) -> None:
+    with _stats_lock:
+        _stats[event] += 1
+        _stats["latency_saved_seconds"] += latency_saved
+
+
+def speculation_stats() -> dict:
+    """
+    Outcomes of speculative quizzes, one per speculation:
+    - `served`: the learner asked for the quiz and got the pre-generated one.
+    - `missed`: the quiz agent was activated, but the quiz was generated again: there was none to serve, or the
+      activation was not the one it was generated for (e.g. the explainer answered a follow-up before handing off).
+    - `discarded`: the learner asked something else (or left), so the quiz was thrown away.
+    - `failed`: the learner did not ask for the quiz, and there was none anyway.
+    There is none to serve when the generation failed, or was `skipped` because no run slot was free.
+    `pending` speculations have no outcome yet.
+    """
+    with _stats_lock:
+        finished = sum(_stats[outcome] for outcome in OUTCOMES)
+        return {
+            **_stats,
+            "pending": _stats["started"] - finished,
+            "latency_saved_seconds": round(_stats["latency_saved_seconds"], 3),
+            "hit_rate": round(_stats["served"] / finished, 3) if finished else 0.0,
+            "avg_latency_saved_seconds": round(_stats["latency_saved_seconds"] / _stats["served"], 3)
+            if _stats["served"]
+            else 0.0,
+        }
+
+
+class QuizSpeculation:
+    """
+    A quiz being generated in a background task, ahead of the turn that asks for it.
+    The generation holds a run slot of the admission controller, so that background model calls count
+    against ADMISSION_MAX_RUNNING. It never waits for one: without a free slot, it is skipped.
+    """
+
+    def __init__(self, generate: Callable[[CancellationToken], Awaitable[Response]]):
+        self.started = time.perf_counter()
+        self.generation_seconds = 0.0
+        self._cancellation_token = CancellationToken()
+        # Whether the generation ended without a quiz to serve
+        self._failed = False
+        self._settled = False
+        self._task = asyncio.create_task(self._generate(generate))
+        _record("started")
+
+    async def _generate(self, generate: Callable[[CancellationToken], Awaitable[Response]]) -> Response | None:
+        try:
+            async with get_admission_controller().background():
+                response = await generate(self._cancellation_token)
+        except asyncio.CancelledError:
+            raise
+        except Overloaded:
+            logger.info("Skipped a speculative quiz: no run slot is free.")
+            _record("skipped")
+            self._failed = True
+            return None
+        except Exception as e:
+            logger.exception("Speculative quiz generation failed: %s", e)
+            self._failed = True
+            return None
+        for message in [*response.inner_messages, response.chat_message]:
+            record_usage(SPECULATION_USAGE_AGENT, message.models_usage)
+        if not isinstance(response.chat_message, TextMessage):
+            # The agent handed off instead of writing a quiz; there is nothing to serve.
+            logger.info("Speculative quiz generation ended with a %s.", type(response.chat_message).__name__)
+            self._failed = True
+            return None
+        self.generation_seconds = time.perf_counter() - self.started
+        return response
+
+    def _settle(self, outcome: str, latency_saved: float = 0.0) -> None:
+        if not self._settled:
+            self._settled = True
+            _record(outcome, latency_saved)
+
+    async def take(self, cancellation_token: CancellationToken) -> Response | None:
+        """Waits for the quiz (cancelled with `cancellation_token`); returns None if it could not be generated."""
+        waited = time.perf_counter()
+        cancellation_token.link_future(self._task)
+        response = await self._task
+        waited = time.perf_counter() - waited
+        if response is None:
+            self._settle("missed")
+            return None
+        # The generation time minus the part of it the turn still had to wait for.
+        latency_saved = max(0.0, self.generation_seconds - waited)
+        self._settle("served", latency_saved)
+        logger.info(
+            "Served a speculative quiz generated in %.2f seconds (%.2f seconds saved).", self.generation_seconds, latency_saved
+        )
+        return response
+
+    def discard(self, missed: bool = False) -> None:
+        """Throws the quiz away; `missed` if the quiz agent was activated and generates its own quiz instead."""
+        self._cancellation_token.cancel()
+        self._task.cancel()
+        if missed:
+            self._settle("missed")
+        else:
+            self._settle("failed" if self._failed else "discarded")
+
+
+def _same_message(message: ChatMessage, expected: ChatMessage) -> bool:
+    return (
+        type(message) is type(expected)
+        and message.source == expected.source
+        and message.content == expected.content
+        and getattr(message, "target", None) == getattr(expected, "target", None)
+    )
+
+
+def _strip_usage(message):
+    # The tokens were counted when the quiz was generated.
+    return message.model_copy(update={"models_usage": None})
+
+
+class SpeculativeQuizAgent(AssistantAgent):
+    """
+    Assistant agent that can answer its next activation with a response generated ahead of time.
+    - `speculate` runs a copy of the agent (same prompt, tools and history) in the background on the
+      messages the agent expects to receive, e.g. the chapter just explained and the explainer's handoff.
+    - If the agent is then activated by the expected messages, with only the learner's reply before the
+      handoff, the copy's quiz is served: the model context and the team's message thread end up as if the
+      agent had generated it itself.
+    - Otherwise the speculation is thrown away: by `discard_speculation` when the learner asks a follow-up
+      question instead of asking for the quiz, or on the activation when it is not the expected one, e.g.
+      when the explainer answered a follow-up before handing off.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._speculation: QuizSpeculation | None = None
+        self._expected_messages: list[ChatMessage] = []
+
+    def speculate(self, copy: AssistantAgent, expected_messages: Sequence[ChatMessage]) -> None:
+        """Starts generating the response to `expected_messages`, which must end with the handoff to this agent."""
+        self.discard_speculation()
+        expected_handoff = expected_messages[-1]
+        assert isinstance(expected_handoff, HandoffMessage) and expected_handoff.target == self.name
+
+        async def generate(cancellation_token: CancellationToken) -> Response:
+            await copy.load_state(await self.save_state())
+            return await copy.on_messages(expected_messages, cancellation_token)
+
+        self._speculation = QuizSpeculation(generate)
+        self._expected_messages = list(expected_messages)
+
+    def discard_speculation(self) -> None:
+        if self._speculation is not None:
+            self._speculation.discard()
+            self._speculation = None
+
+    def _is_expected_activation(self, messages: Sequence[ChatMessage]) -> bool:
+        """
+        Whether `messages` are the expected ones with the learner's reply inserted before the handoff,
+        i.e. the explainer handed off right away, without answering anything first.
+        """
+        *buffered, expected_handoff = self._expected_messages
+        if len(messages) != len(buffered) + 2 or messages[-2].source != "user":
+            return False
+        return all(
+            _same_message(message, expected)
+            for message, expected in zip([*messages[:-2], messages[-1]], [*buffered, expected_handoff])
+        )
+
+    async def on_messages_stream(
+        self, messages: Sequence[ChatMessage], cancellation_token: CancellationToken
+    ) -> AsyncGenerator[AgentEvent | ChatMessage | Response, None]:
+        speculation, self._speculation = self._speculation, None
+        response = None
+        if speculation is not None:
+            if self._is_expected_activation(messages):
+                response = await speculation.take(cancellation_token)
+            else:
+                speculation.discard(missed=True)
+        if response is None:
+            async for message in super().on_messages_stream(messages, cancellation_token):
+                yield message
+            return
+
+        # Replays what AssistantAgent adds to its model context and yields for the same messages.
+        for message in messages:
+            await self._model_context.add_message(UserMessage(content=message.content, source=message.source))
+        inner_messages = []
+        for event in response.inner_messages:
+            if isinstance(event, ToolCallRequestEvent):
+                await self._model_context.add_message(AssistantMessage(content=event.content, source=self.name))
+            elif isinstance(event, ToolCallExecutionEvent):
+                await self._model_context.add_message(FunctionExecutionResultMessage(content=event.content))
+            event = _strip_usage(event)
+            inner_messages.append(event)
+            yield event
+        quiz = _strip_usage(response.chat_message)
+        await self._model_context.add_message(AssistantMessage(content=quiz.content, source=self.name))
+        yield Response(chat_message=quiz, inner_messages=inner_messages)
@@ -0,0 +1,111 @@
+import os
+import threading
+
+# Deltas appended since the last snapshot before the next save writes a full snapshot instead.
+DEFAULT_SNAPSHOT_INTERVAL = 20
+
+
+def get_snapshot_interval() -> int:
+    return max(1, int(os.getenv("STATE_SNAPSHOT_INTERVAL") or DEFAULT_SNAPSHOT_INTERVAL))
+
+
+def state_delta(old: dict, new: dict, path: tuple = ()) -> list:
+    """
+    Returns the operations that turn the team state `old` into `new`:
+      - ["append", path, start, items]: items appended to the list at `path`, which had `start` items,
+      - ["set", path, value]: a value that was added or changed in any other way,
+      - ["delete", path]: a key that was removed.
+    Message threads, agent buffers and model contexts only grow between turns, so a delta holds
+    the new messages of a turn rather than the whole conversation.
+    """
+    operations = []
+    for key, value in new.items():
+        key_path = [*path, key]
+        if key not in old:
+            operations.append(["set", key_path, value])
+            continue
+        previous = old[key]
+        if isinstance(value, dict) and isinstance(previous, dict):
+            operations.extend(state_delta(previous, value, tuple(key_path)))
+        elif isinstance(value, list) and isinstance(previous, list) and value[: len(previous)] == previous:
+            if len(value) > len(previous):
+                operations.append(["append", key_path, len(previous), value[len(previous):]])
+        elif value != previous:
+            operations.append(["set", key_path, value])
+    for key in old:
+        if key not in new:
+            operations.append(["delete", [*path, key]])
+    return operations
+
+
+def apply_delta(state: dict, operations: list) -> dict:
+    """Applies the operations of `state_delta` to `state` in place and returns it."""
+    for operation in operations:
+        kind, path = operation[0], operation[1]
+        parent = state
+        for key in path[:-1]:
+            parent = parent[key]
+        if kind == "append":
+            items = parent[path[-1]]
+            start = operation[2]
+            if len(items) != start:
+                raise ValueError(f"Cannot append at {start} to {'/'.join(path)} of length {len(items)}")
+            items.extend(operation[3])
+        elif kind == "set":
+            parent[path[-1]] = operation[2]
+        elif kind == "delete":
+            parent.pop(path[-1], None)
+        else:
+            raise ValueError(f"Unknown state operation: {kind}")
+    return state
+
+
+class StateWriter:
+    """
+    Persists successive states of one conversation.
+    - Usually only the delta since the previous write (a turn's new messages) is appended to the state log.
+    - Every `snapshot_interval` writes, and whenever the store has nothing to append to, a full snapshot is written.
+    - Each write expects the store to hold `version`, the version that `persisted_state` was read or written at,
+      so it raises `conversation_store.VersionConflict` instead of overwriting another worker's turns.
+    """
+
+    def __init__(self, snapshot_interval: int | None = None):
+        self.snapshot_interval = snapshot_interval or get_snapshot_interval()
+        # Last state written to the store, which the next write is diffed against
+        self.persisted_state = None
+        # Deltas logged since the last snapshot
+        self.logged_deltas = 0
+        # Version of the conversation in the store, which every write increments
+        self.version = 0
+
+    def write(self, store, conversation_id: str, conversation_title: str, state: dict, title_changed: bool = True) -> None:
+        logged = None
+        if self.persisted_state is not None and self.logged_deltas + 1 < self.snapshot_interval:
+            operations = state_delta(self.persisted_state, state)
+            if not operations and not title_changed:
+                return
+            logged = store.append_delta(conversation_id, conversation_title, operations, expected_version=self.version)
+        if logged is None:
+            store.save(conversation_id, conversation_title, state, expected_version=self.version)
+            logged = 0
+        self.persisted_state = state
+        self.logged_deltas = logged
+        self.version += 1
+
+
+_stats = {"snapshots": 0, "snapshot_bytes": 0, "deltas": 0, "delta_bytes": 0}
+_stats_lock = threading.Lock()
+
+
+def record_write(kind: str, size: int) -> None:
+    """Counts a snapshot or delta write of `size` bytes."""
+    with _stats_lock:
+        _stats[f"{kind}s"] += 1
+        _stats[f"{kind}_bytes"] += size
+
+
+def persistence_stats() -> dict:
+    with _stats_lock:
+        writes = _stats["snapshots"] + _stats["deltas"]
+        total = _stats["snapshot_bytes"] + _stats["delta_bytes"]
+        return {**_stats, "avg_bytes_per_save": round(total / writes) if writes else 0}
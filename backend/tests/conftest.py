@@ -0,0 +1,31 @@
+import uuid
+
+import pytest
+
+from benchmarks.redis_stand_in import RedisStandIn
+from conversation_store import FileConversationStore, RedisConversationStore, SQLiteConversationStore
+
+
+@pytest.fixture(scope="session")
+def redis_url():
+    with RedisStandIn() as server:
+        yield server.url
+
+
+@pytest.fixture(params=["sqlite", "files", "redis"])
+def store(request, tmp_path):
+    """Every conversation store backend, empty."""
+    if request.param == "sqlite":
+        store = SQLiteConversationStore(str(tmp_path / "conversations.db"))
+    elif request.param == "files":
+        store = FileConversationStore(str(tmp_path / "conversations"))
+    else:
+        # A prefix per test keeps the shared server's keys apart.
+        store = RedisConversationStore(request.getfixturevalue("redis_url"), prefix=uuid.uuid4().hex)
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def conversation_id():
+    return str(uuid.uuid4())
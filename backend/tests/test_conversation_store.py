@@ -0,0 +1,45 @@
+import os
+
+from conversation_store import FileConversationStore
+
+
+def test_listing_shows_the_latest_titles(store, conversation_id):
+    store.save(conversation_id, "First message", {"messages": 1})
+    store.append_delta(conversation_id, "Second message", [], expected_version=1)
+    store.save("other", "Other conversation", {"messages": 1})
+    store.save(conversation_id, "Third message", {"messages": 3}, expected_version=2)
+
+    assert store.list_conversations() == [(conversation_id, "Third message"), ("other", "Other conversation")]
+
+
+def test_file_store_turns_leave_the_index_alone(tmp_path, conversation_id):
+    root = str(tmp_path / "conversations")
+    store = FileConversationStore(root)
+    store.save(conversation_id, "First message", {"messages": 1})
+    index_path = os.path.join(root, FileConversationStore.INDEX_FILENAME)
+    with open(index_path, "rb") as file:
+        index = file.read()
+    modified = os.stat(index_path).st_mtime_ns
+
+    store.append_delta(conversation_id, "Second message", [], expected_version=1)
+    store.save(conversation_id, "Third message", {"messages": 3}, expected_version=2)
+
+    assert os.stat(index_path).st_mtime_ns == modified
+    with open(index_path, "rb") as file:
+        assert file.read() == index
+    # The latest title outlives the process.
+    assert FileConversationStore(root).list_conversations() == [(conversation_id, "Third message")]
+
+
+def test_delete_removes_every_file_of_the_conversation(store, conversation_id):
+    store.save(conversation_id, "First message", {"messages": 1})
+    store.append_delta(conversation_id, "Second message", [], expected_version=1)
+    store.save_artifact(conversation_id, "retrieval_index", b"index")
+
+    assert store.delete(conversation_id)
+
+    assert store.list_conversations() == []
+    assert store.get_versioned_state(conversation_id) is None
+    assert store.get_artifact(conversation_id, "retrieval_index") is None
+    if isinstance(store, FileConversationStore):
+        assert os.listdir(store.root) == [FileConversationStore.INDEX_FILENAME]
@@ -0,0 +1,61 @@
+import asyncio
+
+import httpx
+import pytest
+
+from http_fetcher import HttpFetcher, ResponseTooLarge
+
+
+class Chunks(httpx.AsyncByteStream):
+    """A body without a Content-Length, streamed in chunks; counts the chunks read."""
+
+    def __init__(self, chunk: bytes, count: int):
+        self.chunk = chunk
+        self.count = count
+        self.read = 0
+
+    async def __aiter__(self):
+        for _ in range(self.count):
+            self.read += 1
+            yield self.chunk
+
+
+def fetch(handler, url: str = "http://docs.test/page", max_bytes: int = 1000) -> httpx.Response:
+    async def run():
+        fetcher = HttpFetcher(max_bytes=max_bytes)
+        fetcher._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            return await fetcher.fetch(url)
+        finally:
+            await fetcher.aclose()
+
+    return asyncio.run(run())
+
+
+def test_text_page_is_read():
+    response = fetch(lambda request: httpx.Response(200, html="<p>Hello</p>", headers={"ETag": '"v1"'}))
+
+    assert response.status_code == 200
+    assert response.text == "<p>Hello</p>"
+    assert response.headers["etag"] == '"v1"'
+    assert str(response.url) == "http://docs.test/page"
+
+
+def test_binary_body_is_not_downloaded():
+    body = Chunks(b"\0" * 100, 100)
+    response = fetch(lambda request: httpx.Response(200, headers={"Content-Type": "application/pdf"}, stream=body))
+
+    assert response.content == b""
+    assert body.read == 0
+
+
+def test_page_over_the_limit_by_content_length_is_rejected():
+    with pytest.raises(ResponseTooLarge):
+        fetch(lambda request: httpx.Response(200, html="x" * 2000))
+
+
+def test_streamed_page_over_the_limit_is_rejected_early():
+    body = Chunks(b"x" * 100, 100)
+    with pytest.raises(ResponseTooLarge):
+        fetch(lambda request: httpx.Response(200, headers={"Content-Type": "text/html"}, stream=body))
+    assert body.read == 11
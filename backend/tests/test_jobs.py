@@ -0,0 +1,91 @@
+import time
+import asyncio
+import sqlite3
+
+import pytest
+
+from jobs import Job, JobManager, JobStore
+
+OTHER_WORKER = "other-host:1:worker"
+
+
+@pytest.fixture
+def job_store_path(tmp_path):
+    return str(tmp_path / "jobs.db")
+
+
+def open_store(path: str, worker_id: str) -> JobStore:
+    store = JobStore(path, worker_id=worker_id)
+    store.heartbeat()
+    return store
+
+
+def test_starting_a_worker_leaves_live_siblings_jobs_alone(job_store_path):
+    async def run():
+        first = open_store(job_store_path, "first")
+        manager = JobManager(first)
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return {"ok": True}
+
+        job = await manager.submit("turn", work)
+        await asyncio.sleep(0)
+
+        # A sibling starts on the same table while the job runs.
+        second = open_store(job_store_path, OTHER_WORKER)
+        assert second.recover() == 0
+        assert second.get(job.id).status == "running"
+
+        release.set()
+        await job._task
+        assert second.get(job.id).status == "done"
+        second.close()
+        first.close()
+
+    asyncio.run(run())
+
+
+def test_jobs_of_a_stopped_worker_are_failed_once_its_heartbeat_expires(job_store_path):
+    stopped = open_store(job_store_path, "stopped")
+    live = open_store(job_store_path, OTHER_WORKER)
+    stopped_job = Job(kind="turn", status="running")
+    live_job = Job(kind="turn", status="queued")
+    stopped.save(stopped_job)
+    live.save(live_job)
+
+    time.sleep(0.3)
+    live.heartbeat()
+    assert live.recover(heartbeat_ttl=0.2) == 1
+
+    recovered = live.get(stopped_job.id)
+    assert recovered.status == "failed"
+    assert recovered.version == stopped_job.version + 1
+    assert live.get(live_job.id).status == "queued"
+    stopped.close()
+    live.close()
+
+
+def test_unfinished_jobs_of_tables_without_owners_are_recovered(job_store_path):
+    connection = sqlite3.connect(job_store_path)
+    with connection:
+        connection.execute(
+            """
+            CREATE TABLE jobs (
+                id TEXT PRIMARY KEY, kind TEXT NOT NULL, conversation_id TEXT, idempotency_key TEXT UNIQUE,
+                status TEXT NOT NULL, version INTEGER NOT NULL, created_at REAL NOT NULL, started_at REAL,
+                finished_at REAL, result TEXT, error TEXT
+            )
+            """
+        )
+        connection.execute(
+            "INSERT INTO jobs (id, kind, status, version, created_at) VALUES ('legacy', 'turn', 'running', 1, ?)",
+            (time.time(),),
+        )
+    connection.close()
+
+    store = open_store(job_store_path, OTHER_WORKER)
+    assert store.recover() == 1
+    assert store.get("legacy").status == "failed"
+    store.close()
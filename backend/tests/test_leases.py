@@ -0,0 +1,201 @@
+import time
+import asyncio
+
+import pytest
+
+import conversation_store
+import leases
+from admission import Overloaded
+from conversation_store import RedisConversationStore, VersionConflict
+from leases import WORKER_ID, hold_lease
+from state_log import StateWriter
+
+OTHER_WORKER = "other-host:1:worker"
+
+
+def test_lease_is_exclusive_until_released(store, conversation_id):
+    assert store.acquire_lease(conversation_id, WORKER_ID, 30)
+    # Held leases can be taken again by their owner only.
+    assert store.acquire_lease(conversation_id, WORKER_ID, 30)
+    assert not store.acquire_lease(conversation_id, OTHER_WORKER, 30)
+    assert store.renew_lease(conversation_id, WORKER_ID, 30)
+    assert not store.renew_lease(conversation_id, OTHER_WORKER, 30)
+
+    store.release_lease(conversation_id, OTHER_WORKER)
+    assert not store.acquire_lease(conversation_id, OTHER_WORKER, 30)
+    store.release_lease(conversation_id, WORKER_ID)
+    assert store.acquire_lease(conversation_id, OTHER_WORKER, 30)
+    assert not store.renew_lease(conversation_id, WORKER_ID, 30)
+
+
+def test_expired_lease_can_be_taken_over(store, conversation_id):
+    assert store.acquire_lease(conversation_id, WORKER_ID, 0.1)
+    time.sleep(0.2)
+    assert store.acquire_lease(conversation_id, OTHER_WORKER, 30)
+    assert not store.renew_lease(conversation_id, WORKER_ID, 30)
+    # Releasing a lost lease leaves the new owner's alone.
+    store.release_lease(conversation_id, WORKER_ID)
+    assert not store.acquire_lease(conversation_id, WORKER_ID, 30)
+
+
+def test_delete_drops_the_lease(store, conversation_id):
+    store.save(conversation_id, "Lists", {"messages": []})
+    assert store.acquire_lease(conversation_id, OTHER_WORKER, 30)
+    store.delete(conversation_id)
+    assert store.acquire_lease(conversation_id, WORKER_ID, 30)
+
+
+@pytest.fixture
+def short_leases(monkeypatch):
+    monkeypatch.setenv("LEASE_TTL", "0.3")
+    monkeypatch.setenv("LEASE_WAIT", "0.3")
+    monkeypatch.setattr(leases, "LEASE_POLL_INTERVAL", 0.05)
+
+
+def test_hold_lease_rejects_a_conversation_leased_elsewhere(store, conversation_id, short_leases):
+    assert store.acquire_lease(conversation_id, OTHER_WORKER, 30)
+    rejected = leases.lease_stats()["rejected"]
+
+    async def hold():
+        async with hold_lease(store, conversation_id, on_lost=lambda: None):
+            pass
+
+    with pytest.raises(Overloaded) as overloaded:
+        asyncio.run(hold())
+    assert overloaded.value.status_code == 429
+    assert leases.lease_stats()["rejected"] == rejected + 1
+
+
+def test_hold_lease_waits_for_a_released_lease(store, conversation_id, short_leases):
+    assert store.acquire_lease(conversation_id, OTHER_WORKER, 30)
+    waited = leases.lease_stats()["waited"]
+
+    async def hold():
+        asyncio.get_running_loop().call_later(0.1, store.release_lease, conversation_id, OTHER_WORKER)
+        async with hold_lease(store, conversation_id, on_lost=lambda: None):
+            assert not store.acquire_lease(conversation_id, OTHER_WORKER, 30)
+
+    asyncio.run(hold())
+    assert leases.lease_stats()["waited"] == waited + 1
+    # Released on exit
+    assert store.acquire_lease(conversation_id, OTHER_WORKER, 30)
+
+
+def test_hold_lease_renews_while_held(store, conversation_id, short_leases):
+    lost = []
+
+    async def hold():
+        async with hold_lease(store, conversation_id, on_lost=lambda: lost.append(True)):
+            # Three times the TTL
+            for _ in range(9):
+                await asyncio.sleep(0.1)
+                assert not store.acquire_lease(conversation_id, OTHER_WORKER, 30)
+
+    asyncio.run(hold())
+    assert not lost
+
+
+def test_hold_lease_reports_a_lost_lease(store, conversation_id, short_leases):
+    async def hold():
+        on_lost = asyncio.Event()
+        async with hold_lease(store, conversation_id, on_lost=on_lost.set):
+            # Another worker takes the lease over, e.g. after this one stalled past the TTL.
+            store.release_lease(conversation_id, WORKER_ID)
+            assert store.acquire_lease(conversation_id, OTHER_WORKER, 30)
+            await asyncio.wait_for(on_lost.wait(), 1)
+        # The other worker's lease is left alone.
+        assert not store.acquire_lease(conversation_id, WORKER_ID, 30)
+
+    asyncio.run(hold())
+
+
+def test_hold_lease_releases_on_error(store, conversation_id, short_leases):
+    async def hold():
+        async with hold_lease(store, conversation_id, on_lost=lambda: None):
+            raise RuntimeError("turn failed")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(hold())
+    assert store.acquire_lease(conversation_id, OTHER_WORKER, 30)
+
+
+@pytest.mark.parametrize("write", ["save", "append_delta"])
+def test_redis_write_raced_between_watch_and_exec(redis_url, conversation_id, monkeypatch, write):
+    store = RedisConversationStore(redis_url, prefix="race")
+    other = RedisConversationStore(redis_url, prefix="race")
+    store.save(conversation_id, "Lists", {"messages": [1]})
+    check_version = conversation_store._check_version
+    raced = []
+
+    def racing_check(conversation_id, expected_version, version):
+        # Another worker writes after this one read the version under WATCH, before its MULTI/EXEC.
+        if not raced:
+            raced.append(version)
+            other.append_delta(conversation_id, "Lists", [["append", ["messages"], 1, [2]]], expected_version=version)
+        check_version(conversation_id, expected_version, version)
+
+    monkeypatch.setattr(conversation_store, "_check_version", racing_check)
+    with pytest.raises(VersionConflict) as conflict:
+        if write == "save":
+            store.save(conversation_id, "Lists", {"messages": [1, 3]}, expected_version=1)
+        else:
+            store.append_delta(conversation_id, "Lists", [["append", ["messages"], 1, [3]]], expected_version=1)
+    # The transaction was retried, saw the other write and refused to overwrite it.
+    assert (raced, conflict.value.version) == ([1], 2)
+    assert store.get_versioned_state(conversation_id) == ({"messages": [1, 2]}, 2)
+    store.close()
+    other.close()
+
+
+@pytest.fixture
+def teacher_class(tmp_path, monkeypatch):
+    # ai_teacher loads .env and scrapes through the cache; keep both inside the test's directory.
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("SCRAPE_CACHE_DIR", str(tmp_path / "scrape_cache"))
+    import ai_teacher
+    from model_client import set_model_client
+    from benchmarks.scripted_model_client import ScriptedModelClient
+
+    asyncio.run(set_model_client(ScriptedModelClient(base_ms=0, ms_per_token=0)))
+    yield ai_teacher.AITeacher
+    asyncio.run(set_model_client(None))
+
+
+def test_persist_on_eviction_holds_the_lease(store, teacher_class, short_leases):
+    async def run():
+        teacher = teacher_class(store)
+        await teacher.start_conversation("Hi")
+        conversation_id = teacher.get_team_id()
+        saved = store.get_versioned_state(conversation_id)
+        # Unsaved changes, e.g. a turn that failed before it was saved
+        teacher.state_writer.persisted_state = None
+
+        assert store.acquire_lease(conversation_id, OTHER_WORKER, 30)
+        with pytest.raises(Overloaded):
+            await teacher.persist()
+        assert store.get_versioned_state(conversation_id) == saved
+
+        store.release_lease(conversation_id, OTHER_WORKER)
+        await teacher.persist()
+        assert store.get_version(conversation_id) == saved[1] + 1
+        # The lease is released afterwards.
+        assert store.acquire_lease(conversation_id, OTHER_WORKER, 30)
+
+    asyncio.run(run())
+
+
+def test_persist_drops_a_team_updated_by_another_worker(store, teacher_class, short_leases):
+    async def run():
+        teacher = teacher_class(store)
+        await teacher.start_conversation("Hi")
+        conversation_id = teacher.get_team_id()
+
+        other = await teacher_class.restore(conversation_id, store)
+        await other.send_message("Teach me about Python lists")
+        newer = store.get_versioned_state(conversation_id)
+
+        teacher.state_writer.persisted_state = None
+        await teacher.persist()
+        assert store.get_versioned_state(conversation_id) == newer
+
+    asyncio.run(run())
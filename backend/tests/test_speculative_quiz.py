@@ -0,0 +1,88 @@
+import asyncio
+
+from autogen_core import CancellationToken
+from autogen_agentchat.agents import AssistantAgent
+from autogen_agentchat.messages import HandoffMessage, TextMessage
+
+from agent_templates import QUIZ_AGENT, TOPIC_EXPLAINER_AGENT
+from benchmarks.scripted_model_client import ScriptedModelClient
+from retrieval_index import SearchCourseMaterialTool
+from speculative_quiz import SpeculativeQuizAgent, speculation_stats
+
+EXPLANATION = TextMessage(source=TOPIC_EXPLAINER_AGENT.name, content="Explanation of chapter 1.")
+HANDOFF = HandoffMessage(
+    source=TOPIC_EXPLAINER_AGENT.name,
+    target=QUIZ_AGENT.name,
+    content=next(handoff.message for handoff in TOPIC_EXPLAINER_AGENT.handoffs if handoff.target == QUIZ_AGENT.name),
+)
+
+
+async def no_index():
+    return None
+
+
+def build_quiz_agent(client: ScriptedModelClient, agent_class=SpeculativeQuizAgent):
+    return QUIZ_AGENT.build(client, tools=[SearchCourseMaterialTool(no_index)], agent_class=agent_class)
+
+
+async def speculate(client: ScriptedModelClient) -> SpeculativeQuizAgent:
+    """A quiz agent with the quiz of EXPLANATION generated and ready to serve."""
+    agent = build_quiz_agent(client)
+    agent.speculate(build_quiz_agent(client, agent_class=AssistantAgent), [EXPLANATION, HANDOFF])
+    await asyncio.wait([agent._speculation._task])
+    return agent
+
+
+def learner(content: str) -> HandoffMessage:
+    return HandoffMessage(source="user", target=TOPIC_EXPLAINER_AGENT.name, content=content)
+
+
+def test_quiz_is_served_when_the_explainer_hands_off_right_away():
+    async def run():
+        client = ScriptedModelClient(base_ms=0, ms_per_token=0)
+        agent = await speculate(client)
+        calls = dict(client.calls)
+        before = speculation_stats()
+
+        response = await agent.on_messages([EXPLANATION, learner("Got it."), HANDOFF], CancellationToken())
+
+        assert response.chat_message.content.startswith("Quiz: ")
+        # The quiz was served without calling the model.
+        assert client.calls == calls
+        assert speculation_stats()["served"] == before["served"] + 1
+
+    asyncio.run(run())
+
+
+def test_quiz_is_missed_when_the_explainer_answers_before_handing_off():
+    async def run():
+        client = ScriptedModelClient(base_ms=0, ms_per_token=0)
+        agent = await speculate(client)
+        calls = client.calls[QUIZ_AGENT.name]
+        before = speculation_stats()
+
+        answer = TextMessage(source=TOPIC_EXPLAINER_AGENT.name, content="Chapter 1 is about this. Now a quiz.")
+        response = await agent.on_messages([EXPLANATION, learner("Why is that?"), answer, HANDOFF], CancellationToken())
+
+        assert response.chat_message.content.startswith("Quiz: ")
+        # The quiz was generated again for the messages the agent actually received.
+        assert client.calls[QUIZ_AGENT.name] > calls
+        stats = speculation_stats()
+        assert stats["missed"] == before["missed"] + 1
+        assert stats["served"] == before["served"]
+
+    asyncio.run(run())
+
+
+def test_quiz_is_missed_when_the_activation_differs():
+    async def run():
+        client = ScriptedModelClient(base_ms=0, ms_per_token=0)
+        agent = await speculate(client)
+        before = speculation_stats()
+
+        # The quiz agent is reached without the learner's reply, e.g. by a handoff from another agent.
+        await agent.on_messages([EXPLANATION, HANDOFF], CancellationToken())
+
+        assert speculation_stats()["missed"] == before["missed"] + 1
+
+    asyncio.run(run())
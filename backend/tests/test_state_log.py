@@ -0,0 +1,148 @@
+import copy
+import json
+
+import pytest
+
+from conversation_store import FileConversationStore, VersionConflict
+from state_log import StateWriter, apply_delta, state_delta
+
+
+def make_state(messages: int) -> dict:
+    return {
+        "type": "TeamState",
+        "agent_states": {
+            "quiz_agent/team": {"message_buffer": [{"content": f"m{i}"} for i in range(messages)], "active": True},
+            "topic_explainer/team": {"llm_context": {"messages": [f"c{i}" for i in range(messages)]}},
+        },
+        "current_speaker": "topic_explainer",
+    }
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        (make_state(2), make_state(5)),
+        (make_state(0), make_state(3)),
+        ({"a": 1, "b": {"c": [1, 2]}}, {"a": 2, "b": {"c": [1, 2, 3], "d": None}}),
+        ({"a": [1, 2, 3]}, {"a": [3, 2]}),
+        ({"a": 1, "b": 2}, {"a": 1}),
+        ({"a": {"b": 1}}, {"a": [1]}),
+    ],
+)
+def test_delta_round_trip(old, new):
+    operations = state_delta(old, new)
+    # Operations travel as JSON.
+    operations = json.loads(json.dumps(operations))
+    assert apply_delta(copy.deepcopy(old), operations) == new
+
+
+def test_delta_of_growing_lists_holds_only_new_items():
+    operations = state_delta(make_state(2), make_state(3))
+    assert operations == [
+        ["append", ["agent_states", "quiz_agent/team", "message_buffer"], 2, [{"content": "m2"}]],
+        ["append", ["agent_states", "topic_explainer/team", "llm_context", "messages"], 2, ["c2"]],
+    ]
+    assert state_delta(make_state(3), make_state(3)) == []
+
+
+def test_apply_delta_rejects_append_at_wrong_length():
+    operations = state_delta(make_state(2), make_state(3))
+    with pytest.raises(ValueError):
+        apply_delta(make_state(1), operations)
+
+
+def test_writer_logs_deltas_and_rotates_snapshots(store, conversation_id):
+    writer = StateWriter(snapshot_interval=3)
+    for messages in range(1, 8):
+        writer.write(store, conversation_id, "Lists", make_state(messages))
+        assert store.get_state(conversation_id) == make_state(messages)
+        assert store.get_version(conversation_id) == messages == writer.version
+    # Snapshots at writes 1, 4 and 7, with deltas in between
+    assert writer.logged_deltas == 0
+
+    # A reader that starts from the store continues the same log.
+    state, version = store.get_versioned_state(conversation_id)
+    resumed = StateWriter(snapshot_interval=3)
+    resumed.persisted_state, resumed.version = state, version
+    resumed.write(store, conversation_id, "Lists", make_state(8))
+    assert resumed.logged_deltas == 1
+    assert store.get_versioned_state(conversation_id) == (make_state(8), 8)
+
+
+def test_unchanged_state_is_not_written(store, conversation_id):
+    writer = StateWriter()
+    writer.write(store, conversation_id, "Lists", make_state(1))
+    writer.write(store, conversation_id, "Lists", make_state(1), title_changed=False)
+    assert store.get_version(conversation_id) == 1
+
+
+def test_expected_version_conflicts(store, conversation_id):
+    store.save(conversation_id, "Lists", make_state(1), expected_version=0)
+    with pytest.raises(VersionConflict) as conflict:
+        store.save(conversation_id, "Lists", make_state(2), expected_version=0)
+    assert (conflict.value.expected_version, conflict.value.version) == (0, 1)
+    with pytest.raises(VersionConflict):
+        store.append_delta(conversation_id, "Lists", state_delta(make_state(1), make_state(2)), expected_version=2)
+    assert store.get_versioned_state(conversation_id) == (make_state(1), 1)
+
+    store.append_delta(conversation_id, "Lists", state_delta(make_state(1), make_state(2)), expected_version=1)
+    assert store.get_versioned_state(conversation_id) == (make_state(2), 2)
+    # Writes without an expected version are not checked.
+    store.save(conversation_id, "Lists", make_state(3))
+    assert store.get_versioned_state(conversation_id) == (make_state(3), 3)
+
+
+def test_stale_writer_does_not_overwrite_newer_turns(store, conversation_id):
+    first, second = StateWriter(), StateWriter()
+    first.write(store, conversation_id, "Lists", make_state(1))
+    second.persisted_state, second.version = store.get_versioned_state(conversation_id)
+    second.write(store, conversation_id, "Lists", make_state(2))
+    with pytest.raises(VersionConflict):
+        first.write(store, conversation_id, "Lists", make_state(3))
+    assert store.get_versioned_state(conversation_id) == (make_state(2), 2)
+
+
+def test_delta_without_snapshot_is_not_logged(store, conversation_id):
+    assert store.append_delta(conversation_id, "Lists", [["set", ["a"], 1]]) is None
+    assert store.get_state(conversation_id) is None
+
+
+def test_torn_final_line_is_skipped_and_terminated(tmp_path, conversation_id):
+    store = FileConversationStore(str(tmp_path))
+    writer = StateWriter()
+    writer.write(store, conversation_id, "Lists", make_state(1))
+    writer.write(store, conversation_id, "Lists", make_state(2))
+    # A crash in the middle of appending the next delta
+    torn = json.dumps(state_delta(make_state(2), make_state(3)))[:25]
+    with open(store._log_path(conversation_id), "a") as file:
+        file.write(torn)
+
+    # A fresh store, as after a restart
+    store = FileConversationStore(str(tmp_path))
+    assert store.get_versioned_state(conversation_id) == (make_state(2), 2)
+
+    store.append_delta(conversation_id, "Lists", state_delta(make_state(2), make_state(3)), expected_version=2)
+    with open(store._log_path(conversation_id)) as file:
+        assert file.read().splitlines()[-2] == torn
+    assert store.get_versioned_state(conversation_id) == (make_state(3), 3)
+
+
+def test_log_of_another_snapshot_is_ignored(tmp_path, conversation_id):
+    store = FileConversationStore(str(tmp_path))
+    writer = StateWriter()
+    writer.write(store, conversation_id, "Lists", make_state(1))
+    writer.write(store, conversation_id, "Lists", make_state(2))
+    with open(store._log_path(conversation_id)) as file:
+        old_log = file.read()
+
+    store.save(conversation_id, "Lists", make_state(5))
+    # A crash while a snapshot was written leaves the previous snapshot's log behind.
+    with open(store._log_path(conversation_id), "w") as file:
+        file.write(old_log)
+
+    store = FileConversationStore(str(tmp_path))
+    assert store.get_versioned_state(conversation_id) == (make_state(5), 3)
+    writer = StateWriter()
+    writer.persisted_state, writer.version = store.get_versioned_state(conversation_id)
+    writer.write(store, conversation_id, "Lists", make_state(6))
+    assert store.get_versioned_state(conversation_id) == (make_state(6), 4)
@@ -1,33 +1,156 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
+from browser_pool import BrowserPool, get_browser_pool
+from executors import get_browser_executor, run_io
+from http_fetcher import HttpFetcher, get_http_fetcher
+from html_to_markdown import html_to_markdown, looks_js_gated
+from dataclasses import dataclass
+import os
 import time
+import logging
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WAIT = 10.0  # seconds
+DEFAULT_QUIET_PERIOD_MS = 500
+POLL_INTERVAL = 0.1  # seconds
+
+# Records the time of the last DOM mutation and the number of network resources loaded so far.
+INSTALL_ACTIVITY_MONITOR_SCRIPT = """
+window.__scraperLastActivity = performance.now();
+window.__scraperResources = performance.getEntriesByType('resource').length;
+if (!window.__scraperObserver) {
+    window.__scraperObserver = new MutationObserver(function () {
+        window.__scraperLastActivity = performance.now();
+    });
+    window.__scraperObserver.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+}
+"""
+
+# Returns how long the page has been quiet in milliseconds, treating new network resources as activity.
+QUIET_TIME_SCRIPT = """
+var resources = performance.getEntriesByType('resource').length;
+if (resources !== window.__scraperResources) {
+    window.__scraperResources = resources;
+    window.__scraperLastActivity = performance.now();
+}
+return performance.now() - window.__scraperLastActivity;
+"""
+
+
+def wait_for_page_settled(driver, max_wait: float, quiet_period_ms: int) -> float:
+    """
+    Waits until the page has loaded and stopped changing, and returns how long that took in seconds.
+    - First waits for document.readyState to become 'complete'.
+    - Then waits until there have been no DOM mutations and no new network resources for `quiet_period_ms`.
+    - Never waits longer than `max_wait` seconds in total; a page that never settles is scraped as-is.
+    """
+    started = time.monotonic()
+    try:
+        WebDriverWait(driver, max_wait, poll_frequency=POLL_INTERVAL).until(
+            lambda d: d.execute_script("return document.readyState") == "complete"
+        )
+        driver.execute_script(INSTALL_ACTIVITY_MONITOR_SCRIPT)
+        remaining = max_wait - (time.monotonic() - started)
+        if remaining > 0:
+            WebDriverWait(driver, remaining, poll_frequency=POLL_INTERVAL).until(
+                lambda d: d.execute_script(QUIET_TIME_SCRIPT) >= quiet_period_ms
+            )
+    except TimeoutException:
+        logger.info("Page did not settle within %.1f seconds; scraping current content.", max_wait)
+    return time.monotonic() - started
+
+
+@dataclass
+class ScrapeResult:
+    """
+    Text scraped from a page and which tier served it ('http' or 'browser').
+    A conditional request answered with 304 yields tier 'not_modified' and no text.
+    """
+    url: str
+    text: str | None
+    tier: str
+    elapsed: float
+    settle_time: float | None = None
+    etag: str | None = None
+    last_modified: str | None = None
+
 
 class WebScraper:
-    def __init__(self):
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")  # Run in headless mode
-        self.driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
+    def __init__(self, pool: BrowserPool | None = None, http_fetcher: HttpFetcher | None = None):
+        # Browsers are borrowed from a shared pool of warm headless Chrome instances.
+        self.pool = pool or get_browser_pool()
+        self.http_fetcher = http_fetcher or get_http_fetcher()
+        self.max_wait = float(os.getenv("SCRAPER_MAX_WAIT") or DEFAULT_MAX_WAIT)
+        self.quiet_period_ms = int(os.getenv("SCRAPER_QUIET_PERIOD_MS") or DEFAULT_QUIET_PERIOD_MS)
+        # Seconds the last scraped page took to settle
+        self.last_settle_time = None
 
-    def scrape_text(self, url):
-        self.driver.get(url)
-        time.sleep(5)  # Wait for the page to load
-        
-        # Get all text content
-        body = self.driver.find_element(By.TAG_NAME, 'body')
-        text = body.text
-        
-        # Get all links and convert to markdown format
-        links = self.driver.find_elements(By.TAG_NAME, 'a')
-        for link in links:
-            href = link.get_attribute('href')
-            link_text = link.text
-            if href and link_text:
-                text = text.replace(link_text, f'[{link_text}]({href})')
-        
+    async def scrape(self, url: str, validators: dict | None = None) -> ScrapeResult:
+        """
+        Scrapes a page with the cheapest tier that yields usable text.
+        - Tier 'http': a plain GET parsed in-process; serves server-rendered pages.
+        - Tier 'browser': the Selenium path, used when the static text is empty or looks JS-gated.
+        `validators` are conditional request headers (If-None-Match / If-Modified-Since) for revalidation.
+        """
+        started = time.monotonic()
+        response = await self.fetch_static(url, validators)
+        if response is not None and response.status_code == 304:
+            return ScrapeResult(url=url, text=None, tier="not_modified", elapsed=time.monotonic() - started)
+
+        text = await run_io(self.extract_static_text, url, response) if response is not None else None
+        if text is not None:
+            return ScrapeResult(
+                url=url,
+                text=text,
+                tier="http",
+                elapsed=time.monotonic() - started,
+                etag=response.headers.get("etag"),
+                last_modified=response.headers.get("last-modified"),
+            )
+
+        text = await get_browser_executor().run(self.scrape_text, url)
+        return ScrapeResult(
+            url=url, text=text, tier="browser", elapsed=time.monotonic() - started, settle_time=self.last_settle_time
+        )
+
+    async def fetch_static(self, url: str, validators: dict | None = None) -> httpx.Response | None:
+        """Fetches a page without a browser. Returns None on network errors and pages over the size limit."""
+        try:
+            return await self.http_fetcher.fetch(url, headers=validators)
+        except (httpx.HTTPError, httpx.InvalidURL) as e:
+            logger.info("HTTP fetch of %s failed (%s); falling back to the browser.", url, e)
+            return None
+
+    def extract_static_text(self, url: str, response: httpx.Response) -> str | None:
+        """Returns the text of a statically fetched page, or None if the page needs a browser."""
+        if response.status_code != 200 or not self.http_fetcher.is_text_response(response):
+            return None
+
+        html = response.text
+        if response.headers.get("content-type", "").startswith("text/plain"):
+            return html if html.strip() else None
+
+        text = html_to_markdown(html, str(response.url))
+        if looks_js_gated(html, text):
+            logger.info("Page %s looks JS-gated; falling back to the browser.", url)
+            return None
         return text
 
+    def scrape_text(self, url):
+        with self.pool.browser() as driver:
+            driver.get(url)
+            self.last_settle_time = wait_for_page_settled(driver, self.max_wait, self.quiet_period_ms)
+            logger.info("Page %s settled in %.2f seconds.", url, self.last_settle_time)
+
+            html = driver.page_source
+            base_url = driver.current_url
+
+        # Convert the rendered DOM to text with links inlined as markdown, in a single pass.
+        return html_to_markdown(html, base_url)
+
     def close(self):
-        self.driver.quit()
\ No newline at end of file
+        # Browsers belong to the pool and are quit on application shutdown.
+        pass
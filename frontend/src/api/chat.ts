@@ -5,78 +5,119 @@ interface StartConversationResponse {
   conversation: [string, string][];
 }
 
-async function makeRequest(url: string, body: any, retries = 5): Promise<Message[]> {
-  for (let attempt = 0; attempt < retries; attempt++) {
+interface JobResponse {
+  job_id: string;
+  status: 'queued' | 'running' | 'done' | 'failed' | 'cancelled';
+  version: number;
+  result: StartConversationResponse | null;
+  error: string | null;
+}
+
+// Seconds the server may hold a job status request open
+const JOB_POLL_WAIT = 25;
+
+function toMessages(conversation: [string, string][]): Message[] {
+  if (conversation.length === 0) {
+    return [{
+      source: 'course_outline_agent',
+      content: "I apologize, but I'm having trouble processing your request at the moment. Please try again or rephrase your question.",
+      timestamp: new Date().toISOString(),
+    }];
+  }
+  return conversation.map(([source, content]) => ({
+    source: source as AgentSource,
+    content,
+    timestamp: new Date().toISOString(),
+  }));
+}
+
+async function fetchJson(url: string, init?: RequestInit): Promise<any> {
+  let response: Response;
+  try {
+    response = await fetch(url, init);
+  } catch (error) {
+    throw connectionError(error);
+  }
+  return readJson(response);
+}
+
+function connectionError(error: unknown): unknown {
+  if (error instanceof TypeError && error.message.includes('Failed to fetch')) {
+    return new Error('Unable to connect to chat server. Please ensure the backend is running.');
+  }
+  return error;
+}
+
+function delay(ms: number): Promise<void> {
+  return new Promise((resolve) => setTimeout(resolve, ms));
+}
+
+async function readJson(response: Response): Promise<any> {
+  if (!response.ok) {
+    const retryAfter = response.headers.get('Retry-After');
+    const data = await response.json().catch(() => null);
+    const detail = data?.detail ?? `Server responded with status: ${response.status}`;
+    throw new Error(retryAfter ? `${detail} (retry in ${retryAfter} s)` : detail);
+  }
+  return response.json();
+}
+
+// Attempts at submitting a job before giving up, and the delay between them
+const SUBMIT_ATTEMPTS = 5;
+const SUBMIT_RETRY_DELAY_MS = 1000;
+
+/**
+ * Submits a job, retrying when the request does not reach the server or the server is at capacity.
+ * Every attempt sends the same idempotency key, so a submission that did reach the server returns
+ * the job it started instead of running the turn twice.
+ */
+async function submitJob(url: string, body: any): Promise<JobResponse> {
+  const init: RequestInit = {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      'Idempotency-Key': crypto.randomUUID(),
+    },
+    body: JSON.stringify(body),
+  };
+  for (let attempt = 1; ; attempt++) {
+    let response: Response;
     try {
-      const response = await fetch(url, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(body),
-      });
-      
-      if (!response.ok) {
-        throw new Error(`Server responded with status: ${response.status}`);
-      }
-      
-      const data: ConversationResponse = await response.json();
-      
-      if (data.conversation.length === 0 && attempt < retries - 1) {
-        await new Promise(resolve => setTimeout(resolve, 1000));
-        continue;
-      }
-      
-      if (data.conversation.length === 0 && attempt === retries - 1) {
-        return [{
-          source: 'course_outline_agent',
-          content: "I apologize, but I'm having trouble processing your request at the moment. Please try again or rephrase your question.",
-          timestamp: new Date().toISOString(),
-        }];
-      }
-      
-      return data.conversation.map(([source, content]) => ({
-        source: source as AgentSource,
-        content,
-        timestamp: new Date().toISOString(),
-      }));
+      response = await fetch(url, init);
     } catch (error) {
-      if (attempt === retries - 1) {
-        if (error instanceof TypeError && error.message.includes('Failed to fetch')) {
-          throw new Error('Unable to connect to chat server. Please ensure the backend is running.');
-        }
-        throw error;
+      if (attempt === SUBMIT_ATTEMPTS) {
+        throw connectionError(error);
       }
-      await new Promise(resolve => setTimeout(resolve, 1000));
+      await delay(SUBMIT_RETRY_DELAY_MS);
+      continue;
+    }
+    if (response.status !== 503 || attempt === SUBMIT_ATTEMPTS) {
+      return readJson(response);
     }
+    await delay(Number(response.headers.get('Retry-After')) * 1000 || SUBMIT_RETRY_DELAY_MS);
   }
-  throw new Error('Failed to get a response after multiple attempts');
 }
 
-export async function startConversation(message: string): Promise<{ messages: Message[], conversationId: string }> {
-  try {
-    const response = await fetch(`${API_BASE_URL}/start_conversation`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({ message }),
-    });
+/**
+ * Submits a background job and long-polls its status until it finishes.
+ */
+async function runJob(url: string, body: any): Promise<StartConversationResponse> {
+  let job = await submitJob(url, body);
 
-    if (!response.ok) {
-      throw new Error(`Server responded with status: ${response.status}`);
-    }
-
-    const data: StartConversationResponse = await response.json();
-    
-    const messages = data.conversation.map(([source, content]) => ({
-      source: source as AgentSource,
-      content,
-      timestamp: new Date().toISOString(),
-    }));
+  while (job.status === 'queued' || job.status === 'running') {
+    job = await fetchJson(`${API_BASE_URL}/jobs/${job.job_id}?wait=${JOB_POLL_WAIT}&version=${job.version}`);
+  }
+  if (job.status !== 'done' || job.result === null) {
+    throw new Error(job.error ?? `Request ${job.status}`);
+  }
+  return job.result;
+}
 
+export async function startConversation(message: string): Promise<{ messages: Message[], conversationId: string }> {
+  try {
+    const data = await runJob(`${API_BASE_URL}/jobs/start_conversation`, { message });
     return {
-      messages,
+      messages: toMessages(data.conversation),
       conversationId: data.conversation_id,
     };
   } catch (error) {
@@ -86,7 +127,8 @@ export async function startConversation(message: string): Promise<{ messages: Me
 }
 
 export async function sendMessage(message: string, conversationId: string): Promise<Message[]> {
-  return makeRequest(`${API_BASE_URL}/send_message`, { message, conversation_id: conversationId });
+  const data = await runJob(`${API_BASE_URL}/jobs/send_message`, { message, conversation_id: conversationId });
+  return toMessages(data.conversation);
 }
 
 export async function fetchConversations(): Promise<Conversation[]> {